@@ -0,0 +1,50 @@
+"""Compares `load_inputs` against building inputs one dict at a time.
+
+Run with `python benchmarks/bench_loaders.py`.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from json_generator import InputModel, load_inputs, placeholder
+
+ROWS = 200_000
+
+
+class LegalQuery(InputModel):
+    input_prompt: str = "{{LEGAL_QUERY}} ({{DOMAIN}})"
+    query: str = placeholder("{{LEGAL_QUERY}}")
+    domain: str = placeholder("{{DOMAIN}}")
+
+
+def naive_load(path: str) -> list[LegalQuery]:
+    with open(path, encoding="utf-8") as f:
+        return [LegalQuery(**json.loads(line)) for line in f]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "queries.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for i in range(ROWS):
+                row = {
+                    "query": f"Câu hỏi số {i} về luật giao thông?",
+                    "domain": "Pháp luật",
+                }
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+        print(f"{ROWS} rows")
+        for name, load in [
+            ("dict per row", naive_load),
+            ("load_inputs", lambda path: list(load_inputs(path, LegalQuery))),
+        ]:
+            start = time.perf_counter()
+            assert len(load(path)) == ROWS
+            seconds = time.perf_counter() - start
+            print(f"{name:>14}: {seconds:6.2f}s, {ROWS / seconds:10,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Times `repair_json` and `escape_json_string` on multi-KB LLM responses.
+
+Run with `python benchmarks/bench_repair.py`.
+"""
+
+import json
+import timeit
+
+from json_generator.utils import escape_json_string, repair_json
+
+CONTENT = (
+    'Điều 3. Giải thích từ ngữ. Trong Thông tư này, "hệ thống thông tin" là tập hợp '
+    "các thiết bị phần cứng, phần mềm và đường truyền dùng để thu nhận dữ liệu.\n"
+) * 12
+
+RESPONSE = (
+    "Here are the passages you asked for:\n```json\n"
+    + json.dumps(
+        {
+            "positive": {"domain": "Giao thông", "source": "TT 09", "content": CONTENT},
+            "hard_negative": {"domain": "CNTT", "source": "NĐ 64", "content": CONTENT},
+        },
+        ensure_ascii=False,
+        indent=2,
+    )
+    # Unescape the quotes and newlines like a sloppy model would
+    .replace('\\"', '"').replace("\\n", "\n")[:-2]
+    + ",\n}\n```"
+)
+
+
+def main():
+    assert json.loads(repair_json(RESPONSE))["positive"]["content"] == CONTENT
+    print(f"response size: {len(RESPONSE)} chars")
+
+    for name, stmt in [
+        ("repair_json", lambda: repair_json(RESPONSE)),
+        ("escape_json_string", lambda: escape_json_string(RESPONSE)),
+    ]:
+        best = min(timeit.repeat(stmt, number=200, repeat=5)) / 200
+        print(f"{name:>20}: {best * 1e6:8.2f} us/response")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Compares `InputModel.to_prompt` against the old per-field `str.replace`.
+
+Run with `python benchmarks/bench_to_prompt.py`.
+"""
+
+import timeit
+
+from json_generator import InputModel, placeholder
+
+TEMPLATE = (
+    "Your task is to generate two passages in Vietnamese for the given legal query.\n"
+    "<legal_query>\n{{LEGAL_QUERY}}\n</legal_query>\n"
+    "<domain>{{DOMAIN}}</domain>\n"
+) + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 70
+
+
+class LegalQuery(InputModel):
+    input_prompt: str = TEMPLATE
+    query: str = placeholder("{{LEGAL_QUERY}}")
+    domain: str = placeholder("{{DOMAIN}}")
+
+
+def legacy_to_prompt(input_model: InputModel) -> str:
+    field_data = input_model.model_dump(by_alias=True)
+    input_prompt = input_model.input_prompt
+    for placeholder, actual_value in field_data.items():
+        input_prompt = input_prompt.replace(placeholder, str(actual_value))
+    return input_prompt
+
+
+def main():
+    inputs = [
+        LegalQuery(query=f"Câu hỏi số {i} về luật giao thông?", domain="Pháp luật")
+        for i in range(1000)
+    ]
+    assert [legacy_to_prompt(i) for i in inputs] == InputModel.render_many(inputs)
+
+    print(f"template size: {len(TEMPLATE)} chars, {len(inputs)} inputs")
+    for name, stmt in [
+        ("legacy replace", lambda: [legacy_to_prompt(i) for i in inputs]),
+        ("to_prompt", lambda: [i.to_prompt() for i in inputs]),
+        ("render_many", lambda: InputModel.render_many(inputs)),
+        ("render_many split", lambda: InputModel.render_many(inputs, split=True)),
+    ]:
+        best = min(timeit.repeat(stmt, number=10, repeat=5)) / 10
+        print(f"{name:>17}: {best * 1e6 / len(inputs):8.2f} us/input")
+
+
+if __name__ == "__main__":
+    main()
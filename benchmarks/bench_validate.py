@@ -0,0 +1,108 @@
+"""Compares the per-response validation loop against whole-batch validation.
+
+The batch variant validates every response in one call through a cached
+`TypeAdapter(list[Json[Model]])` and, when some fail, locates them from the
+error locations and validates the rest again. Both use `LegalPassagePair`
+sized responses, with all responses valid and with one in ten malformed.
+
+Run with `python benchmarks/bench_validate.py`.
+"""
+
+import json
+import logging
+import timeit
+from functools import lru_cache
+
+from pydantic import BaseModel, Json, TypeAdapter, ValidationError
+
+from json_generator import OutputModel
+from json_generator.generate import empty_output, parse_response, parse_responses
+
+CONTENT = (
+    "Điều 3. Giải thích từ ngữ. Trong Thông tư này, hệ thống thông tin là tập hợp "
+    "các thiết bị phần cứng, phần mềm và đường truyền dùng để thu nhận dữ liệu. "
+) * 12
+
+
+class LegalPassage(BaseModel):
+    domain: str = ""
+    source: str = ""
+    content: str = ""
+
+
+class LegalPassagePair(OutputModel):
+    positive: LegalPassage
+    hard_negative: LegalPassage
+
+    @classmethod
+    def empty(cls) -> "LegalPassagePair":
+        return cls(positive=LegalPassage(), hard_negative=LegalPassage())
+
+
+RESPONSE = json.dumps(
+    {
+        "positive": {"domain": "Giao thông", "source": "TT 09", "content": CONTENT},
+        "hard_negative": {"domain": "CNTT", "source": "NĐ 64", "content": CONTENT},
+    },
+    ensure_ascii=False,
+)
+
+
+@lru_cache(maxsize=None)
+def batch_adapter(output_model: type[OutputModel]) -> TypeAdapter:
+    return TypeAdapter(list[Json[output_model]])
+
+
+def parse_batch(responses: list[str], output_model: type[OutputModel]):
+    adapter = batch_adapter(output_model)
+    try:
+        return adapter.validate_python(responses), []
+    except ValidationError as e:
+        failed = sorted({error["loc"][0] for error in e.errors(include_url=False)})
+
+    outputs: list = [None] * len(responses)
+    bad: list[int] = []
+    for i in failed:
+        try:
+            outputs[i], _ = parse_response(responses[i], output_model)
+        except ValidationError:
+            bad.append(i)
+            outputs[i] = empty_output(output_model)
+
+    failing = set(failed)
+    good = [i for i in range(len(responses)) if i not in failing]
+    for i, output in zip(good, adapter.validate_python([responses[i] for i in good])):
+        outputs[i] = output
+    return outputs, bad
+
+
+def main():
+    # Only time the validation, not the error logs of the bad responses
+    logging.getLogger("json_generator").setLevel(logging.CRITICAL)
+    print(f"response size: {len(RESPONSE)} chars")
+    for bad_every in [None, 10]:
+        for size in [64, 256, 1024]:
+            responses = [
+                "Bad" if bad_every and i % bad_every == 0 else RESPONSE
+                for i in range(size)
+            ]
+            assert parse_batch(responses, LegalPassagePair) == parse_responses(
+                responses, LegalPassagePair
+            )
+
+            timings = []
+            for stmt in [
+                lambda: parse_responses(responses, LegalPassagePair),
+                lambda: parse_batch(responses, LegalPassagePair),
+            ]:
+                best = min(timeit.repeat(stmt, number=5, repeat=5)) / 5
+                timings.append(best * 1e6 / size)
+            label = f"{size} responses" + (f", 1/{bad_every} bad" if bad_every else "")
+            print(
+                f"{label:>24}: loop {timings[0]:6.2f} us/response, "
+                f"batch {timings[1]:6.2f} us/response"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""End-to-end and micro benchmarks of the generation pipeline.
+
+Every load profile runs `generate_and_save` and `agenerate_and_save`
+against a `SyntheticBackend`, measuring throughput and, in a second run
+under `tracemalloc`, peak memory. The micro-benchmarks time prompt
+rendering, response validation, `escape_json_string` and record
+serialization on their own.
+
+Results are printed and, with `--output`, written as JSON. Passing an
+earlier results file to `--compare` reports the change of every benchmark
+and exits with status 1 if one got slower by more than `--threshold`.
+
+Run with `python benchmarks/harness.py --output results.json`, or with
+`--quick` for a short smoke run.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+from json_generator import (  # noqa: E402
+    GenerationStats,
+    InputModel,
+    OutputModel,
+    agenerate_and_save,
+    generate_and_save,
+    placeholder,
+)
+from json_generator.generate import parse_responses  # noqa: E402
+from json_generator.mock import (  # noqa: E402
+    AsyncSyntheticBackend,
+    LoadProfile,
+    SyntheticBackend,
+)
+from json_generator.sinks import record_line  # noqa: E402
+from json_generator.utils import escape_json_string  # noqa: E402
+
+PROFILES = {
+    # No latency at all, to measure the pipeline's own overhead
+    "overhead": LoadProfile(),
+    "steady": LoadProfile(latency=0.02, latency_sigma=0.2, malformed_rate=0.05),
+    "heavy_tail": LoadProfile(latency=0.02, latency_sigma=1.2, malformed_rate=0.05),
+    "flaky": LoadProfile(latency=0.02, failure_rate=0.1, malformed_rate=0.2),
+    "throttled": LoadProfile(
+        latency=0.02,
+        burst_every=1.0,
+        burst_length=0.25,
+        throttle_latency=0.005,
+    ),
+    # About 1200 tokens per response
+    "large": LoadProfile(latency=0.02, string_length=1500, list_length=1),
+}
+
+
+class LegalPassage(InputModel):
+    input_prompt: str = (
+        "Lĩnh vực: {$DOMAIN}\nNguồn: {$SOURCE}\n\nĐoạn văn:\n{$CONTENT}\n\n"
+        "Hãy viết một đoạn văn tương tự và một đoạn văn dễ gây nhầm lẫn."
+    )
+    domain: str = placeholder("{$DOMAIN}")
+    source: str = placeholder("{$SOURCE}")
+    content: str = placeholder("{$CONTENT}")
+
+
+class Passage(BaseModel):
+    domain: str = ""
+    source: str = ""
+    content: str = ""
+
+
+class LegalPassagePair(OutputModel):
+    positive: Passage
+    hard_negative: Passage
+
+    @classmethod
+    def empty(cls) -> "LegalPassagePair":
+        return cls(positive=Passage(), hard_negative=Passage())
+
+
+def make_inputs(count: int) -> list[LegalPassage]:
+    return [
+        LegalPassage(
+            domain="Giao thông",
+            source=f"Thông tư {i}/2024/TT-BGTVT",
+            content=f"Điều {i}. Người điều khiển phương tiện phải tuân thủ. " * 8,
+        )
+        for i in range(count)
+    ]
+
+
+def run_generation(
+    mode: str, profile: LoadProfile, inputs: list[LegalPassage], output_file: str
+) -> tuple[GenerationStats, SyntheticBackend]:
+    stats = GenerationStats()
+    options = dict(
+        inputs=iter(inputs),
+        output_model=LegalPassagePair,
+        output_file=output_file,
+        total=len(inputs),
+        batch_size=8,
+        retry_rounds=3,
+        stats=stats,
+    )
+    if mode == "sync":
+        backend = SyntheticBackend(LegalPassagePair, profile, seed=0)
+        generate_and_save(generator=backend, **options)
+    else:
+        backend = AsyncSyntheticBackend(LegalPassagePair, profile, seed=0)
+        asyncio.run(agenerate_and_save(generator=backend, max_concurrency=8, **options))
+    return stats, backend
+
+
+def bench_end_to_end(
+    name: str, mode: str, profile: LoadProfile, count: int, memory: bool
+) -> dict[str, Any]:
+    inputs = make_inputs(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        stats, backend = run_generation(
+            mode, profile, inputs, os.path.join(tmp, "outputs.jsonl")
+        )
+        seconds = time.perf_counter() - start
+
+        peak = None
+        if memory:
+            tracemalloc.start()
+            run_generation(mode, profile, inputs, os.path.join(tmp, "memory.jsonl"))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return {
+        "name": f"end_to_end/{mode}/{name}",
+        "inputs": count,
+        "seconds": seconds,
+        "records_per_second": count / seconds,
+        "peak_memory_mb": peak / 2**20 if peak is not None else None,
+        "backend_calls": backend.calls,
+        "backend_prompts": backend.prompts,
+        "profile": asdict(profile),
+        "stats": stats.to_dict(),
+    }
+
+
+def bench_micro(name: str, run: Callable[[], Any], items: int) -> dict[str, Any]:
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=5, number=number)) / number
+    return {
+        "name": f"micro/{name}",
+        "items": items,
+        "seconds": seconds,
+        "items_per_second": items / seconds,
+    }
+
+
+def micro_benchmarks() -> list[dict[str, Any]]:
+    inputs = make_inputs(1000)
+    backend = SyntheticBackend(LegalPassagePair, PROFILES["large"])
+    valid = [backend.response] * 1000
+    # One in ten responses cut off halfway, which needs a repair attempt
+    mixed = [
+        backend.response[: len(backend.response) // 2] if i % 10 == 0 else response
+        for i, response in enumerate(valid)
+    ]
+    output = LegalPassagePair.model_validate_json(backend.response)
+    sloppy = backend.response.replace('\\"', '"')
+
+    return [
+        bench_micro("to_prompt", lambda: [x.to_prompt() for x in inputs], 1000),
+        bench_micro("render_many", lambda: LegalPassage.render_many(inputs), 1000),
+        bench_micro(
+            "validate_valid",
+            lambda: parse_responses(valid, LegalPassagePair, GenerationStats()),
+            1000,
+        ),
+        bench_micro(
+            "validate_mixed",
+            lambda: parse_responses(mixed, LegalPassagePair, GenerationStats()),
+            1000,
+        ),
+        bench_micro("escape_json_string", lambda: escape_json_string(sloppy), 1),
+        bench_micro(
+            "record_line", lambda: [record_line(x, output) for x in inputs], 1000
+        ),
+    ]
+
+
+def environment() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def speed(result: dict[str, Any]) -> float:
+    return result.get("records_per_second") or result["items_per_second"]
+
+
+def compare(
+    results: list[dict[str, Any]], baseline_path: str, threshold: float
+) -> list[str]:
+    """Prints the change against a baseline, returns the regressed benchmarks."""
+    with open(baseline_path) as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        if result["name"] not in baseline:
+            continue
+        change = speed(result) / speed(baseline[result["name"]]) - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(result["name"])
+            flag = "  REGRESSION"
+        print(f"{result['name']:>36}: {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--inputs", type=int, default=400)
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--no-micro", action="store_true")
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    # Failed and malformed responses are expected here and logged as errors
+    logging.getLogger("json_generator").setLevel(logging.CRITICAL)
+    if args.quick:
+        args.inputs = 40
+
+    results = []
+    for name in args.profiles.split(","):
+        for mode in args.modes.split(","):
+            result = bench_end_to_end(
+                name, mode, PROFILES[name], args.inputs, not args.no_memory
+            )
+            results.append(result)
+            memory = result["peak_memory_mb"]
+            print(
+                f"{result['name']:>36}: {result['records_per_second']:9,.1f} records/s"
+                + (f", peak {memory:7.1f} MB" if memory is not None else "")
+            )
+    if not args.no_micro:
+        for result in micro_benchmarks():
+            results.append(result)
+            print(f"{result['name']:>36}: {result['items_per_second']:9,.0f} items/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
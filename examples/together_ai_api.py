@@ -1,26 +1,20 @@
 import asyncio
-import random
 
-import aiohttp
-import aiolimiter
 from pydantic import BaseModel
 
 from legal_queries_generator import (
+    ChatCompletionsBackend,
     InputModel,
     OutputModel,
-    generate_and_save,
+    agenerate_and_save,
+    configure_logging,
     placeholder,
 )
+from legal_queries_generator.backends import read_api_keys
 
-passage_generation_prompt = """Your task is to generate two passages in Vietnamese for the given legal query - a positive passage that comprehensively answers the query, and a "hard negative" passage that may seem relevant at first glance but is actually less useful in addressing the query.
-
-Here is the legal query:
-<legal_query>
-{{LEGAL_QUERY}}
-</legal_query>
-
-The query is in this domain: 
-<domain>{{DOMAIN}}</domain>
+# The placeholders come last, so everything before them is a static prefix
+# that the backend sends as a system message the server can cache
+passage_generation_prompt = """Your task is to generate two passages in Vietnamese for the legal query given at the end - a positive passage that comprehensively answers the query, and a "hard negative" passage that may seem relevant at first glance but is actually less useful in addressing the query.
 
 A "hard negative" passage has these key characteristics:
 - It is on the same general topic as the query 
@@ -71,7 +65,15 @@ Please generate your positive and hard negative passages and format them in JSON
 
 Fill in the actual details for [domain], [source], and [content] for each passage. The domain and source should be distinct between the two passages. The content should be in Vietnamese and directly relevant to the provided legal query and domain.
 
-Provide only the JSON output, with no other text. Make sure the JSON is properly formatted."""
+Provide only the JSON output, with no other text. Make sure the JSON is properly formatted.
+
+Here is the legal query:
+<legal_query>
+{{LEGAL_QUERY}}
+</legal_query>
+
+The query is in this domain:
+<domain>{{DOMAIN}}</domain>"""
 
 
 class LegalQuery(InputModel):
@@ -98,79 +100,34 @@ class LegalPassagePair(OutputModel):
         return cls(positive=LegalPassage(), hard_negative=LegalPassage())
 
 
-async def together(text: str, api_key: str) -> str:
-    endpoint = "https://api.together.xyz/v1/chat/completions"
-    connector = aiohttp.TCPConnector(
-        force_close=True, limit=10
-    )  # To avoid ServerDisconnectedError
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.post(
-            endpoint,
-            json={
-                "model": "meta-llama/Llama-3-70b-chat-hf",
-                "max_tokens": 1200,
-                "temperature": 0.4,
-                "top_p": 0.7,
-                "top_k": 50,
-                "repetition_penalty": 1,
-                "stop": ["<|eot_id|>"],
-                "messages": [
-                    {
-                        "content": text,
-                        "role": "user",
-                    }
-                ],
-            },
-            headers={
-                "Authorization": f"Bearer {api_key}",
-            },
-        ) as res:
-            if res.status != 200:
-                print(f"Failed to generate query: {res.status}")
-                return ""
-
-            try:
-                data = await res.json()
-                return data["choices"][0]["message"]["content"]
-            except Exception as e:
-                print(f"Failed to generate query: {e}")
-                return ""
-
-
-def generator(contents: list[str]) -> list[str]:
-    with open("together_api_keys.txt") as f:
-        api_keys = f.read().splitlines()
-
-    generated_contents: list[str] = []
-
-    # rotating api keys
-    def api_key_pool():
-        while True:
-            for api_key in api_keys:
-                yield api_key
-
-    limiter = aiolimiter.AsyncLimiter(len(api_keys), 1)
-
-    async def fetch(content, api_key):
-        async with limiter:
-            return await together(content, api_key)
-
-    async def async_generate():
-        # For some low probability, take a break of 5 seconds
-        take_a_break = random.random() < 0.01
-        if take_a_break:
-            print("Taking a 5 seconds break, hold on...")
-            await asyncio.sleep(5)
-
-        tasks: list[asyncio.Task[str]] = []
-        for content, api_key in zip(contents, api_key_pool()):
-            tasks.append(asyncio.create_task(fetch(content, api_key)))
-
-        generated_contents.extend(await asyncio.gather(*tasks))
-
-    asyncio.run(async_generate())
-
-    return generated_contents
+def make_backend() -> ChatCompletionsBackend:
+    # One pooled session for the whole run, with each key rate limited on
+    # its own and benched while Together throttles it. The instructions
+    # before the passage go out as a system message of their own
+    return ChatCompletionsBackend(
+        read_api_keys("together_api_keys.txt"),
+        model="meta-llama/Llama-3-70b-chat-hf",
+        base_url="https://api.together.xyz/v1",
+        requests_per_minute=60,
+        max_tokens=1200,
+        prefix_role="system",
+        temperature=0.4,
+        top_p=0.7,
+        top_k=50,
+        repetition_penalty=1,
+        stop=["<|eot_id|>"],
+    )
+
+
+async def run(inputs: list[LegalQuery]):
+    async with make_backend() as generator:
+        await agenerate_and_save(
+            inputs=inputs,
+            output_model=LegalPassagePair,
+            batch_size=4,
+            max_concurrency=8,
+            generator=generator,
+        )
 
 
 if __name__ == "__main__":
@@ -193,9 +150,6 @@ if __name__ == "__main__":
 
     print(f"Number of queries: {len(inputs)}")
 
-    generate_and_save(
-        inputs=inputs,
-        output_model=LegalPassagePair,
-        batch_size=4,
-        generator=generator,
-    )
+    configure_logging(record_sample_rate=0.05)
+
+    asyncio.run(run(inputs))
@@ -1,10 +1,60 @@
-from .generate import generate_and_save, generate_batch
-from .data_module import InputModel, OutputModel, placeholder
+import logging
+
+from .adaptive import AdaptiveController
+from .generate import (
+    agenerate_and_save,
+    agenerate_batch,
+    generate_and_save,
+    generate_batch,
+)
+from .backends import ChatCompletionsBackend
+from .breaker import CircuitBreaker, CircuitOpenError
+from .cache import ResponseCache
+from .data_module import InputModel, OutputModel, SplitPrompt, placeholder
+from .hedging import HedgePolicy
+from .loaders import load_batches, load_inputs
+from .log_config import configure_logging
+from .metrics import RunMetrics
+from .reader import OutputReader
+from .schema import response_format, schema_guided
+from .sharding import generate_shard, merge_shards, run_sharded
+from .sinks import JsonlSink, ParquetSink, ShardedJsonlSink, Sink
+from .stats import GenerationStats
+from .streaming import streaming
+
+# Logging is left to the application, see `configure_logging`; without
+# this, Python's last-resort handler prints every warning to stderr
+logging.getLogger(__name__).addHandler(logging.NullHandler())
 
 __all__ = [
+    "AdaptiveController",
+    "agenerate_and_save",
+    "agenerate_batch",
+    "ChatCompletionsBackend",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "configure_logging",
+    "GenerationStats",
     "generate_and_save",
     "generate_batch",
+    "generate_shard",
+    "HedgePolicy",
     "InputModel",
+    "JsonlSink",
+    "load_batches",
+    "load_inputs",
+    "merge_shards",
     "OutputModel",
+    "OutputReader",
+    "ParquetSink",
     "placeholder",
+    "ResponseCache",
+    "response_format",
+    "run_sharded",
+    "RunMetrics",
+    "schema_guided",
+    "ShardedJsonlSink",
+    "Sink",
+    "SplitPrompt",
+    "streaming",
 ]
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from json_generator.stats import GenerationStats
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AdaptiveController:
+    """AIMD controller for the batch size and number of batches in flight.
+
+    After every batch, `record` is given the batch latency and its counts.
+    A batch that looks healthy grows the batch size and concurrency by
+    `increase_step`; one with too many failures or too high a latency
+    shrinks both by `decrease_factor`, at most once per smoothed batch
+    latency so one slowdown seen by several in-flight batches is only
+    acted on once.
+
+    A batch counts as failing when the share of its responses that were
+    empty or failed validation exceeds `max_failure_rate`, and as slow when
+    its latency exceeds `target_latency`. Without a target, a smoothed
+    latency above `latency_tolerance` times the lowest one seen so far
+    counts as slow.
+    """
+
+    batch_size: int = 4
+    min_batch_size: int = 1
+    max_batch_size: int = 64
+    concurrency: int = 4
+    min_concurrency: int = 1
+    max_concurrency: int = 32
+    max_failure_rate: float = 0.1
+    target_latency: Optional[float] = None
+    latency_tolerance: float = 2.0
+    increase_step: int = 1
+    decrease_factor: float = 0.5
+    smoothing: float = 0.2
+
+    smoothed_latency: Optional[float] = field(default=None, init=False)
+    _baseline_latency: Optional[float] = field(default=None, init=False, repr=False)
+    _last_decrease: float = field(default=float("-inf"), init=False, repr=False)
+
+    def record(self, latency: float, stats: GenerationStats):
+        """Adjusts the limits after a batch, given that batch's own stats."""
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency += self.smoothing * (latency - self.smoothed_latency)
+        if (
+            self._baseline_latency is None
+            or self.smoothed_latency < self._baseline_latency
+        ):
+            self._baseline_latency = self.smoothed_latency
+
+        # Empty responses fail validation too, so they are in `bad_responses`
+        sent = stats.generated_prompts
+        failing = sent > 0 and stats.bad_responses / sent > self.max_failure_rate
+        if self.target_latency is not None:
+            slow = latency > self.target_latency
+        else:
+            slow = self.smoothed_latency > (
+                self.latency_tolerance * self._baseline_latency
+            )
+
+        if failing or slow:
+            self._decrease(failing, slow)
+        else:
+            self.batch_size = min(
+                self.max_batch_size, self.batch_size + self.increase_step
+            )
+            self.concurrency = min(
+                self.max_concurrency, self.concurrency + self.increase_step
+            )
+
+    def _decrease(self, failing: bool, slow: bool):
+        now = time.monotonic()
+        if now - self._last_decrease < (self.smoothed_latency or 0.0):
+            return
+        self._last_decrease = now
+
+        self.batch_size = max(
+            self.min_batch_size, int(self.batch_size * self.decrease_factor)
+        )
+        self.concurrency = max(
+            self.min_concurrency, int(self.concurrency * self.decrease_factor)
+        )
+        logger.warning(
+            f"Backing off (failing={failing}, slow={slow}): "
+            f"batch_size={self.batch_size}, concurrency={self.concurrency}"
+        )
+
+
+class ConcurrencyLimiter:
+    """Async semaphore whose limit is read from an `AdaptiveController`."""
+
+    def __init__(self, controller: AdaptiveController):
+        self.controller = controller
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_flight < self.controller.concurrency
+            )
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
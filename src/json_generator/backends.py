@@ -0,0 +1,393 @@
+import asyncio
+import json
+import logging
+import time
+from collections.abc import AsyncIterator, Callable
+from typing import Any, Optional
+
+from json_generator.packing import TokenCounter, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Statuses after which a key is benched and the request moves to another key
+THROTTLED_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """Refills at `rate` per second up to `capacity`.
+
+    `reserve` always succeeds and returns how long the caller must wait
+    before using what it reserved, so waiting callers are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def reserve(self, amount: float) -> float:
+        wait = self.wait_time(amount)
+        self.tokens -= amount
+        return wait
+
+    def adjust(self, amount: float):
+        """Takes `amount` more, or gives it back when negative."""
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class ApiKey:
+    """An API key with its own rate limits and health."""
+
+    def __init__(
+        self,
+        key: str,
+        requests_per_minute: Optional[float],
+        tokens_per_minute: Optional[float],
+    ):
+        self.key = key
+        self.requests = (
+            TokenBucket(requests_per_minute / 60, requests_per_minute)
+            if requests_per_minute
+            else None
+        )
+        self.tokens = (
+            TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+            if tokens_per_minute
+            else None
+        )
+        self.benched_until = 0.0
+        self.failures = 0
+        self.in_flight = 0
+        self.last_used = 0.0
+
+    def wait_time(self, tokens: int) -> float:
+        waits = [max(0.0, self.benched_until - time.monotonic())]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(waits)
+
+    def reserve(self, tokens: int) -> float:
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.reserve(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.reserve(tokens))
+        return max(waits)
+
+
+class KeyPool:
+    """Rotates requests over API keys, benching the throttled ones.
+
+    Every request goes to the key that can take it soonest, preferring the
+    least busy and then least recently used one on ties. A key that is
+    throttled or failing is benched for its `Retry-After`, or an exponential
+    backoff from `bench_time` up to `max_bench_time`, and taken back after
+    its next success.
+    """
+
+    def __init__(
+        self,
+        keys: list[str],
+        *,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        bench_time: float = 1.0,
+        max_bench_time: float = 60.0,
+    ):
+        if not keys:
+            raise ValueError("At least one API key is required")
+        self.keys = [
+            ApiKey(key, requests_per_minute, tokens_per_minute) for key in keys
+        ]
+        self.bench_time = bench_time
+        self.max_bench_time = max_bench_time
+
+    async def acquire(self, tokens: int) -> ApiKey:
+        """Waits for and returns the key to send a request of `tokens` with."""
+        while True:
+            key = min(
+                self.keys,
+                key=lambda k: (k.wait_time(tokens), k.in_flight, k.last_used),
+            )
+            benched = key.benched_until - time.monotonic()
+            if benched > 0:
+                # Every key is benched, wait for the first one back
+                await asyncio.sleep(benched)
+                continue
+            wait = key.reserve(tokens)
+            key.in_flight += 1
+            key.last_used = time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            return key
+
+    def release(self, key: ApiKey, ok: bool, retry_after: Optional[float] = None):
+        key.in_flight -= 1
+        if ok:
+            key.failures = 0
+            return
+
+        key.failures += 1
+        bench = retry_after
+        if bench is None:
+            bench = min(self.max_bench_time, self.bench_time * 2 ** (key.failures - 1))
+        key.benched_until = max(key.benched_until, time.monotonic() + bench)
+        logger.warning("Benching API key ...%s for %.1fs", key.key[-4:], bench)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class ChatCompletionsBackend:
+    """Async generator for OpenAI-compatible chat completions endpoints.
+
+    All requests share one `aiohttp` session, so connections are pooled and
+    kept alive, up to `max_connections`. Requests are spread over `api_keys`
+    by a `KeyPool`, each key limited to `requests_per_minute` and
+    `tokens_per_minute`; a request's tokens are estimated with
+    `count_tokens` plus `max_tokens`, then corrected from the usage the
+    server reports. A throttled or failed request is retried on another key
+    up to `max_attempts` times before its response is left empty.
+
+    Prompts are sent whole as one user message. With a `prefix_role`, the
+    static prefix of a `SplitPrompt`, the template text before its first
+    placeholder, is sent as a separate message of that role ahead of the
+    user message with the rest, so servers with prefix caching reuse it
+    across requests. It is opt-in, as it changes what the model is sent.
+
+    With `use_response_format`, the backend is schema-guided and sends the
+    output model's `response_format` with every request. Other keyword
+    arguments go into the request body, for example `temperature`. Needs
+    `aiohttp`; close the backend, or use it with `async with`, when done.
+    `as_stream()` gives the same backend as a streaming generator.
+    """
+
+    def __init__(
+        self,
+        api_keys: list[str],
+        *,
+        model: str,
+        base_url: str = "https://api.openai.com/v1",
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        max_connections: int = 64,
+        timeout: float = 120.0,
+        max_attempts: int = 3,
+        use_response_format: bool = False,
+        prefix_role: Optional[str] = None,
+        count_tokens: Optional[TokenCounter] = None,
+        **request_options: Any,
+    ):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError(
+                "ChatCompletionsBackend requires the `aiohttp` package"
+            ) from e
+
+        self._aiohttp = aiohttp
+        self.endpoint = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.schema_guided = use_response_format
+        self.prefix_role = prefix_role
+        self.count_tokens: Callable[[str], int] = count_tokens or estimate_tokens
+        self.request_options = request_options
+        self.keys = KeyPool(
+            api_keys,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+        )
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = self._aiohttp.ClientSession(
+                connector=self._aiohttp.TCPConnector(
+                    limit=self.max_connections, keepalive_timeout=60
+                ),
+                timeout=self._aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "ChatCompletionsBackend":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def __call__(
+        self, prompts: list[str], response_format: Optional[dict] = None
+    ) -> list[str]:
+        return list(
+            await asyncio.gather(
+                *(self.complete(prompt, response_format) for prompt in prompts)
+            )
+        )
+
+    def messages(self, prompt: str) -> list[dict[str, str]]:
+        """The prompt's static prefix as its own message, then the rest."""
+        prefix = getattr(prompt, "prefix", "")
+        if self.prefix_role is None or not prefix or len(prefix) == len(prompt):
+            return [{"role": "user", "content": str(prompt)}]
+        return [
+            {"role": self.prefix_role, "content": prefix},
+            {"role": "user", "content": prompt[len(prefix) :]},
+        ]
+
+    def request_body(self, prompt: str, response_format: Optional[dict]) -> dict:
+        body = {
+            "model": self.model,
+            "messages": self.messages(prompt),
+            **self.request_options,
+        }
+        if self.max_tokens is not None:
+            body["max_tokens"] = self.max_tokens
+        if response_format is not None:
+            body["response_format"] = response_format
+        return body
+
+    async def complete(
+        self, prompt: str, response_format: Optional[dict] = None
+    ) -> str:
+        """Returns the completion for one prompt, or "" if every attempt failed."""
+        session = self._get_session()
+        body = self.request_body(prompt, response_format)
+        tokens = self.count_tokens(prompt) + (self.max_tokens or 0)
+
+        for _ in range(self.max_attempts):
+            key = await self.keys.acquire(tokens)
+            ok, retry_after = False, None
+            try:
+                async with session.post(
+                    self.endpoint,
+                    json=body,
+                    headers={"Authorization": f"Bearer {key.key}"},
+                ) as response:
+                    if response.status in THROTTLED_STATUSES:
+                        retry_after = parse_retry_after(
+                            response.headers.get("Retry-After")
+                        )
+                        continue
+                    if response.status != 200:
+                        logger.error(
+                            "Completion failed with status %d: %s",
+                            response.status,
+                            await response.text(),
+                        )
+                        ok = True
+                        return ""
+
+                    data = await response.json()
+                    ok = True
+                    usage = (data.get("usage") or {}).get("total_tokens")
+                    if usage is not None and key.tokens is not None:
+                        key.tokens.adjust(usage - tokens)
+                    return data["choices"][0]["message"]["content"] or ""
+            except (self._aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("Completion request failed: %r", e)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                logger.error("Unexpected completion response: %r", e)
+                return ""
+            finally:
+                self.keys.release(key, ok, retry_after)
+
+        return ""
+
+    async def stream(
+        self, prompt: str, response_format: Optional[dict] = None
+    ) -> AsyncIterator[str]:
+        """Yields the completion for one prompt as it is generated.
+
+        Throttled or failed requests are retried on another key like in
+        `complete`, as long as nothing was yielded yet. Closing the iterator
+        early closes the connection, which cancels the request.
+        """
+        session = self._get_session()
+        body = {**self.request_body(prompt, response_format), "stream": True}
+        tokens = self.count_tokens(prompt) + (self.max_tokens or 0)
+
+        for _ in range(self.max_attempts):
+            key = await self.keys.acquire(tokens)
+            ok, retry_after = False, None
+            try:
+                async with session.post(
+                    self.endpoint,
+                    json=body,
+                    headers={"Authorization": f"Bearer {key.key}"},
+                ) as response:
+                    if response.status in THROTTLED_STATUSES:
+                        retry_after = parse_retry_after(
+                            response.headers.get("Retry-After")
+                        )
+                        continue
+                    ok = True
+                    if response.status != 200:
+                        logger.error(
+                            "Completion failed with status %d: %s",
+                            response.status,
+                            await response.text(),
+                        )
+                        return
+
+                    async for line in response.content:
+                        data = line.decode().strip().removeprefix("data:").strip()
+                        if not data:
+                            continue
+                        if data == "[DONE]":
+                            return
+                        choices = json.loads(data).get("choices") or [{}]
+                        content = choices[0].get("delta", {}).get("content")
+                        if content:
+                            yield content
+                    return
+            except (self._aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("Completion request failed: %r", e)
+                if ok:
+                    return
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                logger.error("Unexpected completion response: %r", e)
+                return
+            finally:
+                self.keys.release(key, ok, retry_after)
+
+    def as_stream(self) -> Callable[..., AsyncIterator[str]]:
+        """This backend as a streaming generator, see `StreamedGenerator`."""
+
+        def stream(prompt: str, response_format: Optional[dict] = None):
+            return self.stream(prompt, response_format)
+
+        stream.streaming = True
+        stream.schema_guided = self.schema_guided
+        return stream
+
+
+def read_api_keys(path: str) -> list[str]:
+    """Reads one API key per line, skipping blank lines."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Literal, Optional
+
+from json_generator.protocols import AsyncBatchGenerator, BatchGenerator
+
+logger = logging.getLogger(__name__)
+
+State = Literal["closed", "open", "half_open"]
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the backend stays down through `max_trips` probes."""
+
+
+@dataclass
+class CircuitBreaker:
+    """Run-level detector for backend outages.
+
+    Every response that comes back empty, or every prompt of a call that
+    raised, counts as a failure. Once at least `min_requests` of the last
+    `window` responses were seen and `failure_threshold` of them failed,
+    the breaker opens: dispatch pauses for an exponential backoff starting
+    at `base_delay`, capped at `max_delay` and shortened by up to `jitter`
+    of itself so paused callers do not resume together. The next call is
+    then a probe; if it fails too, the breaker opens again for longer, and
+    after `max_trips` failed probes in a row `CircuitOpenError` is raised.
+
+    Prompts that failed while the breaker opened are requeued by `guard`
+    and `aguard` rather than returned empty, so an outage neither uses up
+    the retry rounds nor ends up in the output as `empty()` records.
+    """
+
+    failure_threshold: float = 0.5
+    window: int = 50
+    min_requests: int = 10
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    jitter: float = 0.5
+    max_trips: Optional[int] = 10
+
+    state: State = field(default="closed", init=False)
+    trips: int = field(default=0, init=False)
+    requeued: int = field(default=0, init=False)
+    _failures: deque = field(default_factory=deque, init=False, repr=False)
+    _consecutive_trips: int = field(default=0, init=False, repr=False)
+    _open_until: float = field(default=0.0, init=False, repr=False)
+    _probing: bool = field(default=False, init=False, repr=False)
+
+    def __post_init__(self):
+        self._failures = deque(maxlen=self.window)
+
+    def wait_time(self) -> float:
+        """Seconds to wait before calling the backend, 0 when allowed now.
+
+        Claims the probe when the open period is over, so exactly one
+        caller goes through while the breaker is half-open.
+        """
+        if self.state == "closed":
+            return 0.0
+        if self.state == "open":
+            remaining = self._open_until - time.monotonic()
+            if remaining > 0:
+                return remaining
+            self.state = "half_open"
+        if self._probing:
+            # Another caller is probing, check again shortly
+            return min(self.base_delay, 0.05)
+        self._probing = True
+        return 0.0
+
+    def record(self, successes: int, failures: int, probe: bool = False) -> bool:
+        """Records the outcome of one call.
+
+        Returns whether the breaker is not closed afterwards, meaning the
+        failed prompts of the call should be sent again later.
+        """
+        if probe:
+            self._probing = False
+            total = successes + failures
+            if total and failures / total >= self.failure_threshold:
+                self._trip()
+                return True
+            logger.info("Backend recovered, closing the circuit breaker")
+            self.state = "closed"
+            self._consecutive_trips = 0
+            self._failures.clear()
+            return False
+
+        self._failures.extend([False] * successes + [True] * failures)
+        if self.state == "closed" and len(self._failures) >= self.min_requests:
+            if sum(self._failures) / len(self._failures) >= self.failure_threshold:
+                self._trip()
+                return True
+        return self.state != "closed"
+
+    def _trip(self):
+        self._consecutive_trips += 1
+        self.trips += 1
+        if self.max_trips is not None and self._consecutive_trips > self.max_trips:
+            raise CircuitOpenError(
+                f"Backend still failing after {self.max_trips} probes, giving up"
+            )
+
+        delay = min(
+            self.max_delay, self.base_delay * 2 ** (self._consecutive_trips - 1)
+        )
+        delay *= 1 - self.jitter * random.random()
+        self.state = "open"
+        self._open_until = time.monotonic() + delay
+        self._failures.clear()
+        logger.warning(f"Backend failing, pausing dispatch for {delay:.1f}s")
+
+    def guard(self, generator: BatchGenerator) -> BatchGenerator:
+        """Wraps a generator so its calls go through the breaker."""
+
+        def guarded(prompts: list[str]) -> list[str]:
+            responses = [""] * len(prompts)
+            pending = list(range(len(prompts)))
+            while pending:
+                delay = self.wait_time()
+                if delay > 0:
+                    time.sleep(delay)
+                    continue
+                probe = self.state == "half_open"
+                try:
+                    generated = generator([prompts[i] for i in pending])
+                except Exception as e:
+                    logger.error(f"Generator failed: {e}")
+                    generated = [""] * len(pending)
+                pending = self._requeue(responses, pending, generated, probe)
+            return responses
+
+        return guarded
+
+    def aguard(self, generator: AsyncBatchGenerator) -> AsyncBatchGenerator:
+        """Async counterpart of `guard`."""
+
+        async def guarded(prompts: list[str]) -> list[str]:
+            responses = [""] * len(prompts)
+            pending = list(range(len(prompts)))
+            while pending:
+                delay = self.wait_time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                probe = self.state == "half_open"
+                try:
+                    generated = await generator([prompts[i] for i in pending])
+                except Exception as e:
+                    logger.error(f"Generator failed: {e}")
+                    generated = [""] * len(pending)
+                pending = self._requeue(responses, pending, generated, probe)
+            return responses
+
+        return guarded
+
+    def _requeue(
+        self,
+        responses: list[str],
+        pending: list[int],
+        generated: list[str],
+        probe: bool,
+    ) -> list[int]:
+        """Stores the responses of a call, returns the prompts to send again."""
+        failed: list[int] = []
+        for i, response in zip(pending, generated):
+            responses[i] = response
+            if not response.strip():
+                failed.append(i)
+
+        if not self.record(len(pending) - len(failed), len(failed), probe):
+            return []
+        self.requeued += len(failed)
+        return failed
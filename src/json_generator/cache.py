@@ -0,0 +1,184 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections.abc import Sequence
+from typing import Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key BLOB PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+# SQLite limits the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+
+class ResponseCache:
+    """Persistent cache of validated responses, keyed by prompt.
+
+    Keys are a hash of `fingerprint` and the rendered prompt, so the
+    fingerprint should identify everything else that changes the response
+    (backend, model, sampling parameters). Entries older than `max_age`
+    seconds are dropped, and once the stored responses exceed `max_bytes`
+    the least recently used ones are evicted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        fingerprint: str = "",
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+    ):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(_SCHEMA)
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._connection.commit()
+        self._size = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.evict()
+
+    def key(self, prompt: str) -> bytes:
+        digest = hashlib.blake2b(self.fingerprint.encode(), digest_size=20)
+        digest.update(b"\0")
+        digest.update(prompt.encode())
+        return digest.digest()
+
+    def get_many(self, prompts: Sequence[str]) -> list[Optional[str]]:
+        """Returns the cached response for each prompt, or None on a miss."""
+        keys = [self.key(prompt) for prompt in prompts]
+        found: dict[bytes, str] = {}
+        now = time.time()
+        expired_before = now - self.max_age if self.max_age is not None else None
+
+        with self._lock:
+            for start in range(0, len(keys), _MAX_PARAMS):
+                chunk = keys[start : start + _MAX_PARAMS]
+                marks = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, response, created FROM responses "
+                    f"WHERE key IN ({marks})",
+                    chunk,
+                ).fetchall()
+                for key, response, created in rows:
+                    if expired_before is None or created >= expired_before:
+                        found[key] = response
+
+            if found:
+                self._connection.executemany(
+                    "UPDATE responses SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._connection.commit()
+
+        responses = [found.get(key) for key in keys]
+        hits = len(responses) - responses.count(None)
+        self.hits += hits
+        self.misses += len(responses) - hits
+        return responses
+
+    def put_many(self, prompts: Sequence[str], responses: Sequence[str]):
+        """Stores responses; callers must only pass validated responses."""
+        if not prompts:
+            return
+
+        now = time.time()
+        rows = [
+            (self.key(prompt), response, len(response.encode()), now, now)
+            for prompt, response in zip(prompts, responses)
+        ]
+        with self._lock:
+            replaced = self._sizes_of([row[0] for row in rows])
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._connection.commit()
+            self._size += sum(row[2] for row in rows) - replaced
+
+        if self.max_bytes is not None and self._size > self.max_bytes:
+            self.evict()
+
+    def _sizes_of(self, keys: list[bytes]) -> int:
+        size = 0
+        for start in range(0, len(keys), _MAX_PARAMS):
+            chunk = keys[start : start + _MAX_PARAMS]
+            marks = ",".join("?" * len(chunk))
+            size += self._connection.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM responses WHERE key IN ({marks})",
+                chunk,
+            ).fetchone()[0]
+        return size
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones over budget."""
+        with self._lock:
+            if self.max_age is not None:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE created < ?",
+                    (time.time() - self.max_age,),
+                )
+
+            if self.max_bytes is not None:
+                self._size = self._connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()[0]
+                if self._size > self.max_bytes:
+                    # Walk entries from the least recently used one, breaking
+                    # ties by insertion order since a batch shares its access
+                    # time, and drop just enough of them to fit
+                    over = self._size - self.max_bytes
+                    stale: list[bytes] = []
+                    for key, size in self._connection.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed, rowid"
+                    ):
+                        if over <= 0:
+                            break
+                        stale.append(key)
+                        over -= size
+                    for start in range(0, len(stale), _MAX_PARAMS):
+                        chunk = stale[start : start + _MAX_PARAMS]
+                        marks = ",".join("?" * len(chunk))
+                        self._connection.execute(
+                            f"DELETE FROM responses WHERE key IN ({marks})", chunk
+                        )
+
+            self._connection.commit()
+            self._size = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,21 +1,176 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
+# Field values of these types render the same with `str()` as their dump does
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
 
 def placeholder(name: str):
     return Field(..., serialization_alias=name)
 
 
+class SplitPrompt(str):
+    """A rendered prompt that knows where its static prefix ends.
+
+    It is the full prompt as a `str`, so any generator can use it as is.
+    Backends with prompt caching or prefix sharing can read `prefix`, the
+    template text before its first placeholder, which is the same object
+    for every input rendered from that template, and `suffix`, the rest.
+    Templates with their placeholders at the end get the longest prefix.
+    """
+
+    prefix: str
+
+    def __new__(cls, prompt: str, prefix: str) -> "SplitPrompt":
+        # `prompt` must start with `prefix`
+        split = super().__new__(cls, prompt)
+        split.prefix = prefix
+        return split
+
+    def __getnewargs__(self) -> tuple[str, str]:
+        return str(self), self.prefix
+
+    @property
+    def suffix(self) -> str:
+        return self[len(self.prefix) :]
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """A prompt template split into literal text and placeholder slots.
+
+    `segments` holds the literal text of the template, with `None` where a
+    placeholder goes; `slots` gives the position in `segments` and the field
+    name of each placeholder. `prefix` is the literal text before the first
+    placeholder.
+    """
+
+    segments: tuple[Optional[str], ...]
+    slots: tuple[tuple[int, str], ...]
+    fields: tuple[str, ...]
+    # Fields whose value must go through `model_dump` to render correctly
+    dumped_fields: frozenset[str]
+    prefix: str
+
+    def render(self, input_model: "InputModel") -> str:
+        return "".join(self._render_parts(input_model))
+
+    def render_split(self, input_model: "InputModel") -> SplitPrompt:
+        return SplitPrompt("".join(self._render_parts(input_model)), self.prefix)
+
+    def _render_parts(self, input_model: "InputModel") -> list[Optional[str]]:
+        values = input_model.__dict__
+        dumped: Optional[dict] = None
+        parts = list(self.segments)
+        for position, name in self.slots:
+            value = values[name]
+            if name in self.dumped_fields or type(value) not in _PLAIN_TYPES:
+                if dumped is None:
+                    dumped = input_model.model_dump(include=set(self.fields))
+                value = dumped[name]
+            parts[position] = value if type(value) is str else str(value)
+        return parts
+
+
+@lru_cache(maxsize=1024)
+def compile_template(model_class: type["InputModel"], template: str) -> PromptTemplate:
+    """Parses `template` into literal and placeholder segments.
+
+    Placeholders are applied in field order, each one splitting only the
+    literal text left by the previous ones, which gives the same result as
+    running `str.replace` once per field over the template.
+    """
+    segments: list[object] = [template]
+    field_names: list[str] = []
+    for name, field in model_class.model_fields.items():
+        key = field.serialization_alias or field.alias or name
+        if name == "input_prompt" or not key:
+            continue
+
+        slot = len(field_names)
+        split: list[object] = []
+        for segment in segments:
+            if not isinstance(segment, str) or key not in segment:
+                split.append(segment)
+                continue
+            pieces = segment.split(key)
+            split.append(pieces[0])
+            for piece in pieces[1:]:
+                split.extend((slot, piece))
+        if len(split) != len(segments):
+            segments = split
+            field_names.append(name)
+
+    slots = tuple(
+        (position, field_names[segment])
+        for position, segment in enumerate(segments)
+        if isinstance(segment, int)
+    )
+
+    decorators = model_class.__pydantic_decorators__
+    serialized = {
+        name
+        for decorator in decorators.field_serializers.values()
+        for name in decorator.info.fields
+    }
+    if decorators.model_serializers:
+        serialized = set(field_names)
+
+    return PromptTemplate(
+        segments=tuple(
+            segment if isinstance(segment, str) else None for segment in segments
+        ),
+        slots=slots,
+        fields=tuple(field_names),
+        dumped_fields=frozenset(serialized.intersection(field_names)),
+        # Literal and placeholder segments alternate, starting with a literal
+        prefix=segments[0],
+    )
+
+
 class InputModel(ABC, BaseModel):
     input_prompt: str
 
     def to_prompt(self) -> str:
         """Replaces placeholders in the input_prompt with attribute values."""
-        field_data = self.model_dump(by_alias=True)
-        input_prompt = self.input_prompt
-        for placeholder, actual_value in field_data.items():
-            input_prompt = input_prompt.replace(placeholder, str(actual_value))
-        return input_prompt
+        return compile_template(type(self), self.input_prompt).render(self)
+
+    def split_prompt(self) -> SplitPrompt:
+        """Renders the prompt split into its static prefix and the rest.
+
+        The prefix ends at the first placeholder of `input_prompt`, so
+        templates that keep their placeholders near the end share the most.
+        """
+        return compile_template(type(self), self.input_prompt).render_split(self)
+
+    @classmethod
+    def render_many(
+        cls, inputs: Iterable["InputModel"], split: bool = False
+    ) -> list[str]:
+        """Renders a batch of inputs, compiling each distinct template once.
+
+        With `split`, the prompts are rendered as `SplitPrompt`s.
+        """
+        prompts: list[str] = []
+        template: Optional[PromptTemplate] = None
+        last_class: Optional[type] = None
+        last_text: Optional[str] = None
+        for input_model in inputs:
+            model_class, text = type(input_model), input_model.input_prompt
+            if template is None or model_class is not last_class or text != last_text:
+                template = compile_template(model_class, text)
+                last_class, last_text = model_class, text
+            prompts.append(
+                template.render_split(input_model)
+                if split
+                else template.render(input_model)
+            )
+        return prompts
 
 
 class OutputModel(ABC, BaseModel):
@@ -1,122 +1,1032 @@
-import datetime
-import json
+import asyncio
+import hashlib
 import logging
 import os
-from collections.abc import Callable
-from typing import Optional, TypeVar
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable, Iterator, Sized
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, ContextManager, Optional, TypeVar, Union
 
 from pydantic import ValidationError
-from tenacity import RetryCallState, retry, stop_after_attempt
+from tenacity import (
+    AsyncRetrying,
+    RetryCallState,
+    Retrying,
+    retry_if_not_exception_type,
+    retry_if_result,
+    stop_after_attempt,
+    wait_exponential,
+)
 from tqdm import tqdm
 
+from json_generator.adaptive import AdaptiveController, ConcurrencyLimiter
+from json_generator.breaker import CircuitBreaker, CircuitOpenError
+from json_generator.cache import ResponseCache
 from json_generator.data_module import InputModel, OutputModel
+from json_generator.hedging import HedgedGenerator, HedgePolicy
+from json_generator.log_config import RecordDump, new_run_id, records_logger
+from json_generator.metrics import RunMetrics, stage_timer
+from json_generator.packing import TokenCounter, pack_batches
+from json_generator.protocols import AsyncBatchGenerator, BatchGenerator
+from json_generator.resume import load_completed, skip_completed
+from json_generator.schema import bind_response_format
+from json_generator.streaming import StreamedGenerator, is_streaming
+from json_generator.sinks import COMPRESSION_SUFFIXES, Sink, open_sink
+from json_generator.stats import GenerationStats
+from json_generator.utils import ReorderBuffer, batched, repair_json
 
-# Setup logging
-
-log_dir = "./logs"
-os.makedirs(log_dir, exist_ok=True)
-
-run_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-log_file = f"run_{run_id}.log"
-
-logging.basicConfig(
-    filename=os.path.join(log_dir, log_file),
-    level=logging.INFO,
-    filemode="w",
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+logger = logging.getLogger(__name__)
 
 X = TypeVar("X", bound=InputModel)
 Y = TypeVar("Y", bound=OutputModel)
 
 
 def batch_completion_error_callback(
-    retry_state: RetryCallState,
-) -> OutputModel:
-    logging.error(f"Error: {retry_state.outcome}")
-    return retry_state.args[1].empty()
+    retry_state: RetryCallState, remaining: list[int]
+) -> list[int]:
+    """Logs the prompts left bad once the retry rounds ran out."""
+    outcome = retry_state.outcome
+    error = outcome.exception() if outcome is not None and outcome.failed else None
+    if error is None:
+        logger.error(
+            "%d prompts still bad after %d retry rounds",
+            len(remaining),
+            retry_state.attempt_number,
+        )
+    else:
+        logger.error(
+            "%d prompts still bad after %d retry rounds, the last one failed: %r",
+            len(remaining),
+            retry_state.attempt_number,
+            error,
+        )
+    return remaining
+
+
+def retry_policy(
+    retry_rounds: int, retry_backoff: float, remaining: Callable[[], list[int]]
+) -> dict:
+    """Tenacity options for the retry rounds; `remaining` gives the indices
+    that are still bad, for the log once the rounds run out."""
+    return dict(
+        stop=stop_after_attempt(retry_rounds),
+        wait=wait_exponential(multiplier=retry_backoff),
+        retry=retry_if_result(bool) | retry_if_not_exception_type(CircuitOpenError),
+        retry_error_callback=lambda retry_state: batch_completion_error_callback(
+            retry_state, remaining()
+        ),
+    )
+
+
+def merge_responses(
+    responses: list[str],
+    indices: list[int],
+    outputs: list[Y],
+    output_model: type[Y],
+    stats: Optional[GenerationStats] = None,
+) -> list[int]:
+    """Parses the responses for `indices` into `outputs` in place.
+
+    Returns the indices whose responses are still bad.
+    """
+    parsed, bad = parse_responses(responses, output_model, stats)
+    for output, i in zip(parsed, indices):
+        outputs[i] = output
+    return [indices[j] for j in bad]
+
+
+class _RetryRounds:
+    """The prompts that are still bad between retry rounds.
+
+    Shared by `retry_completion` and `aretry_completion`, which only differ
+    in how they call the generator.
+    """
+
+    def __init__(
+        self,
+        prompts: list[str],
+        outputs: list[Y],
+        remaining: list[int],
+        output_model: type[Y],
+        stats: Optional[GenerationStats],
+        metrics: Optional[RunMetrics],
+    ):
+        self.prompts = prompts
+        self.outputs = outputs
+        self.remaining = remaining
+        self.output_model = output_model
+        self.stats = stats
+        self.metrics = metrics
+
+    def next_prompts(self) -> list[str]:
+        if self.stats is not None:
+            self.stats.retry_rounds += 1
+        return [self.prompts[i] for i in self.remaining]
+
+    def merge(self, responses: list[str]) -> list[int]:
+        with stage_timer(self.metrics, "parse"):
+            self.remaining = merge_responses(
+                responses, self.remaining, self.outputs, self.output_model, self.stats
+            )
+        return self.remaining
 
 
-@retry(
-    stop=stop_after_attempt(10),
-    retry_error_callback=batch_completion_error_callback,
-)
 def retry_completion(
-    input_model: InputModel,
+    prompts: list[str],
+    outputs: list[Y],
+    bad_response_indices: list[int],
     output_model: type[Y],
-    generator: Callable[[list[str]], list[str]],
-) -> Y:
-    prompt = input_model.to_prompt()
-    response = generator([prompt])
-    output = output_model.model_validate_json(response[0])
+    generator: BatchGenerator,
+    *,
+    retry_rounds: int = 10,
+    retry_backoff: float = 0.0,
+    stats: Optional[GenerationStats] = None,
+    metrics: Optional[RunMetrics] = None,
+) -> list[int]:
+    """Re-submits the bad responses in rounds, one batch per round.
 
-    return output
+    Every round sends all the prompts that are still bad to `generator` at
+    once and stops as soon as none are left. Rounds are spaced by an
+    exponential backoff of `retry_backoff` seconds. Returns the indices that
+    are still bad after the last round; their outputs are left as `empty()`.
+    Generator calls and parsing are timed into `metrics` when given.
+    """
+    if not bad_response_indices or retry_rounds < 1:
+        return bad_response_indices
+    rounds = _RetryRounds(
+        prompts, outputs, bad_response_indices, output_model, stats, metrics
+    )
 
+    def retry_round() -> list[int]:
+        retry_prompts = rounds.next_prompts()
+        with stage_timer(metrics, "generate"):
+            responses = generator(retry_prompts)
+        return rounds.merge(responses)
 
-def generate_batch(
-    batch_inputs: list[X],
+    policy = retry_policy(retry_rounds, retry_backoff, lambda: rounds.remaining)
+    with stage_timer(metrics, "retry"):
+        Retrying(**policy)(retry_round)
+    return rounds.remaining
+
+
+async def aretry_completion(
+    prompts: list[str],
+    outputs: list[Y],
+    bad_response_indices: list[int],
     output_model: type[Y],
-    generator: Callable[[list[str]], list[str]],
-) -> list[Y]:
-    batch_user_prompts = [input_model.to_prompt() for input_model in batch_inputs]
-    responses = generator(batch_user_prompts)
+    generator: AsyncBatchGenerator,
+    *,
+    retry_rounds: int = 10,
+    retry_backoff: float = 0.0,
+    stats: Optional[GenerationStats] = None,
+    metrics: Optional[RunMetrics] = None,
+) -> list[int]:
+    if not bad_response_indices or retry_rounds < 1:
+        return bad_response_indices
+    rounds = _RetryRounds(
+        prompts, outputs, bad_response_indices, output_model, stats, metrics
+    )
 
-    outputs: list[Y] = []
+    async def retry_round() -> list[int]:
+        retry_prompts = rounds.next_prompts()
+        with stage_timer(metrics, "generate"):
+            responses = await generator(retry_prompts)
+        return rounds.merge(responses)
 
-    # for each response attempt to parse to output model
-    # if parsing fails, retry the completion
+    policy = retry_policy(retry_rounds, retry_backoff, lambda: rounds.remaining)
+    with stage_timer(metrics, "retry"):
+        await AsyncRetrying(**policy)(retry_round)
+    return rounds.remaining
+
+
+def parse_response(response: str, output_model: type[Y]) -> tuple[Y, bool]:
+    """Parses one response, repairing its JSON if it fails to validate.
+
+    Returns the output and whether a repair was needed. Raises the original
+    ValidationError when the response cannot be salvaged.
+    """
+    try:
+        return output_model.model_validate_json(response), False
+    except ValidationError as e:
+        repaired = repair_json(response)
+        if repaired is None or repaired == response:
+            raise
+        try:
+            return output_model.model_validate_json(repaired), True
+        except ValidationError:
+            raise e from None
+
+
+def response_is_valid(response: str, output_model: type[Y]) -> bool:
+    try:
+        parse_response(response, output_model)
+    except ValidationError:
+        return False
+    return True
+
+
+def empty_output(output_model: type[Y]) -> Y:
+    """Returns `output_model.empty()`, one shared instance for frozen models.
+
+    Mutable outputs get a fresh placeholder every time, since a caller may
+    change one of them in place.
+    """
+    if output_model.model_config.get("frozen"):
+        return _shared_empty(output_model)
+    return output_model.empty()
+
+
+@lru_cache(maxsize=None)
+def _shared_empty(output_model: type[Y]) -> Y:
+    return output_model.empty()
+
+
+def parse_responses(
+    responses: list[str],
+    output_model: type[Y],
+    stats: Optional[GenerationStats] = None,
+) -> tuple[list[Y], list[int]]:
+    """Parses responses into output models.
+
+    Returns the parsed outputs, with `empty()` placeholders for responses
+    that failed validation even after `repair_json`, and the indices of
+    those bad responses.
+    """
+    outputs: list[Y] = []
     bad_response_indices: list[int] = []
+    repaired = 0
     for i, response in enumerate(responses):
         try:
-            output = output_model.model_validate_json(response)
+            output, was_repaired = parse_response(response, output_model)
             outputs.append(output)
+            repaired += was_repaired
         except ValidationError as e:
-            logging.error(f"Failed to parse response: {e}")
+            # Formatting a ValidationError is costly, leave it to the logger
+            logger.error("Failed to parse response: %s", e)
             bad_response_indices.append(i)
-            outputs.append(output_model.empty())
+            outputs.append(empty_output(output_model))
+
+    if stats is not None:
+        stats.repaired_responses += repaired
+    return outputs, bad_response_indices
+
+
+def lookup_responses(
+    cache: Optional[ResponseCache], prompts: list[str]
+) -> tuple[list[Optional[str]], list[int]]:
+    """Returns the cached responses and the indices that still need one."""
+    if cache is None:
+        return [None] * len(prompts), list(range(len(prompts)))
+
+    responses = cache.get_many(prompts)
+    return responses, [i for i, response in enumerate(responses) if response is None]
+
+
+def store_responses(
+    cache: Optional[ResponseCache],
+    prompts: list[str],
+    outputs: list[Y],
+    generated_indices: list[int],
+    bad_response_indices: list[int],
+):
+    """Caches the validated outputs of the prompts that were (re)generated."""
+    if cache is None:
+        return
+
+    bad = set(bad_response_indices)
+    good = [i for i in generated_indices if i not in bad]
+    cache.put_many(
+        [prompts[i] for i in good], [outputs[i].model_dump_json() for i in good]
+    )
+
+
+def dedupe_prompts(prompts: list[str]) -> tuple[list[str], list[int]]:
+    """Collapses identical prompts.
+
+    Returns the unique prompts and, for each original prompt, the index of
+    its unique prompt.
+    """
+    unique: dict[str, int] = {}
+    positions = [unique.setdefault(prompt, len(unique)) for prompt in prompts]
+    return list(unique), positions
+
+
+# Index of an input to generate, its prompt's hash, and the future of its output
+Claim = tuple[int, bytes, Future]
+
+
+class RunDedupe:
+    """Shares outputs between identical prompts across the batches of a run.
+
+    Remembers the last `window` distinct prompts of the run by hash, each
+    with its output or, while its batch is running, a future of it. A batch
+    is split into the inputs it still has to generate and the ones whose
+    output another batch already has or will have. Duplicates within the
+    batch are left with the inputs to generate, `generate_batch` collapses
+    those itself.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._entries: OrderedDict[bytes, Any] = OrderedDict()
+
+    def split(
+        self, batch: list[tuple[int, X]]
+    ) -> tuple[list[tuple[int, X]], list[Claim], list[tuple[int, X, Any]]]:
+        """Returns the inputs to generate, the futures of their outputs to
+        resolve, and the other inputs with their output or a future of it."""
+        prompts = InputModel.render_many([input_model for _, input_model in batch])
+        fresh: list[tuple[int, X]] = []
+        claims: list[Claim] = []
+        shared: list[tuple[int, X, Any]] = []
+        claimed: set[bytes] = set()
+        for (position, input_model), prompt in zip(batch, prompts):
+            key = hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+            entry = self._entries.get(key)
+            if entry is not None and key not in claimed:
+                self._entries.move_to_end(key)
+                shared.append((position, input_model, entry))
+                continue
+
+            if entry is None:
+                future: Future = Future()
+                self._entries[key] = future
+                claims.append((len(fresh), key, future))
+                claimed.add(key)
+                if len(self._entries) > self.window:
+                    self._entries.popitem(last=False)
+            fresh.append((position, input_model))
+        return fresh, claims, shared
+
+    def resolve(self, claims: list[Claim], outputs: list[Y]):
+        """Hands the outputs of a batch to the batches waiting on them."""
+        for index, key, future in claims:
+            future.set_result(outputs[index])
+            # Once done, the output is kept rather than its future
+            if self._entries.get(key) is future:
+                self._entries[key] = outputs[index]
+
+    def cancel(self, claims: list[Claim]):
+        """Forgets the prompts of a batch that failed, cancelling its waiters."""
+        for _, key, future in claims:
+            if future.cancel() and self._entries.get(key) is future:
+                del self._entries[key]
+
+
+def split_batch(
+    run_dedupe: Optional[RunDedupe], batch: list[tuple[int, X]]
+) -> tuple[list[tuple[int, X]], list[Claim], list[tuple[int, X, Any]]]:
+    if run_dedupe is None:
+        return batch, [], []
+    return run_dedupe.split(batch)
+
+
+def count_shared(
+    stats: GenerationStats, metrics: Optional[RunMetrics], shared: list
+) -> list[tuple[int, X]]:
+    """Counts the inputs answered by another batch, returns them."""
+    if shared:
+        shared_stats = GenerationStats(
+            inputs=len(shared), duplicate_prompts=len(shared)
+        )
+        stats.add(shared_stats)
+        if metrics is not None:
+            metrics.add_stats(shared_stats)
+    return [(position, input_model) for position, input_model, _ in shared]
+
+
+def reject_streaming(generator: Callable):
+    if is_streaming(generator):
+        raise TypeError(
+            "Streaming generators are async, use agenerate_batch or "
+            "agenerate_and_save with them"
+        )
+
+
+@dataclass
+class _PendingBatch:
+    """The unique prompts of a batch and their responses so far."""
+
+    prompts: list[str]
+    # Index into `prompts` of each input
+    positions: list[int]
+    responses: list[Optional[str]]
+    # Indices of the prompts without a cached response
+    missing: list[int]
+
+
+def _start_batch(
+    batch_inputs: list[X],
+    cache: Optional[ResponseCache],
+    dedupe: bool,
+    stats: GenerationStats,
+    metrics: Optional[RunMetrics],
+) -> _PendingBatch:
+    with stage_timer(metrics, "render"):
+        prompts, positions = prepare_prompts(batch_inputs, dedupe, stats)
+    # only the prompts missing from the cache are sent to the generator
+    with stage_timer(metrics, "cache_lookup"):
+        responses, missing = lookup_responses(cache, prompts)
+    return _PendingBatch(prompts, positions, responses, missing)
+
+
+def _parse_batch(
+    pending: _PendingBatch,
+    generated: list[str],
+    output_model: type[Y],
+    stats: GenerationStats,
+    metrics: Optional[RunMetrics],
+) -> tuple[list[Y], list[int]]:
+    """Parses the cached and generated responses, returns the bad indices too."""
+    for i, response in zip(pending.missing, generated):
+        pending.responses[i] = response
+    with stage_timer(metrics, "parse"):
+        outputs, bad_response_indices = parse_responses(
+            pending.responses, output_model, stats
+        )
 
     for i in bad_response_indices:
-        logging.warning(f"Bad response for prompt: {batch_user_prompts[i]}")
-        outputs[i] = retry_completion(batch_inputs[i], output_model, generator)
+        logger.warning("Bad response for prompt: %s", pending.prompts[i])
+    return outputs, bad_response_indices
+
+
+def _end_batch(
+    pending: _PendingBatch,
+    outputs: list[Y],
+    bad_response_indices: list[int],
+    remaining: list[int],
+    cache: Optional[ResponseCache],
+    stats: GenerationStats,
+    metrics: Optional[RunMetrics],
+) -> list[Y]:
+    """Caches and counts the batch once retried, returns one output per input."""
+    generated_indices = sorted(set(pending.missing).union(bad_response_indices))
+    with stage_timer(metrics, "cache_store"):
+        store_responses(cache, pending.prompts, outputs, generated_indices, remaining)
+    count_batch(
+        stats,
+        pending.responses,
+        pending.missing,
+        bad_response_indices,
+        remaining,
+        pending.prompts,
+    )
+    return [outputs[i] for i in pending.positions]
+
 
-    return outputs
+def generate_batch(
+    batch_inputs: list[X],
+    output_model: type[Y],
+    generator: BatchGenerator,
+    *,
+    retry_rounds: int = 10,
+    retry_backoff: float = 0.0,
+    cache: Optional[ResponseCache] = None,
+    dedupe: bool = True,
+    stats: Optional[GenerationStats] = None,
+    metrics: Optional[RunMetrics] = None,
+) -> list[Y]:
+    """Generates one output per input.
+
+    Identical prompts are sent once and their output is shared by every
+    input that rendered to them, unless `dedupe` is off. Counts are added to
+    `stats` and stage timings to `metrics` when given.
+
+    The prompts sent to `generator` are `SplitPrompt`s, which prefix-aware
+    backends can use to reuse the static part of the template. A generator
+    marked with `schema_guided` also gets the output model's response format.
+    """
+    stats = stats if stats is not None else GenerationStats()
+    reject_streaming(generator)
+    generator = bind_response_format(generator, output_model)
+    pending = _start_batch(batch_inputs, cache, dedupe, stats, metrics)
+    generated: list[str] = []
+    if pending.missing:
+        with stage_timer(metrics, "generate"):
+            generated = generator([pending.prompts[i] for i in pending.missing])
+
+    # for each response attempt to parse to output model
+    # if parsing fails, retry the bad completions together
+    outputs, bad_response_indices = _parse_batch(
+        pending, generated, output_model, stats, metrics
+    )
+    remaining = retry_completion(
+        pending.prompts,
+        outputs,
+        bad_response_indices,
+        output_model,
+        generator,
+        retry_rounds=retry_rounds,
+        retry_backoff=retry_backoff,
+        stats=stats,
+        metrics=metrics,
+    )
+    return _end_batch(
+        pending, outputs, bad_response_indices, remaining, cache, stats, metrics
+    )
+
+
+async def agenerate_batch(
+    batch_inputs: list[X],
+    output_model: type[Y],
+    generator: AsyncBatchGenerator,
+    *,
+    retry_rounds: int = 10,
+    retry_backoff: float = 0.0,
+    cache: Optional[ResponseCache] = None,
+    dedupe: bool = True,
+    stats: Optional[GenerationStats] = None,
+    metrics: Optional[RunMetrics] = None,
+) -> list[Y]:
+    stats = stats if stats is not None else GenerationStats()
+    if is_streaming(generator):
+        generator = StreamedGenerator(generator, output_model)
+    generator = bind_response_format(generator, output_model)
+    pending = _start_batch(batch_inputs, cache, dedupe, stats, metrics)
+    generated: list[str] = []
+    if pending.missing:
+        with stage_timer(metrics, "generate"):
+            generated = await generator([pending.prompts[i] for i in pending.missing])
+
+    outputs, bad_response_indices = _parse_batch(
+        pending, generated, output_model, stats, metrics
+    )
+    remaining = await aretry_completion(
+        pending.prompts,
+        outputs,
+        bad_response_indices,
+        output_model,
+        generator,
+        retry_rounds=retry_rounds,
+        retry_backoff=retry_backoff,
+        stats=stats,
+        metrics=metrics,
+    )
+    return _end_batch(
+        pending, outputs, bad_response_indices, remaining, cache, stats, metrics
+    )
+
+
+def prepare_prompts(
+    batch_inputs: list[X], dedupe: bool, stats: GenerationStats
+) -> tuple[list[str], list[int]]:
+    prompts = InputModel.render_many(batch_inputs, split=True)
+    stats.inputs += len(prompts)
+    if not dedupe:
+        return prompts, list(range(len(prompts)))
+
+    unique_prompts, positions = dedupe_prompts(prompts)
+    duplicates = len(prompts) - len(unique_prompts)
+    if duplicates:
+        logger.info(f"Collapsed {duplicates} duplicate prompts in batch")
+        stats.duplicate_prompts += duplicates
+    return unique_prompts, positions
+
+
+def count_batch(
+    stats: GenerationStats,
+    responses: list[str],
+    missing: list[int],
+    bad_response_indices: list[int],
+    remaining: list[int],
+    prompts: list[str],
+):
+    stats.empty_responses += sum(1 for i in missing if not responses[i].strip())
+    stats.generated_prompts += len(missing)
+    stats.cached_prompts += len(prompts) - len(missing)
+    stats.bad_responses += len(bad_response_indices)
+    stats.failed_prompts += len(remaining)
+
+
+def write_records(sink: Sink, batch: list[X], outputs: list[Y]):
+    # Dumps are only serialized for the records that get logged, and then by
+    # the logging thread, see `configure_logging`
+    if records_logger.isEnabledFor(logging.INFO):
+        for input_model, output in zip(batch, outputs):
+            records_logger.info(
+                "Input: %s\nOutput: %s",
+                RecordDump(input_model, exclude={"input_prompt"}),
+                RecordDump(output),
+            )
+
+    sink.write(batch, outputs)
+
+
+def resolve_total(inputs: Iterable[X], total: Optional[int]) -> Optional[int]:
+    if total is None and isinstance(inputs, Sized):
+        total = len(inputs)
+    if total is not None:
+        logger.info(f"Number of inputs: {total}")
+    return total
+
+
+def open_output(
+    inputs: Iterable[X], output_file: Union[str, Sink, None], resume: bool
+) -> tuple[Iterable[X], ContextManager[Sink], int]:
+    """Opens the output sink.
+
+    Returns the inputs left to run, the sink to write them to and the number
+    of inputs skipped because `resume` found them in `output_file`. Sinks
+    passed in by the caller are flushed but not closed.
+    """
+    if isinstance(output_file, Sink):
+        if resume:
+            raise ValueError("resume needs an output file path, not a Sink")
+        return inputs, _flushing(output_file), 0
+
+    output_file = output_file or f"outputs_{new_run_id()}.jsonl"
+    if not resume or not os.path.exists(output_file):
+        return inputs, open_sink(output_file), 0
+
+    if output_file.endswith((".parquet", *COMPRESSION_SUFFIXES)):
+        raise ValueError("resume is only supported for uncompressed JSONL files")
+
+    completed = load_completed(output_file)
+    skipped = sum(completed.values())
+    logger.info(f"Resuming {output_file}: {skipped} records already completed")
+
+    return skip_completed(inputs, completed), open_sink(output_file, "a"), skipped
+
+
+@contextmanager
+def _flushing(sink: Sink) -> Iterator[Sink]:
+    try:
+        yield sink
+    finally:
+        sink.flush()
+
+
+def make_batches(
+    inputs: Iterable[X],
+    batch_size: int,
+    controller: Optional[AdaptiveController],
+    max_batch_tokens: Optional[int],
+    count_tokens: Optional[TokenCounter],
+    lookahead: int,
+) -> Iterator[list[tuple[int, X]]]:
+    """Splits inputs into batches of `(position, input)` pairs."""
+    size: Union[int, Callable[[], int]] = batch_size
+    if controller is not None:
+        size = lambda: controller.batch_size
+
+    if max_batch_tokens is None:
+        return batched(enumerate(inputs), size)
+    return pack_batches(
+        inputs,
+        max_batch_tokens,
+        count_tokens=count_tokens,
+        max_batch_size=size,
+        lookahead=lookahead,
+    )
+
+
+def write_in_order(
+    sink: Sink,
+    reorder: ReorderBuffer[tuple[X, Y]],
+    batch: list[tuple[int, X]],
+    outputs: list[Y],
+    metrics: Optional[RunMetrics] = None,
+) -> int:
+    """Writes the records that are next in input order, returns their count."""
+    ready: list[tuple[X, Y]] = []
+    for (position, input_model), output in zip(batch, outputs):
+        ready.extend(reorder.push(position, (input_model, output)))
+    if ready:
+        with stage_timer(metrics, "write"):
+            write_records(
+                sink,
+                [input_model for input_model, _ in ready],
+                [output for _, output in ready],
+            )
+        if metrics is not None:
+            metrics.count("records_written", len(ready))
+    return len(ready)
+
+
+def _finish_batch(
+    latency: float,
+    batch_stats: GenerationStats,
+    stats: GenerationStats,
+    controller: Optional[AdaptiveController],
+    metrics: Optional[RunMetrics],
+):
+    """Adds a finished batch to the run's stats, metrics and controller."""
+    if controller is not None:
+        controller.record(latency, batch_stats)
+    stats.add(batch_stats)
+    if metrics is not None:
+        metrics.observe("batch", latency)
+        metrics.add_stats(batch_stats)
+
+
+def _wrapper_counts(
+    breaker: Optional[CircuitBreaker],
+    hedged: Optional[HedgedGenerator] = None,
+    streamed: Optional[StreamedGenerator] = None,
+) -> dict[str, int]:
+    """The counters of the generator wrappers in use, by stats field."""
+    counts: dict[str, int] = {}
+    if streamed is not None:
+        counts["aborted_responses"] = streamed.aborted
+    if hedged is not None:
+        counts["hedged_requests"] = hedged.hedges
+    if breaker is not None:
+        counts["breaker_trips"] = breaker.trips
+        counts["requeued_prompts"] = breaker.requeued
+    return counts
+
+
+def _collect_wrapper_counts(
+    stats: GenerationStats,
+    metrics: Optional[RunMetrics],
+    before: dict[str, int],
+    after: dict[str, int],
+):
+    """Adds what the wrappers counted during the run to `stats` and `metrics`."""
+    for name, count in after.items():
+        delta = count - before.get(name, 0)
+        setattr(stats, name, getattr(stats, name) + delta)
+        if metrics is not None:
+            metrics.count(name, delta)
+
+
+def log_run(stats: GenerationStats, metrics: Optional[RunMetrics]):
+    logger.info(f"Run stats: {stats.to_dict()}")
+    if metrics is not None:
+        logger.info(f"Run metrics: {metrics.summary()}")
 
 
 def generate_and_save(
     *,
-    inputs: list[X],
+    inputs: Iterable[X],
     output_model: type[Y],
-    generator: Callable[[list[str]], list[str]],
+    generator: BatchGenerator,
     batch_size: int = 4,
-    output_file: Optional[str] = None,
+    output_file: Union[str, Sink, None] = None,
+    total: Optional[int] = None,
+    resume: bool = False,
+    retry_rounds: int = 10,
+    retry_backoff: float = 0.0,
+    cache: Optional[ResponseCache] = None,
+    dedupe: bool = True,
+    dedupe_window: int = 10_000,
+    stats: Optional[GenerationStats] = None,
+    controller: Optional[AdaptiveController] = None,
+    max_batch_tokens: Optional[int] = None,
+    count_tokens: Optional[TokenCounter] = None,
+    lookahead: int = 1,
+    breaker: Optional[CircuitBreaker] = None,
+    metrics: Optional[RunMetrics] = None,
 ):
-    batch_inputs = [
-        inputs[i : i + batch_size] for i in range(0, len(inputs), batch_size)
-    ]
-
-    logging.info(f"Number of batches: {len(batch_inputs)}")
-
-    output_file = output_file or f"outputs_{run_id}.jsonl"
-    with open(output_file, "w") as f:
-        for batch in tqdm(
-            batch_inputs,
-            total=len(batch_inputs),
-            desc="Generating outputs for batch",
-        ):
-            outputs = generate_batch(batch, output_model, generator)
+    """Generates outputs for `inputs` and writes them to `output_file`.
+
+    `output_file` is either a path or a `Sink`. Paths ending in `.gz` or
+    `.zst` are written as compressed JSONL and `.parquet` paths as Parquet;
+    anything else is plain JSONL.
 
-            for input_prompt, output in zip(batch, outputs):
-                logging.info(
-                    "Input: "
-                    + input_prompt.model_dump_json(exclude={"input_prompt"}, indent=2)
+    `inputs` may be any iterable, including a generator reading from disk; it
+    is consumed lazily one batch at a time. `total` is only used as a hint for
+    the progress bar when `inputs` has no length.
+
+    With `resume=True` an existing `output_file` is appended to instead of
+    overwritten, and inputs that already have a record in it are skipped.
+
+    Responses that fail validation are retried in up to `retry_rounds` rounds,
+    see `retry_completion`. When a `cache` is given, prompts with a cached
+    response are not sent to the generator, and new valid outputs are cached.
+    Duplicate prompts are only generated once (`dedupe`), within a batch
+    and across batches for the last `dedupe_window` distinct prompts of the
+    run, whose outputs are kept in memory for that.
+    Counts for the whole run are collected in `stats` and logged at the end.
+
+    With a `controller`, the batch size is no longer fixed but adjusted after
+    every batch, see `AdaptiveController`.
+
+    With `max_batch_tokens`, batches are packed by prompt size rather than
+    count, with `batch_size` only capping the number of inputs per batch.
+    Sizes come from `count_tokens`, or a character-based estimate. A
+    `lookahead` above 1 sorts that many inputs by size before packing them;
+    records are still written in input order. See `pack_batches`.
+
+    With a `breaker`, a backend outage pauses the run with a growing backoff
+    instead of burning through the retries, and the prompts that failed
+    during the outage are sent again once it is over, see `CircuitBreaker`.
+
+    With `metrics`, every stage of the run is timed and counted, see
+    `RunMetrics`; its summary is logged at the end next to the stats.
+    """
+    total = resolve_total(inputs, total)
+    stats = stats if stats is not None else GenerationStats()
+
+    reject_streaming(generator)
+    inputs, output, skipped = open_output(inputs, output_file, resume)
+    generator = bind_response_format(generator, output_model)
+    if breaker is not None:
+        generator = breaker.guard(generator)
+    before = _wrapper_counts(breaker)
+    run_dedupe = RunDedupe(dedupe_window) if dedupe and dedupe_window > 0 else None
+
+    with output as sink, tqdm(
+        total=total,
+        initial=skipped,
+        desc="Generating outputs",
+        unit="input",
+    ) as progress:
+        reorder: ReorderBuffer[tuple[X, Y]] = ReorderBuffer()
+        for batch in make_batches(
+            inputs, batch_size, controller, max_batch_tokens, count_tokens, lookahead
+        ):
+            fresh, claims, shared = split_batch(run_dedupe, batch)
+            outputs: list[Y] = []
+            if fresh:
+                batch_stats = GenerationStats()
+                start = time.monotonic()
+                outputs = generate_batch(
+                    [input_model for _, input_model in fresh],
+                    output_model,
+                    generator,
+                    retry_rounds=retry_rounds,
+                    retry_backoff=retry_backoff,
+                    cache=cache,
+                    dedupe=dedupe,
+                    stats=batch_stats,
+                    metrics=metrics,
+                )
+                _finish_batch(
+                    time.monotonic() - start, batch_stats, stats, controller, metrics
                 )
-                logging.info(f"Output: {output.model_dump_json(indent=2)}")
+                if run_dedupe is not None:
+                    run_dedupe.resolve(claims, outputs)
 
-                record = {
-                    "input": input_prompt.model_dump(exclude={"input_prompt"}),
-                    "output": output.model_dump(),
-                }
+            # Earlier batches are done, so every shared output is there
+            outputs += [
+                entry.result() if isinstance(entry, Future) else entry
+                for *_, entry in shared
+            ]
+            records = fresh + count_shared(stats, metrics, shared)
+            progress.update(write_in_order(sink, reorder, records, outputs, metrics))
+
+    _collect_wrapper_counts(stats, metrics, before, _wrapper_counts(breaker))
+    log_run(stats, metrics)
+
+
+async def agenerate_and_save(
+    *,
+    inputs: Iterable[X],
+    output_model: type[Y],
+    generator: AsyncBatchGenerator,
+    batch_size: int = 4,
+    max_concurrency: int = 8,
+    output_file: Union[str, Sink, None] = None,
+    total: Optional[int] = None,
+    resume: bool = False,
+    retry_rounds: int = 10,
+    retry_backoff: float = 0.0,
+    cache: Optional[ResponseCache] = None,
+    dedupe: bool = True,
+    dedupe_window: int = 10_000,
+    stats: Optional[GenerationStats] = None,
+    controller: Optional[AdaptiveController] = None,
+    max_batch_tokens: Optional[int] = None,
+    count_tokens: Optional[TokenCounter] = None,
+    lookahead: int = 1,
+    hedge: Optional[HedgePolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    metrics: Optional[RunMetrics] = None,
+):
+    """Async counterpart of `generate_and_save`.
+
+    Runs every batch on a single event loop and keeps up to `max_concurrency`
+    batches in flight at once, so a slow batch does not stall the ones behind
+    it. Outputs are still written in input order. Inputs are read lazily, so
+    at most `2 * max_concurrency` batches are held in memory. A `controller`
+    adjusts both the batch size and the concurrency, within its own bounds.
+
+    With a `hedge` policy, every prompt is sent as its own request and
+    stragglers get a speculative duplicate, see `HedgedGenerator`; combine
+    it with a small `batch_size` so a batch does not wait on its slowest item.
+    A `generator` marked with `streaming` yields every response in chunks
+    and is cut off as soon as the response is clearly invalid, so its retry
+    starts without waiting for the rest, see `StreamedGenerator`.
+    The remaining options work as in `generate_and_save`.
+    """
+    total = resolve_total(inputs, total)
+    stats = stats if stats is not None else GenerationStats()
+
+    inputs, output, skipped = open_output(inputs, output_file, resume)
+    streamed: Optional[StreamedGenerator] = None
+    if is_streaming(generator):
+        streamed = StreamedGenerator(generator, output_model)
+        generator = streamed
+    generator = bind_response_format(generator, output_model)
+
+    hedged: Optional[HedgedGenerator] = None
+    if hedge is not None:
+        hedged = HedgedGenerator(
+            generator, hedge, lambda response: response_is_valid(response, output_model)
+        )
+        generator = hedged
+    if breaker is not None:
+        generator = breaker.aguard(generator)
+    before = _wrapper_counts(breaker)
+
+    if controller is None:
+        limiter = asyncio.Semaphore(max_concurrency)
+    else:
+        limiter = ConcurrencyLimiter(controller)
+        max_concurrency = controller.max_concurrency
+
+    run_dedupe = RunDedupe(dedupe_window) if dedupe and dedupe_window > 0 else None
+
+    async def run_batch(
+        fresh: list[tuple[int, X]], claims: list[Claim], shared: list
+    ) -> list[Y]:
+        outputs: list[Y] = []
+        if fresh:
+            try:
+                async with limiter:
+                    batch_stats = GenerationStats()
+                    start = time.monotonic()
+                    outputs = await agenerate_batch(
+                        [input_model for _, input_model in fresh],
+                        output_model,
+                        generator,
+                        retry_rounds=retry_rounds,
+                        retry_backoff=retry_backoff,
+                        cache=cache,
+                        dedupe=dedupe,
+                        stats=batch_stats,
+                        metrics=metrics,
+                    )
+                    _finish_batch(
+                        time.monotonic() - start,
+                        batch_stats,
+                        stats,
+                        controller,
+                        metrics,
+                    )
+            except BaseException:
+                if run_dedupe is not None:
+                    run_dedupe.cancel(claims)
+                raise
+            if run_dedupe is not None:
+                run_dedupe.resolve(claims, outputs)
+
+        # Outputs of earlier batches still running are waited for outside
+        # the limiter, so those batches can take its slots
+        for *_, entry in shared:
+            if isinstance(entry, Future):
+                entry = await asyncio.wrap_future(entry)
+            outputs.append(entry)
+        return outputs
+
+    # Batches are scheduled ahead of the one being written so the limiter
+    # always has queued work; the window bounds how far ahead we read.
+    window = 2 * max_concurrency
+    pending: deque[tuple[list[tuple[int, X]], asyncio.Task[list[Y]]]] = deque()
+    reorder: ReorderBuffer[tuple[X, Y]] = ReorderBuffer()
+
+    with output as sink, tqdm(
+        total=total,
+        initial=skipped,
+        desc="Generating outputs",
+        unit="input",
+    ) as progress:
+
+        async def write_next():
+            batch, task = pending.popleft()
+            outputs = await task
+            progress.update(write_in_order(sink, reorder, batch, outputs, metrics))
+
+        try:
+            for batch in make_batches(
+                inputs,
+                batch_size,
+                controller,
+                max_batch_tokens,
+                count_tokens,
+                lookahead,
+            ):
+                # Batches are split in input order, so a batch only ever
+                # waits on the outputs of earlier ones
+                fresh, claims, shared = split_batch(run_dedupe, batch)
+                records = fresh + count_shared(stats, metrics, shared)
+                task = asyncio.create_task(run_batch(fresh, claims, shared))
+                pending.append((records, task))
+                if len(pending) >= window:
+                    await write_next()
 
-                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            while pending:
+                await write_next()
+        finally:
+            for _, task in pending:
+                task.cancel()
 
-            f.flush()
+    _collect_wrapper_counts(
+        stats, metrics, before, _wrapper_counts(breaker, hedged, streamed)
+    )
+    log_run(stats, metrics)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Optional
+
+from json_generator.protocols import AsyncBatchGenerator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HedgePolicy:
+    """When to send a speculative duplicate of an outstanding prompt.
+
+    A prompt still outstanding after the `percentile` latency of the last
+    `window` requests is sent again, and whichever valid response arrives
+    first wins. Hedges are capped at `max_extra_fraction` of the prompts
+    sent, and only start once `min_samples` latencies have been seen.
+    """
+
+    percentile: float = 0.95
+    max_extra_fraction: float = 0.05
+    min_samples: int = 20
+    window: int = 1000
+
+
+class LatencyTracker:
+    """Rolling window of request latencies."""
+
+    def __init__(self, window: int = 1000):
+        self._latencies: deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float):
+        self._latencies.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgedGenerator:
+    """Async generator that sends every prompt on its own, with hedging.
+
+    Wraps a batch generator so that each prompt of a batch is an individual
+    request, which lets a straggler be hedged without resending the batch.
+    `is_valid` decides whether a response can win the race; when no attempt
+    is valid, the last response is returned, or "" if every attempt failed.
+    """
+
+    def __init__(
+        self,
+        generator: AsyncBatchGenerator,
+        policy: HedgePolicy,
+        is_valid: Callable[[str], bool],
+    ):
+        self.generator = generator
+        self.policy = policy
+        self.is_valid = is_valid
+        self.tracker = LatencyTracker(policy.window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def __call__(self, prompts: list[str]) -> list[str]:
+        return list(await asyncio.gather(*(self.generate(p) for p in prompts)))
+
+    def hedge_delay(self) -> Optional[float]:
+        if len(self.tracker) < self.policy.min_samples:
+            return None
+        return self.tracker.percentile(self.policy.percentile)
+
+    def _can_hedge(self) -> bool:
+        return self.hedges < self.policy.max_extra_fraction * self.requests
+
+    async def _request(self, prompt: str) -> Optional[str]:
+        """Returns the response, or None if the generator failed."""
+        start = time.monotonic()
+        try:
+            response = (await self.generator([prompt]))[0]
+        except asyncio.CancelledError:
+            # A straggler took at least this long, leaving it out would pull
+            # the percentile down and make hedging ever more aggressive
+            self.tracker.record(time.monotonic() - start)
+            raise
+        except Exception as e:
+            logger.error("Generator failed: %r", e)
+            return None
+        self.tracker.record(time.monotonic() - start)
+        return response
+
+    async def generate(self, prompt: str) -> str:
+        self.requests += 1
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self._request(prompt))
+        attempts = {primary}
+        delay = self.hedge_delay()
+        response = ""
+        try:
+            # A failed attempt does not answer the prompt, so the hedge is
+            # still sent on time even if the primary failed first
+            while attempts or delay is not None:
+                timeout = None
+                if delay is not None:
+                    timeout = max(0.0, start + delay - time.monotonic())
+                if attempts:
+                    done, attempts = await asyncio.wait(
+                        attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                    )
+                else:
+                    await asyncio.sleep(timeout)
+                    done = set()
+                if not done:
+                    # Hedge at most once per prompt
+                    delay = None
+                    if self._can_hedge():
+                        self.hedges += 1
+                        attempts.add(asyncio.ensure_future(self._request(prompt)))
+                    continue
+
+                for attempt in done:
+                    result = attempt.result()
+                    if result is None:
+                        continue
+                    response = result
+                    if self.is_valid(response):
+                        self.hedge_wins += attempt is not primary
+                        return response
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+        return response
@@ -0,0 +1,245 @@
+import bz2
+import csv
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from typing import IO, Any, Literal, Optional, TypeVar
+
+from pydantic import TypeAdapter, ValidationError
+
+from json_generator.data_module import InputModel
+
+logger = logging.getLogger(__name__)
+
+X = TypeVar("X", bound=InputModel)
+
+InputFormat = Literal["jsonl", "csv", "tsv"]
+
+FORMAT_SUFFIXES: dict[str, InputFormat] = {
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".csv": "csv",
+    ".tsv": "tsv",
+}
+
+
+@dataclass
+class BadRow:
+    """A row that could not be parsed or failed validation."""
+
+    path: str
+    # Line of the row in the file, 1-based
+    line: int
+    row: Any
+    error: str
+
+
+def open_text(path: str) -> IO[str]:
+    """Opens `path` for reading text, decompressing it by its suffix."""
+    suffix = os.path.splitext(path)[1]
+    if suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    if suffix == ".bz2":
+        return bz2.open(path, "rt", encoding="utf-8", newline="")
+    if suffix == ".xz":
+        return lzma.open(path, "rt", encoding="utf-8", newline="")
+    if suffix == ".zst":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                "zstd compressed inputs require the `zstandard` package"
+            ) from e
+        return io.TextIOWrapper(
+            zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True),
+            encoding="utf-8",
+            newline="",
+        )
+    return open(path, encoding="utf-8", newline="")
+
+
+def detect_format(path: str) -> InputFormat:
+    root, suffix = os.path.splitext(path)
+    if suffix in (".gz", ".bz2", ".xz", ".zst"):
+        suffix = os.path.splitext(root)[1]
+    if suffix not in FORMAT_SUFFIXES:
+        raise ValueError(f"Cannot tell the format of {path}, pass `format`")
+    return FORMAT_SUFFIXES[suffix]
+
+
+def field_keys(
+    input_model: type[InputModel], columns: Optional[dict[str, str]] = None
+) -> dict[str, str]:
+    """Maps the column names that differ from a field name to that field.
+
+    A field can be given by its alias or its placeholder, or by any column
+    that `columns` maps to it.
+    """
+    keys: dict[str, str] = {}
+    for name, field in input_model.model_fields.items():
+        for key in (field.alias, field.serialization_alias):
+            if key and key != name:
+                keys[key] = name
+    keys.update(columns or {})
+    return keys
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(input_model: type[X]) -> TypeAdapter:
+    return TypeAdapter(list[input_model])
+
+
+def read_lines(f: IO[str], chunk_size: int) -> Iterator[list[tuple[int, str]]]:
+    """Yields chunks of `(line number, line)`, skipping blank lines."""
+    lines = enumerate(f, start=1)
+    while chunk := list(islice(lines, chunk_size)):
+        yield [(i, line) for i, line in chunk if line.strip()]
+
+
+def validate_lines(
+    adapter: TypeAdapter,
+    path: str,
+    chunk: list[tuple[int, str]],
+    keys: dict[str, str],
+    on_error: Callable[[BadRow], None],
+) -> list:
+    """Parses and validates a chunk of JSONL lines, leaving out bad rows."""
+    text = "[" + ",".join(line for _, line in chunk) + "]"
+    # Without renamed keys anywhere in the chunk, pydantic can parse and
+    # validate it in one call; a malformed line could still join into valid
+    # JSON with its neighbours, hence the count check
+    if not any(json.dumps(key) in text for key in keys):
+        try:
+            batch = adapter.validate_json(text)
+            if len(batch) == len(chunk):
+                return batch
+        except ValidationError:
+            pass
+
+    parsed: list[tuple[int, Any]] = []
+    for i, line in chunk:
+        try:
+            parsed.append((i, json.loads(line)))
+        except json.JSONDecodeError as e:
+            on_error(BadRow(path, i, line, f"Invalid JSON: {e}"))
+    rows = [rename_keys(row, keys) for _, row in parsed]
+    return validate_rows(adapter, path, parsed, rows, on_error)
+
+
+def read_csv_rows(
+    f: IO[str], chunk_size: int, delimiter: str
+) -> Iterator[list[tuple[int, dict]]]:
+    """Yields chunks of `(line, row)`; empty cells are left out of the row."""
+    reader = csv.reader(f, delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    records = ((reader.line_num, values) for values in reader)
+    while chunk := list(islice(records, chunk_size)):
+        yield [
+            (line, {key: value for key, value in zip(header, values) if value != ""})
+            for line, values in chunk
+        ]
+
+
+def load_batches(
+    path: str,
+    input_model: type[X],
+    *,
+    batch_size: int = 1024,
+    columns: Optional[dict[str, str]] = None,
+    format: Optional[InputFormat] = None,
+    on_error: Optional[Callable[[BadRow], None]] = None,
+) -> Iterator[list[X]]:
+    """Streams `path` as batches of validated `input_model`s.
+
+    Reads JSONL or CSV/TSV, plain or compressed as `.gz`, `.bz2`, `.xz` or
+    `.zst` (which needs `zstandard`); the format comes from the suffix
+    unless given. Columns are matched to fields by name, alias or
+    placeholder, and `columns` maps any other column name to a field.
+
+    Rows are read and validated `batch_size` at a time, so only one batch
+    is in memory. Rows that are not valid JSON or fail validation are
+    passed to `on_error`, logged by default, and left out; a batch can
+    therefore be shorter than `batch_size`.
+    """
+    format = format or detect_format(path)
+    keys = field_keys(input_model, columns)
+    adapter = _list_adapter(input_model)
+    if on_error is None:
+        on_error = log_bad_row
+
+    with open_text(path) as f:
+        if format == "jsonl":
+            batches = (
+                validate_lines(adapter, path, chunk, keys, on_error)
+                for chunk in read_lines(f, batch_size)
+            )
+        else:
+            batches = (
+                validate_rows(
+                    adapter,
+                    path,
+                    chunk,
+                    [rename_keys(row, keys) for _, row in chunk],
+                    on_error,
+                )
+                for chunk in read_csv_rows(
+                    f, batch_size, "\t" if format == "tsv" else ","
+                )
+            )
+
+        for batch in batches:
+            if batch:
+                yield batch
+
+
+def load_inputs(path: str, input_model: type[X], **options: Any) -> Iterator[X]:
+    """Streams `path` one input at a time, see `load_batches`."""
+    for batch in load_batches(path, input_model, **options):
+        yield from batch
+
+
+def rename_keys(row: Any, keys: dict[str, str]) -> Any:
+    if not isinstance(row, dict) or keys.keys().isdisjoint(row):
+        return row
+    return {keys.get(key, key): value for key, value in row.items()}
+
+
+def validate_rows(
+    adapter: TypeAdapter,
+    path: str,
+    chunk: list[tuple[int, Any]],
+    rows: list[Any],
+    on_error: Callable[[BadRow], None],
+) -> list:
+    """Validates a chunk in one call, leaving out the rows that fail."""
+    try:
+        return adapter.validate_python(rows)
+    except ValidationError as e:
+        errors: dict[int, list[str]] = {}
+        for error in e.errors(include_url=False):
+            index, *loc = error["loc"]
+            errors.setdefault(index, []).append(
+                f"{'.'.join(map(str, loc)) or 'row'}: {error['msg']}"
+            )
+
+    for index, messages in errors.items():
+        line, row = chunk[index]
+        on_error(BadRow(path, line, row, "; ".join(messages)))
+    return adapter.validate_python(
+        [row for index, row in enumerate(rows) if index not in errors]
+    )
+
+
+def log_bad_row(bad_row: BadRow):
+    logger.warning(
+        "Skipping row %d of %s: %s", bad_row.line, bad_row.path, bad_row.error
+    )
@@ -0,0 +1,111 @@
+import atexit
+import datetime
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+# Every input/output record is dumped on this logger at INFO
+records_logger = logging.getLogger("json_generator.records")
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+
+
+def new_run_id() -> str:
+    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+class RecordDump:
+    """Log argument that only serializes its model when the record is emitted."""
+
+    __slots__ = ("model", "exclude")
+
+    def __init__(self, model: BaseModel, exclude: Optional[set[str]] = None):
+        self.model = model
+        self.exclude = exclude
+
+    def __str__(self) -> str:
+        return self.model.model_dump_json(exclude=self.exclude, indent=2)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through a random `rate` share of the records."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class _BackgroundQueueHandler(QueueHandler):
+    # The queue stays in process, so records are passed on unformatted and
+    # their messages, record dumps included, are rendered by the listener
+    def prepare(self, record: logging.LogRecord) -> Any:
+        return record
+
+
+def configure_logging(
+    log_dir: str = "./logs",
+    *,
+    level: int = logging.INFO,
+    log_records: bool = True,
+    record_sample_rate: float = 1.0,
+    run_id: Optional[str] = None,
+) -> str:
+    """Logs to `log_dir/run_<run_id>.log` from a background thread.
+
+    Log calls only put their record on a queue; formatting and writing
+    happen in a listener thread, which is flushed and stopped at exit.
+    Every input/output record is dumped at INFO unless `log_records` is
+    off, and only a random `record_sample_rate` share of them when below 1.
+    Calling it again replaces the previous configuration. Returns the path
+    of the log file.
+    """
+    global _listener, _handler
+    stop_logging()
+
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, f"run_{run_id or new_run_id()}.log")
+    file_handler = logging.FileHandler(log_file, mode="w", encoding="utf-8")
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    )
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _handler = _BackgroundQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, file_handler)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    records_logger.setLevel(logging.NOTSET if log_records else logging.WARNING)
+    records_logger.filters.clear()
+    if record_sample_rate < 1.0:
+        records_logger.addFilter(SamplingFilter(record_sample_rate))
+
+    return log_file
+
+
+def stop_logging():
+    """Flushes and removes the handler set up by `configure_logging`."""
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,230 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, ContextManager, Optional
+
+from json_generator.stats import GenerationStats
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from prompt rendering up to slow generator calls
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+# Called with the stage name and its duration in seconds
+StageHook = Callable[[str, float], None]
+
+
+class Histogram:
+    """Cumulative histogram over fixed bucket upper bounds."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class RunMetrics:
+    """Per-stage timings and counters for a run.
+
+    `generate_batch`, `retry_completion` and `generate_and_save` time their
+    stages into a histogram each when given a `RunMetrics`: `render`,
+    `cache_lookup`, `generate` (every generator call, retries included),
+    `parse`, `retry`, `cache_store`, `write` and `batch` for a whole batch.
+    The `GenerationStats` of every batch are added to the counters, along
+    with `records_written`.
+
+    `hooks` are called after every timed stage, for example to feed another
+    metrics system. The results can be read with `summary()`, saved with
+    `write_json()`, rendered in the Prometheus text format with
+    `to_prometheus()`, or scraped from `serve()`.
+    """
+
+    def __init__(
+        self,
+        *,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        hooks: tuple[StageHook, ...] = (),
+        namespace: str = "json_generator",
+    ):
+        self.buckets = buckets
+        self.hooks = list(hooks)
+        self.namespace = namespace
+        self.stages: dict[str, Histogram] = {}
+        self.counters: dict[str, float] = {}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        for hook in self.hooks:
+            hook(stage, seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_stats(self, stats: GenerationStats):
+        with self._lock:
+            for name, value in stats.to_dict().items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def throughput(self) -> dict[str, float]:
+        """Inputs and written records per second since the metrics started."""
+        elapsed = self.elapsed() or float("inf")
+        return {
+            "inputs_per_second": self.counters.get("inputs", 0) / elapsed,
+            "records_per_second": self.counters.get("records_written", 0) / elapsed,
+        }
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "elapsed_seconds": self.elapsed(),
+                "throughput": self.throughput(),
+                "counters": dict(self.counters),
+                "stages": {
+                    stage: histogram.to_dict()
+                    for stage, histogram in self.stages.items()
+                },
+            }
+
+    def write_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Renders the metrics in the Prometheus text exposition format."""
+        prefix = self.namespace
+        lines: list[str] = []
+        with self._lock:
+            lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+            for stage, histogram in self.stages.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}}'
+                        f" {cumulative}"
+                    )
+                lines.append(
+                    f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}}'
+                    f" {histogram.count}"
+                )
+                lines.append(
+                    f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}'
+                )
+                lines.append(
+                    f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}'
+                )
+            for name, value in self.counters.items():
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+
+            for name, value in self.throughput().items():
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9100, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serves `/metrics` (Prometheus) and `/summary` (JSON) in a thread.
+
+        Call `shutdown()` on the returned server to stop it.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = metrics.to_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/summary":
+                    body = json.dumps(metrics.summary()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def stage_timer(metrics: Optional[RunMetrics], stage: str) -> ContextManager:
+    """Times `stage` into `metrics`, or does nothing without metrics."""
+    return nullcontext() if metrics is None else metrics.time(stage)
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import random
+import time
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from json_generator.data_module import OutputModel
+from json_generator.schema import ResponseFormat, response_format
+
+# Text that long strings in sized responses are made of
+FILLER = "Điều 3. Trong Thông tư này, hệ thống thông tin là tập hợp các thiết bị. "
+
+
+def example_value(
+    schema: dict[str, Any],
+    defs: dict[str, Any],
+    string_length: Optional[int] = None,
+    list_length: Optional[int] = None,
+) -> Any:
+    """Builds a value matching a JSON schema, as a constrained decoder would.
+
+    Strings are `string_length` characters long and lists have `list_length`
+    items when given, to make responses of a realistic size.
+    """
+    sizes = (string_length, list_length)
+    if "$ref" in schema:
+        return example_value(defs[schema["$ref"].split("/")[-1]], defs, *sizes)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "default" in schema and string_length is None:
+        return schema["default"]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"]
+            return example_value((options or schema[key])[0], defs, *sizes)
+
+    kind = schema.get("type", "object")
+    if kind == "object":
+        return {
+            name: example_value(prop, defs, *sizes)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return [example_value(schema.get("items", {}), defs, *sizes)] * (
+            list_length or schema.get("minItems", 1)
+        )
+    if kind == "string" and string_length is not None:
+        return (FILLER * (string_length // len(FILLER) + 1))[:string_length]
+    return {
+        "string": "text",
+        "integer": 0,
+        "number": 0.0,
+        "boolean": False,
+        "null": None,
+    }[kind]
+
+
+class MockBackend:
+    """Local stand-in for an LLM backend, for tests and benchmarks.
+
+    Answers every prompt with an output matching `output_model`, except that
+    a `malformed_rate` share of the answers are prose with no JSON in it, as
+    a model that ignores the format instructions would write. With
+    `schema_guided=True` the backend takes the response format along with
+    the prompts and, like JSON mode or grammar-constrained decoding, always
+    answers with valid JSON. `calls` and `prompts` count what was sent.
+    """
+
+    def __init__(
+        self,
+        output_model: type[OutputModel],
+        *,
+        malformed_rate: float = 0.2,
+        schema_guided: bool = False,
+        seed: Optional[int] = None,
+    ):
+        self.malformed_rate = malformed_rate
+        self.schema_guided = schema_guided
+        self.calls = 0
+        self.prompts = 0
+        self._random = random.Random(seed)
+
+        schema = response_format(output_model)["json_schema"]["schema"]
+        self._response = json.dumps(
+            example_value(schema, schema.get("$defs", {})), ensure_ascii=False
+        )
+
+    def __call__(
+        self, prompts: list[str], response_format: Optional[ResponseFormat] = None
+    ) -> list[str]:
+        self.calls += 1
+        self.prompts += len(prompts)
+        if response_format is not None:
+            return [self._response] * len(prompts)
+        return [
+            (
+                "Sorry, here is a summary of the passage instead."
+                if self._random.random() < self.malformed_rate
+                else self._response
+            )
+            for _ in prompts
+        ]
+
+
+class AsyncMockBackend(MockBackend):
+    """Async `MockBackend`, answering after `latency` seconds.
+
+    `as_stream()` gives it as a streaming generator that yields every answer
+    `chunk_size` characters at a time, one every `chunk_latency` seconds;
+    `chunks` counts the chunks actually sent.
+    """
+
+    def __init__(
+        self,
+        output_model: type[OutputModel],
+        *,
+        latency: float = 0.0,
+        chunk_size: int = 16,
+        chunk_latency: float = 0.0,
+        **options,
+    ):
+        super().__init__(output_model, **options)
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.chunks = 0
+
+    async def __call__(
+        self, prompts: list[str], response_format: Optional[ResponseFormat] = None
+    ) -> list[str]:
+        await asyncio.sleep(self.latency)
+        return super().__call__(prompts, response_format)
+
+    async def stream(
+        self, prompt: str, response_format: Optional[ResponseFormat] = None
+    ) -> AsyncIterator[str]:
+        [response] = MockBackend.__call__(self, [prompt], response_format)
+        await asyncio.sleep(self.latency)
+        for start in range(0, len(response), self.chunk_size):
+            await asyncio.sleep(self.chunk_latency)
+            self.chunks += 1
+            yield response[start : start + self.chunk_size]
+
+    def as_stream(self) -> Callable[..., AsyncIterator[str]]:
+        def stream(prompt: str, response_format: Optional[ResponseFormat] = None):
+            return self.stream(prompt, response_format)
+
+        stream.streaming = True
+        stream.schema_guided = self.schema_guided
+        return stream
+
+
+@dataclass
+class LoadProfile:
+    """How a `SyntheticBackend` behaves, to reproduce a production load."""
+
+    # Latency of every call in seconds, lognormal around `latency` with a
+    # `latency_sigma` spread; 0 keeps it constant, ~1 gives a heavy tail
+    latency: float = 0.0
+    latency_sigma: float = 0.0
+    # Shares of prompts answered with "", as a failed request is, and with
+    # JSON cut off halfway
+    failure_rate: float = 0.0
+    malformed_rate: float = 0.0
+    # For `burst_length` seconds out of every `burst_every`, the backend is
+    # throttled: calls take `throttle_latency` and come back empty
+    burst_every: float = 0.0
+    burst_length: float = 0.0
+    throttle_latency: float = 0.0
+    # Size of the answers, see `example_value`
+    string_length: int = 4
+    list_length: int = 1
+
+
+class SyntheticBackend:
+    """Backend following a `LoadProfile`, for benchmarks.
+
+    Valid answers match `output_model`, at the size the profile sets.
+    `calls`, `prompts`, `failures`, `malformed` and `throttled_calls` count
+    what happened.
+    """
+
+    def __init__(
+        self,
+        output_model: type[OutputModel],
+        profile: LoadProfile,
+        *,
+        seed: Optional[int] = None,
+    ):
+        self.profile = profile
+        self.calls = 0
+        self.prompts = 0
+        self.failures = 0
+        self.malformed = 0
+        self.throttled_calls = 0
+        self._random = random.Random(seed)
+        self._start = time.monotonic()
+
+        schema = response_format(output_model)["json_schema"]["schema"]
+        self.response = json.dumps(
+            example_value(
+                schema,
+                schema.get("$defs", {}),
+                profile.string_length,
+                profile.list_length,
+            ),
+            ensure_ascii=False,
+        )
+
+    def throttled(self) -> bool:
+        profile = self.profile
+        if not profile.burst_every:
+            return False
+        return (time.monotonic() - self._start) % profile.burst_every < (
+            profile.burst_length
+        )
+
+    def answer(self, prompts: list[str]) -> tuple[float, list[str]]:
+        """Returns how long the call takes and its responses."""
+        profile = self.profile
+        self.calls += 1
+        self.prompts += len(prompts)
+        if self.throttled():
+            self.throttled_calls += 1
+            return profile.throttle_latency, [""] * len(prompts)
+
+        latency = profile.latency
+        if profile.latency_sigma:
+            latency *= self._random.lognormvariate(0.0, profile.latency_sigma)
+
+        responses = []
+        for _ in prompts:
+            draw = self._random.random()
+            if draw < profile.failure_rate:
+                self.failures += 1
+                responses.append("")
+            elif draw < profile.failure_rate + profile.malformed_rate:
+                self.malformed += 1
+                responses.append(self.response[: len(self.response) // 2])
+            else:
+                responses.append(self.response)
+        return latency, responses
+
+    def __call__(self, prompts: list[str]) -> list[str]:
+        latency, responses = self.answer(prompts)
+        time.sleep(latency)
+        return responses
+
+
+class AsyncSyntheticBackend(SyntheticBackend):
+    """Async `SyntheticBackend`."""
+
+    async def __call__(self, prompts: list[str]) -> list[str]:
+        latency, responses = self.answer(prompts)
+        await asyncio.sleep(latency)
+        return responses
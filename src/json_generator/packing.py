@@ -0,0 +1,84 @@
+import sys
+from collections.abc import Callable, Iterable, Iterator
+from itertools import islice
+from typing import Optional, TypeVar, Union
+
+from json_generator.data_module import InputModel
+
+X = TypeVar("X", bound=InputModel)
+
+TokenCounter = Callable[[str], int]
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Cheap token estimate of about four characters per token."""
+    return len(prompt) // 4 + 1
+
+
+def pack_batches(
+    inputs: Iterable[X],
+    max_tokens: int,
+    *,
+    count_tokens: Optional[TokenCounter] = None,
+    max_batch_size: Union[int, Callable[[], int], None] = None,
+    lookahead: int = 1,
+) -> Iterator[list[tuple[int, X]]]:
+    """Groups inputs into batches whose prompts fit in `max_tokens`.
+
+    Yields each batch as `(position, input)` pairs, where `position` is the
+    index of the input in `inputs`. Prompt sizes come from `count_tokens`,
+    `estimate_tokens` by default. A prompt larger than the budget gets a
+    batch of its own.
+
+    With `lookahead > 1`, that many inputs are read at a time and sorted by
+    size before packing, so prompts of similar length share a batch. Batches
+    then come out of input order; the positions tell where each output goes.
+    """
+    count_tokens = count_tokens or estimate_tokens
+    limit = sys.maxsize if max_batch_size is None else max_batch_size
+    size_limit = limit if callable(limit) else lambda: limit
+
+    batch: list[tuple[int, X]] = []
+    batch_tokens = 0
+    for item in _sized(inputs, count_tokens, lookahead):
+        if item is None:
+            # End of a sorted window, keep batches from spanning windows so
+            # outputs never wait on inputs further than one window ahead
+            if batch:
+                yield batch
+                batch, batch_tokens = [], 0
+            continue
+
+        tokens, position, input_model = item
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= size_limit()):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((position, input_model))
+        batch_tokens += tokens
+
+    if batch:
+        yield batch
+
+
+def _sized(
+    inputs: Iterable[X], count_tokens: TokenCounter, lookahead: int
+) -> Iterator[Optional[tuple[int, int, X]]]:
+    """Yields `(tokens, position, input)`, sorted by size within each window.
+
+    A None marks the end of every sorted window.
+    """
+    iterator = enumerate(inputs)
+    if lookahead <= 1:
+        for position, input_model in iterator:
+            yield count_tokens(input_model.to_prompt()), position, input_model
+        return
+
+    while window := list(islice(iterator, lookahead)):
+        yield from sorted(
+            (
+                (count_tokens(input_model.to_prompt()), position, input_model)
+                for position, input_model in window
+            ),
+            key=lambda item: item[0],
+        )
+        yield None
@@ -0,0 +1,20 @@
+from collections.abc import Awaitable, Callable
+
+# Generators take a batch of prompts and return one response per prompt.
+# The prompts are `SplitPrompt`s, so a prefix-aware backend can read the
+# static prefix of each one, see `group_by_prefix`. Generators marked with
+# `schema_guided` also take the response format, see `json_generator.schema`
+BatchGenerator = Callable[[list[str]], list[str]]
+AsyncBatchGenerator = Callable[[list[str]], Awaitable[list[str]]]
+
+
+def group_by_prefix(prompts: list[str]) -> dict[str, list[int]]:
+    """Groups the indices of `prompts` by their static prefix.
+
+    Lets a local backend send each prefix once per batch, followed by the
+    suffixes that share it. Plain strings have an empty prefix.
+    """
+    groups: dict[str, list[int]] = {}
+    for i, prompt in enumerate(prompts):
+        groups.setdefault(getattr(prompt, "prefix", ""), []).append(i)
+    return groups
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from collections.abc import Iterator, Sequence
+from functools import cached_property
+from typing import Any, Generic, Optional, TypeVar, Union, overload
+
+from json_generator.data_module import InputModel, OutputModel
+from json_generator.resume import input_key, record_key
+from json_generator.sinks import COMPRESSION_SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+X = TypeVar("X", bound=InputModel)
+Y = TypeVar("Y", bound=OutputModel)
+
+_decoder = json.JSONDecoder()
+
+# Magic, records, records with a key, bytes indexed, digest of those bytes
+_HEADER = struct.Struct("<8sQQQ16s")
+_MAGIC = b"JGIDX001"
+_KEY_SIZE = 16
+# Bytes hashed at both ends of the indexed part to notice a rewritten file
+_DIGEST_SPAN = 4096
+
+
+class Record(Generic[X, Y]):
+    """One record of an output file, parsed on first access."""
+
+    def __init__(
+        self,
+        raw: bytes,
+        output_model: type[Y],
+        input_model: Optional[type[X]] = None,
+    ):
+        self.raw = raw
+        self._output_model = output_model
+        self._input_model = input_model
+
+    @cached_property
+    def _parts(self) -> tuple[dict[str, Any], str]:
+        # Records are written as {"input":...,"output":...}, so the output
+        # can be handed to pydantic as JSON without decoding it here
+        line = self.raw.decode()
+        if line.startswith('{"input"'):
+            payload, end = _decoder.raw_decode(line, line.index("{", 8))
+            if line.startswith(',"output":', end):
+                return payload, line[end + 10 :].rstrip()[:-1]
+        record = json.loads(line)
+        return record["input"], json.dumps(record["output"])
+
+    @cached_property
+    def input(self) -> Union[X, dict[str, Any]]:
+        """The input as `input_model` if the reader has one, or as a dict."""
+        payload = self._parts[0]
+        if self._input_model is None:
+            return payload
+        return self._input_model.model_validate(payload)
+
+    @cached_property
+    def output(self) -> Y:
+        return self._output_model.model_validate_json(self._parts[1])
+
+    @property
+    def key(self) -> str:
+        """Hash of the input, as used by `resume` and `OutputReader.find`."""
+        return record_key(self._parts[0])
+
+
+class OutputReader(Sequence[Record[X, Y]]):
+    """Random access to a JSONL file written by `generate_and_save`.
+
+    The file is memory-mapped and a line-offset index is kept next to it in
+    `<path>.idx`, so opening it again is instant and any record can be read
+    without scanning the ones before it. Records support slicing,
+    `sample`, and lookup by input with `find`; their input and output are
+    only parsed when accessed.
+
+    The hash index of the inputs is built on the first `find` and cached in
+    the same file. The index is saved on `close`, and every `save_every`
+    records or keys added to it in between.
+
+    A file that is still being written can be read as well: only complete
+    lines are indexed, `refresh` picks up the records appended since, and
+    `follow` yields them as they come. Only uncompressed JSONL files can be
+    read.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        output_model: type[Y],
+        input_model: Optional[type[X]] = None,
+        *,
+        index_path: Optional[str] = None,
+        save_every: int = 100_000,
+    ):
+        if path.endswith((".parquet", *COMPRESSION_SUFFIXES)):
+            raise ValueError("OutputReader only reads uncompressed JSONL files")
+
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self.output_model = output_model
+        self.input_model = input_model
+        self.save_every = save_every
+
+        self._offsets = array("Q")
+        self._keys = bytearray()
+        self._size = 0
+        self._digest = b""
+        # Records indexed, and keys computed, since the index was last saved
+        self._unsaved = 0
+        # Record indices by input key, covering the first `_lookup_count`
+        self._lookup: Optional[dict[bytes, list[int]]] = None
+        self._lookup_count = 0
+        self._file = open(path, "rb")
+        self._map: Optional[mmap.mmap] = None
+
+        self._load_index()
+        self.refresh()
+
+    def close(self):
+        if self._unsaved and not self._file.closed:
+            self._save_index()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> "OutputReader[X, Y]":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _digest_of(self, size: int) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        self._file.seek(0)
+        digest.update(self._file.read(min(size, _DIGEST_SPAN)))
+        self._file.seek(max(0, size - _DIGEST_SPAN))
+        digest.update(self._file.read(min(size, _DIGEST_SPAN)))
+        return digest.digest()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            magic, count, key_count, size, digest = _HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return
+        if (
+            magic != _MAGIC
+            or size > os.fstat(self._file.fileno()).st_size
+            or digest != self._digest_of(size)
+        ):
+            logger.info("Rebuilding the stale index of %s", self.path)
+            return
+
+        start = _HEADER.size
+        self._offsets.frombytes(data[start : start + 8 * count])
+        if sys.byteorder != "little":
+            self._offsets.byteswap()
+        start += 8 * count
+        self._keys[:] = data[start : start + _KEY_SIZE * key_count]
+        self._size, self._digest = size, digest
+
+    def _save_index(self):
+        offsets = array("Q", self._offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        header = _HEADER.pack(
+            _MAGIC,
+            len(self._offsets),
+            len(self._keys) // _KEY_SIZE,
+            self._size,
+            self._digest,
+        )
+        self._unsaved = 0
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(header)
+                f.write(offsets.tobytes())
+                f.write(self._keys)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            logger.warning("Could not save the index of %s: %r", self.path, e)
+
+    def refresh(self) -> int:
+        """Indexes the records appended since the last call, returns how many."""
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self._size:
+            # The file was truncated or replaced, start over
+            logger.info("Rebuilding the index of %s, the file shrank", self.path)
+            self._offsets, self._keys, self._size = array("Q"), bytearray(), 0
+            self._lookup = None
+            self._lookup_count = 0
+        if self._map is not None and len(self._map) == size:
+            return 0
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if size == 0:
+            return 0
+        self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+
+        count = len(self._offsets)
+        position = self._size
+        while (end := self._map.find(b"\n", position)) != -1:
+            self._offsets.append(position)
+            position = end + 1
+        if position == self._size:
+            return 0
+
+        self._size = position
+        self._digest = self._digest_of(position)
+        added = len(self._offsets) - count
+        self._unsaved += added
+        if self._unsaved >= self.save_every:
+            self._save_index()
+        return added
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _span(self, index: int) -> tuple[int, int]:
+        start = self._offsets[index]
+        end = self._offsets[index + 1] if index + 1 < len(self) else self._size
+        return start, end
+
+    def raw(self, index: int) -> bytes:
+        """The JSON line of a record, without parsing it."""
+        start, end = self._span(index)
+        return self._map[start:end]
+
+    @overload
+    def __getitem__(self, index: int) -> Record[X, Y]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Record[X, Y]]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return Record(self.raw(index), self.output_model, self.input_model)
+
+    def __iter__(self) -> Iterator[Record[X, Y]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def sample(self, k: int, seed: Optional[int] = None) -> list[Record[X, Y]]:
+        """`k` distinct records picked at random, in file order."""
+        picked = random.Random(seed).sample(range(len(self)), k)
+        return [self[i] for i in sorted(picked)]
+
+    def _index_keys(self):
+        done = len(self._keys) // _KEY_SIZE
+        if done == len(self):
+            return
+        for i in range(done, len(self)):
+            self._keys += bytes.fromhex(self[i].key)
+        self._unsaved += len(self) - done
+        if self._unsaved >= self.save_every:
+            self._save_index()
+
+    def find(self, input: Union[InputModel, dict[str, Any]]) -> list[Record[X, Y]]:
+        """The records generated for an input, given as a model or a dict."""
+        self._index_keys()
+        if self._lookup is None:
+            self._lookup = {}
+        keys = memoryview(self._keys)
+        for i in range(self._lookup_count, len(self)):
+            key = bytes(keys[i * _KEY_SIZE : (i + 1) * _KEY_SIZE])
+            self._lookup.setdefault(key, []).append(i)
+        self._lookup_count = len(self)
+
+        if isinstance(input, InputModel):
+            key = input_key(input)
+        else:
+            key = record_key(input)
+        return [self[i] for i in self._lookup.get(bytes.fromhex(key), [])]
+
+    def follow(
+        self,
+        start: int = 0,
+        poll_interval: float = 1.0,
+        idle_timeout: Optional[float] = None,
+    ) -> Iterator[Record[X, Y]]:
+        """Yields the records from `start` on, waiting for new ones to be written.
+
+        Stops once nothing was appended for `idle_timeout` seconds, or never
+        if it is None.
+        """
+        position = start
+        idle_since = time.monotonic()
+        while True:
+            while position < len(self):
+                yield self[position]
+                position += 1
+            if self.refresh():
+                idle_since = time.monotonic()
+                continue
+            if (
+                idle_timeout is not None
+                and time.monotonic() - idle_since >= idle_timeout
+            ):
+                return
+            time.sleep(poll_interval)
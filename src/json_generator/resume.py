@@ -0,0 +1,81 @@
+import hashlib
+import json
+import logging
+import os
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from typing import Any, TypeVar
+
+from json_generator.data_module import InputModel
+
+logger = logging.getLogger(__name__)
+
+X = TypeVar("X", bound=InputModel)
+
+_decoder = json.JSONDecoder()
+
+
+def record_key(payload: dict[str, Any]) -> str:
+    """Stable hash of a record's input payload."""
+    data = json.dumps(
+        payload, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+def input_key(input_model: InputModel) -> str:
+    """Stable hash of the input as it is written to the output file."""
+    return record_key(input_model.model_dump(mode="json", exclude={"input_prompt"}))
+
+
+def _record_input(line: str) -> dict[str, Any]:
+    # Records are written with the input first, so only that object needs to
+    # be decoded; the (usually much larger) output is skipped entirely.
+    if line.startswith('{"input"'):
+        payload, _ = _decoder.raw_decode(line, line.index("{", 8))
+        return payload
+    return json.loads(line)["input"]
+
+
+def load_completed(output_file: str) -> Counter[str]:
+    """Counts the input keys of the records already in `output_file`.
+
+    The file is scanned line by line. A trailing line without a newline is
+    what an interrupted write leaves behind, so it is truncated away to make
+    the file safe to append to.
+    """
+    completed: Counter[str] = Counter()
+    valid_end = 0
+    with open(output_file, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            valid_end += len(line)
+            try:
+                completed[record_key(_record_input(line.decode()))] += 1
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable record in {output_file}: {e}")
+
+    if valid_end != os.path.getsize(output_file):
+        logger.warning(f"Truncating partial record at the end of {output_file}")
+        with open(output_file, "rb+") as f:
+            f.truncate(valid_end)
+
+    return completed
+
+
+def skip_completed(inputs: Iterable[X], completed: Counter[str]) -> Iterator[X]:
+    """Yields the inputs that do not have a record yet.
+
+    Duplicate inputs are skipped only as many times as they were completed.
+    """
+    remaining = completed.copy()
+    for input_model in inputs:
+        if remaining:
+            key = input_key(input_model)
+            if remaining[key] > 0:
+                remaining[key] -= 1
+                if not remaining[key]:
+                    del remaining[key]
+                continue
+        yield input_model
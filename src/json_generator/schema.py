@@ -0,0 +1,85 @@
+from collections.abc import Callable
+from functools import lru_cache, wraps
+from typing import Any, TypeVar
+
+from json_generator.data_module import OutputModel
+
+F = TypeVar("F", bound=Callable)
+
+# OpenAI-style `response_format` request field, shared between calls
+ResponseFormat = dict[str, Any]
+
+
+def strict_schema(schema: Any) -> Any:
+    """Rewrites a JSON schema to follow the rules of OpenAI-style strict mode.
+
+    Every object is closed with `additionalProperties: false` and lists all
+    of its properties as required, and `default`s, which strict mode does
+    not accept, are left out. Fields with a default must then be present in
+    the response, which the output model accepts all the same.
+    """
+    if isinstance(schema, list):
+        return [strict_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    strict = {}
+    for key, value in schema.items():
+        if key in ("properties", "$defs"):
+            # Maps of names to subschemas, the names are kept as they are
+            strict[key] = {name: strict_schema(sub) for name, sub in value.items()}
+        elif key != "default":
+            strict[key] = strict_schema(value)
+    if "properties" in schema:
+        strict["required"] = list(schema["properties"])
+        strict["additionalProperties"] = False
+    return strict
+
+
+@lru_cache(maxsize=None)
+def response_format(output_model: type[OutputModel]) -> ResponseFormat:
+    """Strict JSON schema response format for `output_model`, see
+    `strict_schema`. Built once per class.
+
+    The result is shared, so it must not be modified.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": output_model.__name__,
+            "schema": strict_schema(output_model.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+
+def schema_guided(generator: F) -> F:
+    """Marks a generator as taking `(prompts, response_format)`.
+
+    Such a generator receives the response format of the output model with
+    every batch, so the backend can use JSON mode or constrained decoding.
+    It can be used wherever a generator is expected, sync or async; plain
+    `(prompts)` generators are left as they are.
+    """
+
+    @wraps(generator)
+    def guided(prompts: list[str], response_format: ResponseFormat):
+        return generator(prompts, response_format)
+
+    guided.schema_guided = True
+    return guided
+
+
+def is_schema_guided(generator: Callable) -> bool:
+    return getattr(generator, "schema_guided", False)
+
+
+def bind_response_format(
+    generator: Callable, output_model: type[OutputModel]
+) -> Callable[[list[str]], Any]:
+    """Turns a schema-guided generator into a plain `(prompts)` one."""
+    if not is_schema_guided(generator):
+        return generator
+
+    format_ = response_format(output_model)
+    return lambda prompts: generator(prompts, format_)
@@ -0,0 +1,197 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional, TypeVar, Union
+
+from json_generator.data_module import InputModel, OutputModel
+from json_generator.generate import BatchGenerator, generate_and_save
+from json_generator.resume import input_key
+from json_generator.stats import GenerationStats
+
+logger = logging.getLogger(__name__)
+
+X = TypeVar("X", bound=InputModel)
+Y = TypeVar("Y", bound=OutputModel)
+
+# Either a re-iterable collection of inputs or a picklable function returning
+# a fresh iterable, so that every worker and the merge can read them again
+InputSource = Union[Iterable[X], Callable[[], Iterable[X]]]
+
+
+def read_inputs(inputs: InputSource) -> Iterable[X]:
+    return inputs() if callable(inputs) else inputs
+
+
+def shard_of(input_model: InputModel, shard_count: int) -> int:
+    """Stable shard for an input, the same across processes and machines."""
+    return int(input_key(input_model)[:16], 16) % shard_count
+
+
+def shard_inputs(
+    inputs: Iterable[X], shard_index: int, shard_count: int
+) -> Iterator[X]:
+    for input_model in inputs:
+        if shard_of(input_model, shard_count) == shard_index:
+            yield input_model
+
+
+def shard_path(output_dir: str, shard_index: int, shard_count: int) -> str:
+    return os.path.join(
+        output_dir, f"part-{shard_index:05d}-of-{shard_count:05d}.jsonl"
+    )
+
+
+def generate_shard(
+    *,
+    inputs: InputSource,
+    output_model: type[Y],
+    generator: BatchGenerator,
+    shard_index: int,
+    shard_count: int,
+    output_dir: str,
+    **options: Any,
+) -> dict[str, Any]:
+    """Runs `generate_and_save` on one shard of `inputs`.
+
+    This is the entry point for a worker, whether it runs in a local process
+    or on its own machine: every worker reads the full input source and keeps
+    its own shard. The output part is written to `output_dir`, and a summary
+    of the shard is returned and saved next to it. Other keyword arguments
+    are passed on to `generate_and_save`; `resume=True` makes a restarted
+    worker continue its part.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    output_file = shard_path(output_dir, shard_index, shard_count)
+    stats = GenerationStats()
+
+    start = time.monotonic()
+    generate_and_save(
+        inputs=shard_inputs(read_inputs(inputs), shard_index, shard_count),
+        output_model=output_model,
+        generator=generator,
+        output_file=output_file,
+        stats=stats,
+        **options,
+    )
+
+    summary = {
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "output_file": output_file,
+        "seconds": time.monotonic() - start,
+        "stats": stats.to_dict(),
+    }
+    with open(output_file + ".summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+
+    return summary
+
+
+def merge_shards(
+    *,
+    inputs: InputSource,
+    shard_count: int,
+    output_dir: str,
+    output_file: str,
+) -> dict[str, Any]:
+    """Merges the shard parts into one output file in input order.
+
+    Every part holds its shard's records in input order, so walking the
+    inputs and taking the next line of each input's shard restores the
+    original order without holding any part in memory.
+    """
+    parts = [
+        open(shard_path(output_dir, i, shard_count), "rb") for i in range(shard_count)
+    ]
+    records = [0] * shard_count
+    try:
+        with open(output_file, "wb") as out:
+            for input_model in read_inputs(inputs):
+                shard_index = shard_of(input_model, shard_count)
+                line = parts[shard_index].readline()
+                if not line.endswith(b"\n"):
+                    raise ValueError(
+                        f"Shard {shard_index} is missing records, "
+                        "rerun it with resume=True before merging"
+                    )
+                out.write(line)
+                records[shard_index] += 1
+
+        for shard_index, part in enumerate(parts):
+            if part.readline():
+                raise ValueError(
+                    f"Shard {shard_index} has more records than inputs, "
+                    "were the inputs changed since it ran?"
+                )
+    finally:
+        for part in parts:
+            part.close()
+
+    return {"output_file": output_file, "records": sum(records), "shards": records}
+
+
+def run_sharded(
+    *,
+    inputs: InputSource,
+    output_model: type[Y],
+    generator: BatchGenerator,
+    shard_count: int,
+    output_dir: str,
+    output_file: str,
+    processes: Optional[int] = None,
+    **options: Any,
+) -> dict[str, Any]:
+    """Runs every shard in a local process pool, then merges them.
+
+    `inputs`, `output_model` and `generator` are sent to the worker
+    processes, so they must be picklable (module-level functions and
+    classes). Returns the run summary, which is also written to
+    `output_dir/summary.json`.
+    """
+    start = time.monotonic()
+    # Spawned rather than forked workers, the parent may be running threads
+    with ProcessPoolExecutor(
+        max_workers=processes or shard_count,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        futures = [
+            pool.submit(
+                generate_shard,
+                inputs=inputs,
+                output_model=output_model,
+                generator=generator,
+                shard_index=shard_index,
+                shard_count=shard_count,
+                output_dir=output_dir,
+                **options,
+            )
+            for shard_index in range(shard_count)
+        ]
+        shards = [future.result() for future in futures]
+
+    merged = merge_shards(
+        inputs=inputs,
+        shard_count=shard_count,
+        output_dir=output_dir,
+        output_file=output_file,
+    )
+
+    totals = GenerationStats()
+    for shard in shards:
+        totals.add(GenerationStats(**shard["stats"]))
+
+    summary = {
+        **merged,
+        "seconds": time.monotonic() - start,
+        "stats": totals.to_dict(),
+        "shard_summaries": shards,
+    }
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Sharded run finished: {merged['records']} records")
+
+    return summary
@@ -0,0 +1,256 @@
+import gzip
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import IO, Any, Literal, Optional
+
+from json_generator.data_module import InputModel, OutputModel
+
+# "none" leaves flushing to the buffer size and `close()`, "batch" flushes
+# after every batch, and "fsync" also forces every batch to disk.
+Durability = Literal["none", "batch", "fsync"]
+Compression = Literal["gzip", "zstd"]
+
+COMPRESSION_SUFFIXES: dict[str, Compression] = {".gz": "gzip", ".zst": "zstd"}
+
+
+def record_line(input_model: InputModel, output: OutputModel) -> str:
+    """Serializes one output record as a JSONL line."""
+    return (
+        '{"input":'
+        + input_model.model_dump_json(exclude={"input_prompt"})
+        + ',"output":'
+        + output.model_dump_json()
+        + "}\n"
+    )
+
+
+class Sink(ABC):
+    """Destination for the records written by `generate_and_save`."""
+
+    @abstractmethod
+    def write(self, batch: list[InputModel], outputs: list[OutputModel]):
+        """Writes the records of one batch."""
+
+    def flush(self):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def __enter__(self) -> "Sink":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_compressed(path: str, mode: str, compression: Optional[Compression]) -> IO:
+    """Opens `path` for binary writing, compressed if requested."""
+    if compression is None:
+        return open(path, mode + "b")
+    if compression == "gzip":
+        return gzip.open(path, mode + "b", compresslevel=6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                "zstd compression requires the `zstandard` package"
+            ) from e
+        return zstandard.ZstdCompressor().stream_writer(
+            open(path, mode + "b"), closefd=True
+        )
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+class JsonlSink(Sink):
+    """Buffered JSONL writer, optionally gzip or zstd compressed.
+
+    Records are serialized with `model_dump_json` and collected in memory
+    until `buffer_size` bytes are pending, then written in one call. The
+    compression is inferred from a `.gz` or `.zst` suffix when not given.
+    `flush_interval` additionally flushes when that many seconds have passed
+    since the last flush.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        mode: Literal["w", "a"] = "w",
+        compression: Optional[Compression] = None,
+        buffer_size: int = 1 << 20,
+        durability: Durability = "batch",
+        flush_interval: Optional[float] = None,
+    ):
+        if compression is None:
+            compression = COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1])
+
+        self.path = path
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.bytes_written = 0
+
+        self._file = open_compressed(path, mode, compression)
+        self._buffer: list[bytes] = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, batch: list[InputModel], outputs: list[OutputModel]):
+        data = "".join(
+            record_line(input_model, output)
+            for input_model, output in zip(batch, outputs)
+        ).encode()
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self.bytes_written += len(data)
+
+        if self.durability != "none":
+            self.flush()
+        elif self._buffered >= self.buffer_size:
+            self._write_buffer()
+        elif (
+            self.flush_interval is not None
+            and time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def _write_buffer(self):
+        if self._buffer:
+            self._file.write(b"".join(self._buffer))
+            self._buffer.clear()
+            self._buffered = 0
+
+    def flush(self):
+        self._write_buffer()
+        if self.compression == "zstd":
+            import zstandard
+
+            # Ends the current zstd block so the data so far is readable
+            self._file.flush(zstandard.FLUSH_BLOCK)
+        else:
+            self._file.flush()
+        if self.durability == "fsync":
+            # The zstd writer flushes the file under it, and its `fileno()`
+            # is that file's too
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._write_buffer()
+        self._file.close()
+
+
+class ShardedJsonlSink(Sink):
+    """JSONL sink that rotates to a new file every `max_bytes`.
+
+    `pattern` is formatted with the shard number, for example
+    `"outputs-{shard:05d}.jsonl.gz"`. Rotation happens between batches, so
+    a shard can exceed `max_bytes` by up to one batch. Other keyword
+    arguments are passed on to each shard's `JsonlSink`.
+    """
+
+    def __init__(self, pattern: str, *, max_bytes: int = 1 << 30, **sink_options):
+        self.pattern = pattern
+        self.max_bytes = max_bytes
+        self.sink_options = sink_options
+        self.paths: list[str] = []
+        self._sink: Optional[JsonlSink] = None
+
+    def _rotate(self):
+        if self._sink is not None:
+            self._sink.close()
+        path = self.pattern.format(shard=len(self.paths))
+        self.paths.append(path)
+        self._sink = JsonlSink(path, **self.sink_options)
+
+    def write(self, batch: list[InputModel], outputs: list[OutputModel]):
+        if self._sink is None or self._sink.bytes_written >= self.max_bytes:
+            self._rotate()
+        self._sink.write(batch, outputs)
+
+    def flush(self):
+        if self._sink is not None:
+            self._sink.flush()
+
+    def close(self):
+        if self._sink is not None:
+            self._sink.close()
+
+
+class ParquetSink(Sink):
+    """Columnar sink writing `input` and `output` struct columns to Parquet.
+
+    Records are written in row groups of `row_group_size`. The Arrow schema
+    is inferred from the first row group unless `schema` is given; pass one
+    when early records may have empty lists or missing values whose type
+    cannot be inferred. Requires `pyarrow`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        row_group_size: int = 10_000,
+        schema: Optional[Any] = None,
+        compression: str = "zstd",
+    ):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("ParquetSink requires the `pyarrow` package") from e
+
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.row_group_size = row_group_size
+        self.schema = schema
+        self.compression = compression
+        self._rows: list[dict[str, Any]] = []
+        self._writer = None
+
+    def write(self, batch: list[InputModel], outputs: list[OutputModel]):
+        self._rows.extend(
+            {
+                "input": input_model.model_dump(mode="json", exclude={"input_prompt"}),
+                "output": output.model_dump(mode="json"),
+            }
+            for input_model, output in zip(batch, outputs)
+        )
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+
+        table = self._pa.Table.from_pylist(self._rows, schema=self.schema)
+        if self._writer is None:
+            self.schema = table.schema
+            self._writer = self._pq.ParquetWriter(
+                self.path, self.schema, compression=self.compression
+            )
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._rows.clear()
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def open_sink(output_file: str, mode: Literal["w", "a"] = "w") -> Sink:
+    """Picks a sink for `output_file` from its suffix."""
+    if output_file.endswith(".parquet"):
+        if mode == "a":
+            raise ValueError("Parquet outputs cannot be appended to")
+        return ParquetSink(output_file)
+    return JsonlSink(output_file, mode=mode)
@@ -0,0 +1,44 @@
+from dataclasses import asdict, dataclass, fields
+
+
+@dataclass
+class GenerationStats:
+    """Counters filled in by `generate_batch` and `generate_and_save`.
+
+    The same instance can be passed to several batches to accumulate
+    counts over a whole run.
+    """
+
+    # Inputs seen, and how many of them were collapsed into another
+    # identical prompt of the same batch
+    inputs: int = 0
+    duplicate_prompts: int = 0
+    # Unique prompts answered from the cache or sent to the generator
+    cached_prompts: int = 0
+    generated_prompts: int = 0
+    # Responses that came back empty, usually because the backend failed
+    empty_responses: int = 0
+    # Responses only valid after `repair_json`, responses that failed
+    # validation on the first try, and those still bad once the retries ran out
+    repaired_responses: int = 0
+    bad_responses: int = 0
+    failed_prompts: int = 0
+    retry_rounds: int = 0
+    # Streamed responses cut off early because they were clearly invalid
+    aborted_responses: int = 0
+    # Speculative duplicates sent for slow prompts
+    hedged_requests: int = 0
+    # Times the circuit breaker paused the run, and prompts sent again
+    # because they failed during an outage
+    breaker_trips: int = 0
+    requeued_prompts: int = 0
+
+    def add(self, other: "GenerationStats"):
+        """Adds the counts of `other` to this instance."""
+        for field in fields(self):
+            setattr(
+                self, field.name, getattr(self, field.name) + getattr(other, field.name)
+            )
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Callable
+from typing import Any, Optional, TypeVar
+
+from json_generator.data_module import OutputModel
+from json_generator.schema import is_schema_guided, response_format
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable)
+
+# Takes one prompt, or a prompt and a response format when schema-guided,
+# and yields the completion in chunks as they arrive
+StreamingGenerator = Callable[..., AsyncIterator[str]]
+
+_WHITESPACE = frozenset(" \t\r\n")
+_SCALAR_END = frozenset(",}] \t\r\n")
+
+# What a value of each JSON schema type can start with. Numbers and booleans
+# accept anything, since pydantic coerces strings like "5" or "true" to them
+_VALUE_STARTS = {
+    "object": frozenset("{"),
+    "array": frozenset("["),
+    "string": frozenset('"'),
+    "null": frozenset("n"),
+}
+
+
+def streaming(generator: F) -> F:
+    """Marks a generator as streaming, see `StreamedGenerator`."""
+    generator.streaming = True
+    return generator
+
+
+def is_streaming(generator: Callable) -> bool:
+    return getattr(generator, "streaming", False)
+
+
+class IncrementalValidator:
+    """Follows a JSON response as it streams in, checking it against a schema.
+
+    `feed` returns False as soon as the response is clearly going to fail
+    validation: no JSON object started within `max_preamble` characters,
+    a value of the wrong kind for its field (say a string where a list is
+    expected), or an unknown key in an object that forbids extra keys.
+
+    Anything `repair_json` might still fix, like an unescaped quote inside
+    a string, is not treated as invalid: the validator stops checking and
+    accepts the rest of the response.
+    """
+
+    def __init__(self, schema: dict[str, Any], *, max_preamble: int = 200):
+        self.defs = schema.get("$defs", {})
+        self.schema = schema
+        self.max_preamble = max_preamble
+        # "preamble", "json", then "done", or "unknown" once unsure
+        self.state = "preamble"
+        self.valid = True
+        self._seen = 0
+        # One [schema, kind, expected token, current key] per open container
+        self._stack: list[list[Any]] = []
+        self._in_string = False
+        self._in_key = False
+        self._escape = False
+        self._key: list[str] = []
+        self._in_scalar = False
+
+    def feed(self, chunk: str) -> bool:
+        for char in chunk:
+            if self.state in ("done", "unknown") or not self.valid:
+                break
+            self._step(char)
+        return self.valid
+
+    def _resolve(self, schema: dict[str, Any]) -> dict[str, Any]:
+        while "$ref" in schema:
+            schema = self.defs.get(schema["$ref"].split("/")[-1], {})
+        return schema
+
+    def _allows(self, schema: dict[str, Any], char: str) -> bool:
+        schema = self._resolve(schema)
+        for key in ("anyOf", "oneOf"):
+            if key in schema:
+                return any(self._allows(option, char) for option in schema[key])
+        kinds = schema.get("type")
+        if kinds is None or "const" in schema or "enum" in schema:
+            return True
+        for kind in kinds if isinstance(kinds, list) else [kinds]:
+            starts = _VALUE_STARTS.get(kind)
+            if starts is None or char in starts:
+                return True
+        return False
+
+    def _value_schema(self) -> Optional[dict[str, Any]]:
+        """Schema of the value about to start, None for an unknown key."""
+        schema, kind, _, key = self._stack[-1]
+        if kind == "array":
+            items = schema.get("items", {})
+            return items if isinstance(items, dict) else {}
+
+        properties = schema.get("properties", {})
+        if key in properties:
+            return properties[key]
+        extra = schema.get("additionalProperties", True)
+        if extra is False:
+            return None
+        return extra if isinstance(extra, dict) else {}
+
+    def _open(self, schema: dict[str, Any], char: str):
+        schema = self._resolve(schema)
+        if char == "{":
+            self._stack.append([schema, "object", "key_or_end", None])
+        else:
+            self._stack.append([schema, "array", "value_or_end", None])
+
+    def _close(self):
+        self._stack.pop()
+        if self._stack:
+            self._stack[-1][2] = "comma"
+        else:
+            self.state = "done"
+
+    def _start_value(self, char: str):
+        schema = self._value_schema()
+        if schema is None or not self._allows(schema, char):
+            self.valid = False
+        elif char in "{[":
+            self._open(schema, char)
+        elif char == '"':
+            self._in_string, self._in_key = True, False
+            self._stack[-1][2] = "comma"
+        elif char in "-0123456789tfn":
+            self._in_scalar = True
+            self._stack[-1][2] = "comma"
+        else:
+            self.state = "unknown"
+
+    def _step(self, char: str):
+        self._seen += 1
+        if self.state == "preamble":
+            if char == "{":
+                if not self._allows(self.schema, char):
+                    self.valid = False
+                    return
+                self.state = "json"
+                self._open(self.schema, char)
+            elif self._seen > self.max_preamble:
+                self.valid = False
+            return
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._in_key:
+                    frame = self._stack[-1]
+                    frame[3] = "".join(self._key)
+                    frame[2] = "colon"
+                    if self._value_schema() is None:
+                        self.valid = False
+            elif self._in_key:
+                self._key.append(char)
+            return
+
+        if self._in_scalar:
+            if char not in _SCALAR_END:
+                return
+            self._in_scalar = False
+        if char in _WHITESPACE:
+            return
+
+        frame = self._stack[-1]
+        expected = frame[2]
+        if expected == "key_or_end" and char == '"':
+            self._in_string, self._in_key, self._key = True, True, []
+        elif expected in ("key_or_end", "value_or_end") and char in "}]":
+            self._close()
+        elif expected == "colon" and char == ":":
+            frame[2] = "value"
+        elif expected in ("value", "value_or_end"):
+            self._start_value(char)
+        elif expected == "comma" and char == ",":
+            frame[2] = "key_or_end" if frame[1] == "object" else "value"
+        elif expected == "comma" and char == ("}" if frame[1] == "object" else "]"):
+            self._close()
+        else:
+            self.state = "unknown"
+
+
+class StreamedGenerator:
+    """Async batch generator over a streaming generator, with early abort.
+
+    Every prompt is streamed on its own and checked by an
+    `IncrementalValidator` as chunks arrive. A response that is clearly
+    invalid is cut off by closing its stream, which cancels the request, and
+    the partial response is returned so the retry starts right away.
+    `aborted` counts those responses.
+    """
+
+    def __init__(
+        self,
+        stream: StreamingGenerator,
+        output_model: type[OutputModel],
+        *,
+        max_preamble: int = 200,
+    ):
+        self.stream = stream
+        # The model's own schema, as the strict one closes every object and
+        # would abort responses with extra keys that validate fine
+        self.schema = output_model.model_json_schema()
+        self.format = response_format(output_model)
+        self.max_preamble = max_preamble
+        self.aborted = 0
+
+    async def __call__(self, prompts: list[str]) -> list[str]:
+        return list(await asyncio.gather(*(self.generate(p) for p in prompts)))
+
+    async def generate(self, prompt: str) -> str:
+        validator = IncrementalValidator(self.schema, max_preamble=self.max_preamble)
+        if is_schema_guided(self.stream):
+            chunks = self.stream(prompt, self.format)
+        else:
+            chunks = self.stream(prompt)
+
+        received: list[str] = []
+        try:
+            async for chunk in chunks:
+                received.append(chunk)
+                if not validator.feed(chunk):
+                    self.aborted += 1
+                    logger.warning(
+                        "Aborted invalid response after %d characters",
+                        sum(map(len, received)),
+                    )
+                    break
+        except Exception as e:
+            logger.error("Streaming generator failed: %r", e)
+        finally:
+            close = getattr(chunks, "aclose", None)
+            if close is not None:
+                await close()
+        return "".join(received)
@@ -1,3 +1,52 @@
+import re
+from collections.abc import Callable, Iterable, Iterator
+from itertools import islice
+from typing import Generic, Optional, TypeVar, Union
+
+T = TypeVar("T")
+
+
+def batched(
+    iterable: Iterable[T], batch_size: Union[int, Callable[[], int]]
+) -> Iterator[list[T]]:
+    """Lazily splits an iterable into lists of at most `batch_size` items.
+
+    `batch_size` may be a function, which is called again for every batch.
+    """
+    size = batch_size if callable(batch_size) else lambda: batch_size
+    if size() < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, max(1, size()))):
+        yield batch
+
+
+class ReorderBuffer(Generic[T]):
+    """Releases items in position order when they arrive out of order."""
+
+    def __init__(self, start: int = 0):
+        self.next_position = start
+        self._pending: dict[int, T] = {}
+
+    def push(self, position: int, item: T) -> list[T]:
+        """Adds an item and returns the items that are now in order."""
+        self._pending[position] = item
+        ready: list[T] = []
+        while self.next_position in self._pending:
+            ready.append(self._pending.pop(self.next_position))
+            self.next_position += 1
+        return ready
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+# Start and end patterns for JSON string delimiters
+_START_PATTERNS = ('["', '{"', ': "', '","', '],"')
+_END_PATTERNS = ('"]', '"}', '","', '":')
+
+
 def escape_json_string(json_string: str) -> str:
     json_string = (
         json_string.replace("\n", "")
@@ -9,51 +58,126 @@ def escape_json_string(json_string: str) -> str:
         .replace('], "', '],"')
     )
 
-    input_json = json_string
-
-    # Start and end patterns for JSON string delimiters
-    start_patterns = ['["', '{"', ': "', '","', '],"']
-    end_patterns = ['"]', '"}', '","', '":']
-
     # Tracking whether we are inside a JSON string
     in_string = False
     # Result container
     result: list[str] = []
-    # Iterate through the string by index and character
-    i = 0
-    while i < len(input_json):
-        char = input_json[i]
-
-        # Detect entering a JSON string
-        if char == '"' and not in_string:
-            # Check the previous characters for start pattern
-            prev_seq = input_json[
-                max(0, i - 2) : i + 1
-            ]  # Look two characters back and one ahead
-
-            if any(prev_seq.endswith(pat) for pat in start_patterns):
-                # We are at a legitimate start of a JSON string
-                result.append(char)
-                in_string = True
-            else:
-                # It's a quote that should be escaped
-                result.append('\\"')
-        elif char == '"' and in_string:
-            # Check if we are at the end of a JSON string
-            next_seq = input_json[
-                i : i + 3
-            ]  # We need to check the next characters for end pattern
-            if any(next_seq.startswith(pat) for pat in end_patterns):
-                # It's a legitimate end of a JSON string
-                result.append(char)
-                in_string = False
-            else:
-                # It's a quote that should be escaped inside a string
-                result.append('\\"')
+    # Only quotes need a decision, the text between them is copied as is
+    start = 0
+    i = json_string.find('"')
+    while i != -1:
+        result.append(json_string[start:i])
+
+        if not in_string:
+            # A legitimate start of a JSON string follows a start pattern
+            legitimate = json_string.endswith(_START_PATTERNS, 0, i + 1)
+        else:
+            # A legitimate end of a JSON string precedes an end pattern
+            legitimate = json_string.startswith(_END_PATTERNS, i)
+
+        if legitimate:
+            result.append('"')
+            in_string = not in_string
         else:
-            # Add the character as is
-            result.append(char)
+            # It's a quote that should be escaped
+            result.append('\\"')
 
-        i += 1
+        start = i + 1
+        i = json_string.find('"', start)
 
+    result.append(json_string[start:])
     return "".join(result)
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_OUTSIDE_STRING = re.compile(r'[",]')
+_INSIDE_STRING = re.compile(r'["\\]')
+_CONTROL_CHARACTERS = re.compile(r"[\x00-\x1f]")
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+# Characters that can start the next key or value after a comma
+_VALUE_STARTS = frozenset('"{[]}-0123456789tfn')
+
+
+def repair_json(text: str) -> Optional[str]:
+    """Makes a best-effort repair of a JSON object produced by an LLM.
+
+    Drops any prose or code fences around the outermost object, removes
+    trailing commas, escapes raw control characters inside strings, and
+    escapes quotes that cannot close the string they appear in. Returns None
+    when there is no object to repair.
+
+    The text is scanned once, jumping between the characters that matter
+    with regular expressions rather than looping over every character.
+    """
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        return None
+
+    text = text[start : end + 1]
+    length = len(text)
+    result: list[str] = []
+    pos = 0
+    while pos < length:
+        match = _OUTSIDE_STRING.search(text, pos)
+        if match is None:
+            result.append(text[pos:])
+            break
+
+        i = match.start()
+        result.append(text[pos:i])
+        pos = i + 1
+        if text[i] == ",":
+            following = _WHITESPACE.match(text, pos).end()
+            if following >= length or text[following] not in "}]":
+                result.append(",")
+            continue
+
+        # Inside a string until a quote that is followed by JSON structure
+        result.append('"')
+        while True:
+            match = _INSIDE_STRING.search(text, pos)
+            if match is None:
+                result.append(_escape_controls(text[pos:]))
+                result.append('"')
+                pos = length
+                break
+
+            i = match.start()
+            result.append(_escape_controls(text[pos:i]))
+            pos = i + 1
+            if text[i] == "\\":
+                result.append(text[i : i + 2])
+                pos = i + 2
+            elif _closes_string(text, pos):
+                result.append('"')
+                break
+            else:
+                result.append('\\"')
+
+    return "".join(result)
+
+
+def _escape_control(match: re.Match) -> str:
+    char = match.group()
+    return _CONTROL_ESCAPES.get(char) or f"\\u{ord(char):04x}"
+
+
+def _escape_controls(text: str) -> str:
+    if _CONTROL_CHARACTERS.search(text) is None:
+        return text
+    return _CONTROL_CHARACTERS.sub(_escape_control, text)
+
+
+def _closes_string(text: str, pos: int) -> bool:
+    following = _WHITESPACE.match(text, pos).end()
+    if following >= len(text):
+        return True
+
+    char = text[following]
+    if char in ":}]":
+        return True
+    if char == ",":
+        following = _WHITESPACE.match(text, following + 1).end()
+        return following < len(text) and text[following] in _VALUE_STARTS
+    return False
@@ -0,0 +1,93 @@
+import asyncio
+
+from json_generator import AdaptiveController, agenerate_and_save, generate_and_save
+from json_generator.stats import GenerationStats
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+
+def test_controller_aimd():
+    controller = AdaptiveController(
+        batch_size=4, max_batch_size=6, concurrency=2, max_concurrency=3
+    )
+
+    for _ in range(5):
+        controller.record(0.1, GenerationStats(generated_prompts=4))
+    assert (controller.batch_size, controller.concurrency) == (6, 3)
+
+    controller.record(0.1, GenerationStats(generated_prompts=6, bad_responses=6))
+    assert (controller.batch_size, controller.concurrency) == (3, 1)
+
+    # Further failures within one smoothed latency are the same slowdown
+    controller.record(0.1, GenerationStats(generated_prompts=3, bad_responses=3))
+    assert (controller.batch_size, controller.concurrency) == (3, 1)
+
+
+def test_controller_target_latency():
+    controller = AdaptiveController(batch_size=8, target_latency=1.0)
+
+    controller.record(2.0, GenerationStats(generated_prompts=8))
+
+    assert controller.batch_size == 4
+
+
+def test_generate_and_save_adapts_batch_size(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(60)]
+    batch_sizes: list[int] = []
+
+    def mock_throttled_generator(texts: list[str]) -> list[str]:
+        batch_sizes.append(len(texts))
+        # The backend starts dropping requests above 6 per batch
+        if len(texts) > 6:
+            return [""] * len(texts)
+        return mock_good_generator(texts)
+
+    # Only react to failures, the mock's latency is all noise
+    controller = AdaptiveController(
+        batch_size=2, max_batch_size=16, latency_tolerance=float("inf")
+    )
+    generate_and_save(
+        inputs=passages,
+        output_model=LegalQueries,
+        generator=mock_throttled_generator,
+        output_file=str(tmp_path / "outputs.jsonl"),
+        controller=controller,
+    )
+
+    assert batch_sizes[:5] == [2, 3, 4, 5, 6]
+    assert max(batch_sizes) == 7
+    assert controller.batch_size <= 7
+
+
+def test_agenerate_and_save_adapts_concurrency(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(40)]
+    in_flight = 0
+    max_in_flight = 0
+
+    async def mock_slow_generator(texts: list[str]) -> list[str]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.005)
+        in_flight -= 1
+        return mock_good_generator(texts)
+
+    controller = AdaptiveController(
+        batch_size=1,
+        max_batch_size=1,
+        concurrency=1,
+        max_concurrency=4,
+        latency_tolerance=float("inf"),
+    )
+    asyncio.run(
+        agenerate_and_save(
+            inputs=passages,
+            output_model=LegalQueries,
+            generator=mock_slow_generator,
+            output_file=str(tmp_path / "outputs.jsonl"),
+            controller=controller,
+        )
+    )
+
+    assert controller.concurrency == 4
+    assert max_in_flight == 4
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from json_generator import agenerate_and_save
+from json_generator.backends import ChatCompletionsBackend, KeyPool, TokenBucket
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+web = pytest.importorskip("aiohttp.web")
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.01)
+
+
+def test_key_pool_benches_failing_keys():
+    async def run():
+        pool = KeyPool(["key-a", "key-b"], bench_time=10)
+        key = await pool.acquire(1)
+        pool.release(key, ok=False)
+        return [(await pool.acquire(1)).key for _ in range(3)], key.key
+
+    keys, benched = asyncio.run(run())
+
+    assert benched not in keys
+
+
+class FakeClock:
+    """Stands in for `time` and `asyncio` in the backends module."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_key_pool_rate_limits_each_key(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("json_generator.backends.time", clock)
+    monkeypatch.setattr("json_generator.backends.asyncio", clock)
+
+    async def run() -> list[tuple[str, float]]:
+        # Two requests per minute and key: a burst of 2, then one every 30s
+        pool = KeyPool(["key-a", "key-b"], requests_per_minute=2)
+        acquired = []
+        for _ in range(6):
+            key = await pool.acquire(1)
+            acquired.append((key.key, clock.now))
+            pool.release(key, ok=True)
+        return acquired
+
+    acquired = asyncio.run(run())
+
+    # Once key-a ran dry, requests went to key-b without waiting
+    assert acquired[:4] == [
+        ("key-a", 1000.0),
+        ("key-b", 1000.0),
+        ("key-a", 1000.0),
+        ("key-b", 1000.0),
+    ]
+    # With both dry, each waits for its own bucket to refill
+    assert acquired[4:] == [("key-a", 1030.0), ("key-b", 1030.0)]
+    assert clock.sleeps == [30.0]
+
+
+async def serve_completions(requests: list[dict]):
+    async def completions(request):
+        body = await request.json()
+        key = request.headers["Authorization"].removeprefix("Bearer ")
+        requests.append(
+            {"key": key, "peer": request.transport.get_extra_info("peername"), **body}
+        )
+        if key == "throttled":
+            return web.Response(status=429, headers={"Retry-After": "30"})
+        content = mock_good_generator([body["messages"][-1]["content"]])[0]
+        if body.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for start in range(0, len(content), 8):
+                delta = {"content": content[start : start + 8]}
+                chunk = json.dumps({"choices": [{"delta": delta}]})
+                await response.write(f"data: {chunk}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            return response
+        return web.json_response(
+            {
+                "choices": [{"message": {"role": "assistant", "content": content}}],
+                # Some servers send an explicit null when they don't count
+                "usage": None if key == "no-usage" else {"total_tokens": 100},
+            }
+        )
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+def test_backend_rotates_keys_over_pooled_connections(tmp_path):
+    requests: list[dict] = []
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(40)]
+
+    async def run():
+        runner, base_url = await serve_completions(requests)
+        try:
+            async with ChatCompletionsBackend(
+                ["throttled", "key-a", "key-b"],
+                model="mock-model",
+                base_url=base_url,
+                max_connections=4,
+                use_response_format=True,
+                prefix_role="system",
+                temperature=0.4,
+            ) as backend:
+                await agenerate_and_save(
+                    inputs=passages,
+                    output_model=LegalQueries,
+                    generator=backend,
+                    output_file=str(tmp_path / "outputs.jsonl"),
+                    batch_size=1,
+                    max_concurrency=1,
+                    retry_rounds=1,
+                )
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+    records = [
+        json.loads(line)
+        for line in (tmp_path / "outputs.jsonl").read_text().splitlines()
+    ]
+    assert all(record["output"]["questions"] for record in records)
+    assert sum(request["key"] == "throttled" for request in requests) == 1
+    assert {request["key"] for request in requests} == {"throttled", "key-a", "key-b"}
+    assert len({request["peer"] for request in requests}) <= 4
+    assert requests[0]["temperature"] == 0.4
+    assert requests[0]["response_format"]["json_schema"]["name"] == "LegalQueries"
+    # The static part of the template goes first, in a message of its own
+    assert all(
+        request["messages"][0] == {"role": "system", "content": "Domain: "}
+        and request["messages"][1]["content"].startswith("DOMAIN ")
+        for request in requests
+    )
+
+
+def test_backend_rate_limits_per_key():
+    requests: list[dict] = []
+
+    async def run():
+        runner, base_url = await serve_completions(requests)
+        try:
+            async with ChatCompletionsBackend(
+                ["key-a", "key-b"],
+                model="mock-model",
+                base_url=base_url,
+                requests_per_minute=120,
+            ) as backend:
+                start = time.monotonic()
+                await backend(["prompt"] * 8)
+                return time.monotonic() - start
+        finally:
+            await runner.cleanup()
+
+    # 120 requests per key fit in the first burst, the limit only shows
+    # once the buckets run dry
+    assert asyncio.run(run()) < 1.0
+    assert [request["key"] for request in requests].count("key-a") == 4
+
+
+def test_backend_accepts_missing_usage():
+    async def run():
+        runner, base_url = await serve_completions([])
+        try:
+            async with ChatCompletionsBackend(
+                ["no-usage"],
+                model="mock-model",
+                base_url=base_url,
+                tokens_per_minute=10_000,
+                max_attempts=1,
+            ) as backend:
+                return await backend(["prompt"])
+        finally:
+            await runner.cleanup()
+
+    [response] = asyncio.run(run())
+    assert json.loads(response)["questions"]
+
+
+def test_backend_streams_completions(tmp_path):
+    requests: list[dict] = []
+
+    async def run():
+        runner, base_url = await serve_completions(requests)
+        try:
+            async with ChatCompletionsBackend(
+                ["throttled", "key-a"], model="mock-model", base_url=base_url
+            ) as backend:
+                await agenerate_and_save(
+                    inputs=[LegalDomain(domain=f"DOMAIN {i}") for i in range(4)],
+                    output_model=LegalQueries,
+                    generator=backend.as_stream(),
+                    output_file=str(tmp_path / "outputs.jsonl"),
+                    batch_size=2,
+                    retry_rounds=1,
+                )
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+    records = [
+        json.loads(line)
+        for line in (tmp_path / "outputs.jsonl").read_text().splitlines()
+    ]
+    assert len(records) == 4
+    assert all(record["output"]["questions"] for record in records)
+    assert all(request["stream"] for request in requests)
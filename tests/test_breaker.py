@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+
+from json_generator import (
+    CircuitBreaker,
+    CircuitOpenError,
+    agenerate_and_save,
+    generate_and_save,
+)
+from json_generator.stats import GenerationStats
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+
+def test_breaker_trips_and_recovers():
+    breaker = CircuitBreaker(min_requests=4, base_delay=0.01, jitter=0.0)
+
+    assert not breaker.record(successes=3, failures=0)
+    assert breaker.record(successes=0, failures=3)
+    assert breaker.state == "open"
+    assert breaker.wait_time() > 0
+
+    while breaker.wait_time() > 0:
+        pass
+    assert breaker.state == "half_open"
+    # Only one caller gets to probe
+    assert breaker.wait_time() > 0
+
+    assert not breaker.record(successes=1, failures=0, probe=True)
+    assert breaker.state == "closed"
+
+
+def test_breaker_gives_up():
+    breaker = CircuitBreaker(min_requests=1, base_delay=0.001, max_trips=2)
+    guarded = breaker.guard(lambda texts: [""] * len(texts))
+
+    with pytest.raises(CircuitOpenError):
+        guarded(["prompt"])
+    assert breaker.trips == 3
+
+
+def test_generate_and_save_requeues_outage(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(20)]
+    calls = 0
+
+    def mock_flaky_generator(texts: list[str]) -> list[str]:
+        nonlocal calls
+        calls += 1
+        # The backend is down for a few calls in the middle of the run
+        if 3 <= calls < 6:
+            return [""] * len(texts)
+        return mock_good_generator(texts)
+
+    stats = GenerationStats()
+    output_file = tmp_path / "outputs.jsonl"
+    generate_and_save(
+        inputs=passages,
+        output_model=LegalQueries,
+        generator=mock_flaky_generator,
+        output_file=str(output_file),
+        retry_rounds=1,
+        breaker=CircuitBreaker(min_requests=4, base_delay=0.001),
+        stats=stats,
+    )
+
+    assert stats.breaker_trips >= 1
+    assert stats.requeued_prompts >= 4
+    assert stats.failed_prompts == 0
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert len(records) == 20
+    assert all(record["output"]["aspects"] for record in records)
+
+
+def test_agenerate_and_save_requeues_outage(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(20)]
+    calls = 0
+
+    async def mock_flaky_generator(texts: list[str]) -> list[str]:
+        nonlocal calls
+        calls += 1
+        failing = calls <= 4
+        await asyncio.sleep(0.001)
+        if failing:
+            raise ConnectionError("Backend unavailable")
+        return mock_good_generator(texts)
+
+    stats = GenerationStats()
+    asyncio.run(
+        agenerate_and_save(
+            inputs=passages,
+            output_model=LegalQueries,
+            generator=mock_flaky_generator,
+            output_file=str(tmp_path / "outputs.jsonl"),
+            retry_rounds=1,
+            breaker=CircuitBreaker(min_requests=4, base_delay=0.001),
+            stats=stats,
+        )
+    )
+
+    assert stats.breaker_trips >= 1
+    assert stats.failed_prompts == 0
+    records = [
+        json.loads(line)
+        for line in (tmp_path / "outputs.jsonl").read_text().splitlines()
+    ]
+    assert len(records) == 20
+    assert all(record["output"]["aspects"] for record in records)
@@ -0,0 +1,82 @@
+import time
+
+from json_generator import ResponseCache, generate_batch
+
+from test_generate import (
+    LegalDomain,
+    LegalQueries,
+    mock_good_generator,
+    mock_somewhat_bad_generator,
+)
+
+
+def test_cache_round_trip(tmp_path):
+    with ResponseCache(str(tmp_path / "cache.db"), fingerprint="model-a") as cache:
+        cache.put_many(["a", "b"], ['{"x": 1}', '{"x": 2}'])
+
+        assert cache.get_many(["a", "c", "b"]) == ['{"x": 1}', None, '{"x": 2}']
+        assert (cache.hits, cache.misses) == (2, 1)
+
+    # The fingerprint is part of the key
+    with ResponseCache(str(tmp_path / "cache.db"), fingerprint="model-b") as cache:
+        assert cache.get_many(["a"]) == [None]
+
+
+def test_cache_eviction(tmp_path):
+    path = str(tmp_path / "cache.db")
+    with ResponseCache(path, max_bytes=10) as cache:
+        cache.put_many(["a", "b"], ["aaaa", "bbbb"])
+        cache.get_many(["a"])
+        cache.put_many(["c"], ["cccc"])
+
+        # "b" is the least recently used entry
+        assert cache.get_many(["a", "b", "c"]) == ["aaaa", None, "cccc"]
+
+    with ResponseCache(path, max_age=0.01) as cache:
+        time.sleep(0.02)
+        assert cache.get_many(["a"]) == [None]
+        cache.evict()
+        assert len(cache) == 0
+
+
+def test_cache_eviction_within_a_batch(tmp_path):
+    # Entries stored together share an access time, eviction must still
+    # only drop as many of them as needed, oldest first
+    with ResponseCache(str(tmp_path / "cache.db"), max_bytes=500) as cache:
+        prompts = [f"prompt {i}" for i in range(10)]
+        cache.put_many(prompts, [str(i) * 100 for i in range(10)])
+
+        assert len(cache) == 5
+        assert cache.get_many(prompts[4:6]) == [None, "5" * 100]
+
+
+def test_generate_batch_uses_cache(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(3)]
+    prompts: list[str] = []
+
+    def mock_recording_generator(texts: list[str]) -> list[str]:
+        prompts.extend(texts)
+        return mock_somewhat_bad_generator(texts)
+
+    with ResponseCache(str(tmp_path / "cache.db")) as cache:
+        # Only validated outputs are stored
+        generate_batch(
+            passages,
+            LegalQueries,
+            mock_recording_generator,
+            retry_rounds=0,
+            cache=cache,
+        )
+        assert len(cache) == 1
+
+        prompts.clear()
+        outputs = generate_batch(
+            passages, LegalQueries, mock_good_generator, cache=cache
+        )
+        assert len(cache) == 3
+
+        outputs = generate_batch(
+            passages, LegalQueries, mock_recording_generator, cache=cache
+        )
+        assert prompts == []
+        assert all(output.aspects for output in outputs)
@@ -1,4 +1,17 @@
-from json_generator import generate_batch, InputModel, OutputModel
+import asyncio
+import json
+
+from json_generator import (
+    agenerate_and_save,
+    agenerate_batch,
+    GenerationStats,
+    generate_and_save,
+    generate_batch,
+    InputModel,
+    OutputModel,
+    placeholder,
+)
+from json_generator.protocols import group_by_prefix
 
 
 class LegalPassage(InputModel):
@@ -8,6 +21,11 @@ class LegalPassage(InputModel):
     grounded_content: str
 
 
+class LegalDomain(InputModel):
+    input_prompt: str = "Domain: {$DOC_DOMAIN}"
+    domain: str = placeholder("{$DOC_DOMAIN}")
+
+
 class LegalQueries(OutputModel):
     aspects: list[str]
     questions: list[str]
@@ -139,3 +157,240 @@ def test_somewhat_bad_generate():
             "Pháp luật quy định những hình thức xử lý như thế nào đối với những hành vi vi phạm về bảo vệ sức khỏe nhân dân?",
         ],
     ]
+
+
+def test_agenerate_batch():
+    passages = [
+        LegalPassage(
+            domain="CIVIL",
+            source="Bộ luật dân sự 2015",
+            grounded_content="Người có nghĩa vụ trả tiền thuê nhà phải trả tiền thuê đúng hạn, trừ trường hợp có thoả thuận khác.",
+        ),
+        LegalPassage(
+            domain="CIVIL",
+            source="Bộ luật dân sự 2015",
+            grounded_content="Người có nghĩa vụ trả tiền thuê nhà phải trả tiền thuê đúng hạn, trừ trường hợp có thoả thuận khác.",
+        ),
+    ]
+
+    async def mock_async_generator(texts: list[str]) -> list[str]:
+        return mock_somewhat_bad_generator(texts)
+
+    outputs: list[LegalQueries] = asyncio.run(
+        agenerate_batch(passages, LegalQueries, mock_async_generator)
+    )
+
+    assert [len(output.aspects) for output in outputs] == [2, 2]
+    assert [len(output.questions) for output in outputs] == [2, 2]
+
+
+def test_agenerate_and_save(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(10)]
+    in_flight = 0
+    max_in_flight = 0
+
+    async def mock_slow_generator(texts: list[str]) -> list[str]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return mock_good_generator(texts)
+
+    output_file = tmp_path / "outputs.jsonl"
+    asyncio.run(
+        agenerate_and_save(
+            inputs=passages,
+            output_model=LegalQueries,
+            generator=mock_slow_generator,
+            batch_size=2,
+            max_concurrency=3,
+            output_file=str(output_file),
+        )
+    )
+
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert [record["input"]["domain"] for record in records] == [
+        f"DOMAIN {i}" for i in range(10)
+    ]
+    assert max_in_flight == 3
+
+
+def test_generate_and_save_streams_inputs(tmp_path):
+    consumed = 0
+    generated = 0
+
+    def passages():
+        nonlocal consumed
+        for i in range(5):
+            consumed += 1
+            yield LegalDomain(domain=f"DOMAIN {i}")
+
+    def mock_checking_generator(texts: list[str]) -> list[str]:
+        nonlocal generated
+        # Inputs are pulled one batch at a time, not loaded up front
+        generated += len(texts)
+        assert consumed == generated
+        return mock_good_generator(texts)
+
+    output_file = tmp_path / "outputs.jsonl"
+    generate_and_save(
+        inputs=passages(),
+        output_model=LegalQueries,
+        generator=mock_checking_generator,
+        batch_size=2,
+        output_file=str(output_file),
+        total=5,
+    )
+
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert [record["input"]["domain"] for record in records] == [
+        f"DOMAIN {i}" for i in range(5)
+    ]
+
+
+def test_generate_batch_retries_in_rounds():
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(4)]
+    calls: list[int] = []
+
+    def mock_flaky_generator(texts: list[str]) -> list[str]:
+        calls.append(len(texts))
+        if len(calls) < 3:
+            return mock_somewhat_bad_generator(texts)
+        return mock_good_generator(texts)
+
+    outputs: list[LegalQueries] = generate_batch(
+        passages, LegalQueries, mock_flaky_generator, retry_rounds=5
+    )
+
+    # 3 bad on the first call, 2 of those still bad after the first round
+    assert calls == [4, 3, 2]
+    assert all(output.aspects for output in outputs)
+
+
+def test_generate_batch_retry_rounds_exhausted(caplog):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(3)]
+    calls: list[int] = []
+
+    def mock_recording_bad_generator(texts: list[str]) -> list[str]:
+        calls.append(len(texts))
+        return mock_bad_generator(texts)
+
+    outputs: list[LegalQueries] = generate_batch(
+        passages, LegalQueries, mock_recording_bad_generator, retry_rounds=2
+    )
+
+    assert calls == [3, 3, 3]
+    assert [output.aspects for output in outputs] == [[], [], []]
+    assert "3 prompts still bad after 2 retry rounds" in caplog.text
+
+
+def test_generate_batch_dedupes_prompts():
+    passages = [
+        LegalPassage(domain="CIVIL", source="", grounded_content="") for _ in range(4)
+    ]
+    calls: list[list[str]] = []
+
+    def mock_recording_generator(texts: list[str]) -> list[str]:
+        calls.append(texts)
+        return mock_good_generator(texts)
+
+    stats = GenerationStats()
+    outputs: list[LegalQueries] = generate_batch(
+        passages, LegalQueries, mock_recording_generator, stats=stats
+    )
+
+    assert [len(texts) for texts in calls] == [1]
+    assert len(outputs) == 4
+    assert all(output.aspects for output in outputs)
+    assert stats.inputs == 4
+    assert stats.duplicate_prompts == 3
+    assert stats.generated_prompts == 1
+
+
+def test_generate_and_save_dedupes_across_batches(tmp_path):
+    domains = [f"DOMAIN {i % 3}" for i in range(9)]
+    generated: list[str] = []
+
+    def mock_recording_generator(texts: list[str]) -> list[str]:
+        generated.extend(texts)
+        return mock_good_generator(texts)
+
+    async def mock_slow_generator(texts: list[str]) -> list[str]:
+        await asyncio.sleep(0.01)
+        return mock_recording_generator(texts)
+
+    def run(name: str, **kwargs) -> GenerationStats:
+        stats = GenerationStats()
+        output_file = tmp_path / f"{name}.jsonl"
+        kwargs.update(
+            inputs=[LegalDomain(domain=domain) for domain in domains],
+            output_model=LegalQueries,
+            batch_size=2,
+            output_file=str(output_file),
+            stats=stats,
+        )
+        if name == "async":
+            asyncio.run(agenerate_and_save(generator=mock_slow_generator, **kwargs))
+        else:
+            generate_and_save(generator=mock_recording_generator, **kwargs)
+
+        records = [json.loads(line) for line in output_file.read_text().splitlines()]
+        assert [record["input"]["domain"] for record in records] == domains
+        assert all(record["output"]["aspects"] for record in records)
+        return stats
+
+    stats = run("sync")
+    assert sorted(generated) == [
+        "Domain: DOMAIN 0",
+        "Domain: DOMAIN 1",
+        "Domain: DOMAIN 2",
+    ]
+    assert (stats.inputs, stats.duplicate_prompts) == (9, 6)
+
+    # Batches running at once wait on each other's outputs
+    generated.clear()
+    stats = run("async", max_concurrency=4)
+    assert len(generated) == 3
+    assert (stats.inputs, stats.duplicate_prompts) == (9, 6)
+
+    generated.clear()
+    run("window", dedupe_window=1)
+    assert len(generated) > 3
+
+
+def test_generate_batch_repairs_responses():
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(2)]
+    calls: list[int] = []
+
+    def mock_fenced_generator(texts: list[str]) -> list[str]:
+        calls.append(len(texts))
+        return [
+            '```json\n{"aspects": ["Điều 3 "Giải thích từ ngữ""], "questions": [],}\n```'
+        ] * len(texts)
+
+    stats = GenerationStats()
+    outputs: list[LegalQueries] = generate_batch(
+        passages, LegalQueries, mock_fenced_generator, stats=stats
+    )
+
+    assert calls == [2]
+    assert [output.aspects for output in outputs] == [
+        ['Điều 3 "Giải thích từ ngữ"'],
+        ['Điều 3 "Giải thích từ ngữ"'],
+    ]
+    assert stats.repaired_responses == 2
+
+
+def test_generate_batch_sends_split_prompts():
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(4)]
+    sent: list[str] = []
+
+    def mock_prefix_generator(texts: list[str]) -> list[str]:
+        sent.extend(texts)
+        assert group_by_prefix(texts) == {"Domain: ": [0, 1, 2, 3]}
+        return mock_good_generator(texts)
+
+    generate_batch(passages, LegalQueries, mock_prefix_generator)
+
+    assert [prompt.suffix for prompt in sent] == [f"DOMAIN {i}" for i in range(4)]
@@ -0,0 +1,143 @@
+import asyncio
+
+from json_generator import HedgePolicy, GenerationStats, agenerate_and_save
+from json_generator.hedging import HedgedGenerator, LatencyTracker
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker(window=100)
+    for latency in range(1, 101):
+        tracker.record(latency / 100)
+
+    assert tracker.percentile(0.5) == 0.51
+    assert tracker.percentile(0.99) == 1.0
+
+
+def make_hedged(generator) -> HedgedGenerator:
+    hedged = HedgedGenerator(
+        generator,
+        HedgePolicy(percentile=0.5, max_extra_fraction=1.0, min_samples=5),
+        is_valid=lambda response: response.startswith("{"),
+    )
+    # Requests so far took 10ms, so a prompt is hedged after 10ms
+    for _ in range(5):
+        hedged.tracker.record(0.01)
+    return hedged
+
+
+def test_hedged_generator_takes_first_valid_response():
+    never = asyncio.Event()
+    calls = 0
+
+    async def mock_straggling_generator(texts: list[str]) -> list[str]:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            # The primary request hangs until cancelled
+            await never.wait()
+        return mock_good_generator(texts)
+
+    hedged = make_hedged(mock_straggling_generator)
+
+    async def run() -> list[str]:
+        responses = await hedged(["prompt"])
+        # Let the cancelled straggler record its latency
+        await asyncio.sleep(0)
+        return responses
+
+    assert asyncio.run(run()) == mock_good_generator(["prompt"])
+    assert hedged.hedges == 1
+    assert hedged.hedge_wins == 1
+    # The straggler is recorded with at least the time it ran
+    assert len(hedged.tracker) == 7
+    assert hedged.tracker.percentile(1.0) >= 0.01
+
+
+def test_failed_hedge_does_not_win():
+    hedge_failed = asyncio.Event()
+    calls = 0
+
+    async def mock_failing_hedge_generator(texts: list[str]) -> list[str]:
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            hedge_failed.set()
+            raise ConnectionError("Backend unavailable")
+        # The primary answers only once the hedge has failed
+        await hedge_failed.wait()
+        return mock_good_generator(texts)
+
+    hedged = make_hedged(mock_failing_hedge_generator)
+
+    assert asyncio.run(hedged(["prompt"])) == mock_good_generator(["prompt"])
+    assert hedged.hedges == 1
+    assert hedged.hedge_wins == 0
+
+
+def test_hedge_is_sent_after_failed_primary():
+    calls = 0
+
+    async def mock_failing_primary_generator(texts: list[str]) -> list[str]:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ConnectionError("Backend unavailable")
+        return mock_good_generator(texts)
+
+    hedged = make_hedged(mock_failing_primary_generator)
+
+    assert asyncio.run(hedged(["prompt"])) == mock_good_generator(["prompt"])
+    assert hedged.hedge_wins == 1
+
+    async def mock_failing_generator(texts: list[str]) -> list[str]:
+        raise ConnectionError("Backend unavailable")
+
+    hedged = make_hedged(mock_failing_generator)
+    assert asyncio.run(hedged(["prompt"])) == [""]
+    assert hedged.hedges == 1
+
+
+def test_hedge_budget():
+    async def mock_slow_generator(texts: list[str]) -> list[str]:
+        await asyncio.sleep(0.01)
+        return [""] * len(texts)
+
+    hedged = HedgedGenerator(
+        mock_slow_generator,
+        HedgePolicy(percentile=0.0, max_extra_fraction=0.1, min_samples=1),
+        is_valid=lambda response: False,
+    )
+
+    async def run():
+        for _ in range(20):
+            await hedged(["prompt"])
+
+    asyncio.run(run())
+
+    assert hedged.hedges <= 2
+
+
+def test_agenerate_and_save_hedged(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(20)]
+
+    async def mock_async_generator(texts: list[str]) -> list[str]:
+        await asyncio.sleep(0.001)
+        return mock_good_generator(texts)
+
+    stats = GenerationStats()
+    asyncio.run(
+        agenerate_and_save(
+            inputs=passages,
+            output_model=LegalQueries,
+            generator=mock_async_generator,
+            batch_size=1,
+            output_file=str(tmp_path / "outputs.jsonl"),
+            hedge=HedgePolicy(),
+            stats=stats,
+        )
+    )
+
+    assert stats.generated_prompts == 20
+    assert len((tmp_path / "outputs.jsonl").read_text().splitlines()) == 20
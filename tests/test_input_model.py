@@ -1,3 +1,8 @@
+import pickle
+from typing import Optional
+
+from pydantic import BaseModel
+
 from json_generator.data_module import InputModel, placeholder
 
 
@@ -18,3 +23,57 @@ def test_to_prompt():
         legal_passage.to_prompt()
         == "CIVIL - Bộ luật dân sự 2015 - Người có nghĩa vụ trả tiền thuê nhà phải trả tiền thuê đúng hạn, trừ trường hợp có thoả thuận khác."
     )
+
+
+def legacy_to_prompt(input_model: InputModel) -> str:
+    field_data = input_model.model_dump(by_alias=True)
+    input_prompt = input_model.input_prompt
+    for placeholder, actual_value in field_data.items():
+        input_prompt = input_prompt.replace(placeholder, str(actual_value))
+    return input_prompt
+
+
+def test_to_prompt_matches_sequential_replace():
+    class Source(BaseModel):
+        name: str
+        year: int
+
+    class LegalPassage(InputModel):
+        input_prompt: str = (
+            "{$DOC} {$DOC_DOMAIN} {{$DOC}} source: {$SOURCE} ({$YEAR}, {$FLAG})"
+        )
+        domain: str = placeholder("{$DOC_DOMAIN}")
+        doc: str = placeholder("{$DOC}")
+        source: Source = placeholder("{$SOURCE}")
+        year: int = placeholder("{$YEAR}")
+        flag: Optional[bool] = placeholder("{$FLAG}")
+
+    legal_passage = LegalPassage(
+        domain="CIVIL",
+        doc="Bộ luật dân sự 2015",
+        source=Source(name="Quốc hội", year=2015),
+        year=2015,
+        flag=None,
+    )
+
+    assert legal_passage.to_prompt() == legacy_to_prompt(legal_passage)
+    assert (
+        InputModel.render_many([legal_passage, legal_passage])
+        == [legacy_to_prompt(legal_passage)] * 2
+    )
+
+
+def test_split_prompt():
+    class LegalPassage(InputModel):
+        input_prompt: str = "Generate queries.\nDomain: {$DOC_DOMAIN}\nDone."
+        domain: str = placeholder("{$DOC_DOMAIN}")
+
+    first, second = InputModel.render_many(
+        [LegalPassage(domain="CIVIL"), LegalPassage(domain="CRIMINAL")], split=True
+    )
+
+    assert first == LegalPassage(domain="CIVIL").to_prompt()
+    assert first.prefix == "Generate queries.\nDomain: "
+    assert first.suffix == "CIVIL\nDone."
+    assert first.prefix is second.prefix
+    assert pickle.loads(pickle.dumps(first)).suffix == "CIVIL\nDone."
@@ -0,0 +1,60 @@
+import gzip
+import json
+
+from json_generator import InputModel, load_batches, load_inputs, placeholder
+from json_generator.loaders import BadRow
+
+
+class LegalQuery(InputModel):
+    input_prompt: str = "{$QUERY} ({$DOMAIN})"
+    query: str = placeholder("{$QUERY}")
+    domain: str = placeholder("{$DOMAIN}")
+    year: int = 2015
+
+
+def test_load_jsonl_batches(tmp_path):
+    path = tmp_path / "queries.jsonl.gz"
+    lines = [json.dumps({"query": f"Q{i}", "domain": "CIVIL"}) for i in range(5)]
+    lines[1] = '{"query": "Q1", "domain": '
+    lines[3] = json.dumps({"query": "Q3", "domain": "CIVIL", "year": "unknown"})
+    lines.append(json.dumps({"{$QUERY}": "Q5", "{$DOMAIN}": "CRIMINAL"}))
+    with gzip.open(path, "wt") as f:
+        f.write("\n".join(lines) + "\n\n")
+
+    bad_rows: list[BadRow] = []
+    batches = list(
+        load_batches(str(path), LegalQuery, batch_size=3, on_error=bad_rows.append)
+    )
+
+    assert [[query.query for query in batch] for batch in batches] == [
+        ["Q0", "Q2"],
+        ["Q4", "Q5"],
+    ]
+    assert batches[1][1].to_prompt() == "Q5 (CRIMINAL)"
+    assert [(bad_row.line, bad_row.error[:12]) for bad_row in bad_rows] == [
+        (2, "Invalid JSON"),
+        (4, "year: Input "),
+    ]
+
+
+def test_load_csv_inputs(tmp_path):
+    path = tmp_path / "queries.csv"
+    path.write_text(
+        'question,domain,year\n"Q0, multi\nline",CIVIL,\nQ1,CRIMINAL,2020\n,CIVIL,\n'
+    )
+
+    bad_rows: list[BadRow] = []
+    inputs = list(
+        load_inputs(
+            str(path),
+            LegalQuery,
+            columns={"question": "query"},
+            on_error=bad_rows.append,
+        )
+    )
+
+    assert [(i.query, i.domain, i.year) for i in inputs] == [
+        ("Q0, multi\nline", "CIVIL", 2015),
+        ("Q1", "CRIMINAL", 2020),
+    ]
+    assert [bad_row.line for bad_row in bad_rows] == [5]
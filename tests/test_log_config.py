@@ -0,0 +1,64 @@
+import logging
+import os
+import subprocess
+import sys
+
+from json_generator import configure_logging, generate_and_save
+from json_generator.log_config import stop_logging
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+
+def run(tmp_path, **options) -> str:
+    log_file = configure_logging(str(tmp_path / "logs"), **options)
+    try:
+        generate_and_save(
+            inputs=[LegalDomain(domain=f"DOMAIN {i}") for i in range(20)],
+            output_model=LegalQueries,
+            generator=mock_good_generator,
+            output_file=str(tmp_path / "outputs.jsonl"),
+        )
+    finally:
+        stop_logging()
+        logging.getLogger().setLevel(logging.WARNING)
+    with open(log_file) as f:
+        return f.read()
+
+
+def test_configure_logging_dumps_records(tmp_path):
+    log = run(tmp_path)
+
+    assert log.count("Input: {") == 20
+    assert "Run stats" in log
+
+
+def test_configure_logging_gates_records(tmp_path):
+    assert "Input: {" not in run(tmp_path, log_records=False)
+    assert "Input: {" not in run(tmp_path, record_sample_rate=0.0)
+
+
+def test_library_is_silent_without_configure_logging():
+    # A fresh interpreter, as pytest installs log handlers of its own
+    script = (
+        "from json_generator import generate_batch\n"
+        "from test_generate import LegalDomain, LegalQueries, mock_bad_generator\n"
+        "generate_batch([LegalDomain(domain='CIVIL')], LegalQueries,"
+        " mock_bad_generator, retry_rounds=1)\n"
+    )
+    tests_dir = os.path.dirname(__file__)
+    path = os.pathsep.join(
+        [
+            os.path.join(tests_dir, "..", "src"),
+            tests_dir,
+            os.environ.get("PYTHONPATH", ""),
+        ]
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": path},
+        check=True,
+    )
+
+    assert result.stderr == ""
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import urllib.request
+
+from json_generator import RunMetrics, agenerate_and_save, generate_and_save
+from json_generator.metrics import Histogram
+
+from test_generate import (
+    LegalDomain,
+    LegalQueries,
+    mock_good_generator,
+    mock_somewhat_bad_generator,
+)
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(0.1, 1.0, 10.0))
+    for value in [0.05] * 90 + [0.5] * 9 + [5.0]:
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.95) == 1.0
+    assert histogram.quantile(1.0) == 5.0
+    assert histogram.to_dict()["count"] == 100
+
+
+def test_generate_and_save_metrics(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(10)]
+    seen_stages: set[str] = set()
+
+    metrics = RunMetrics(hooks=(lambda stage, seconds: seen_stages.add(stage),))
+    generate_and_save(
+        inputs=passages,
+        output_model=LegalQueries,
+        generator=mock_somewhat_bad_generator,
+        output_file=str(tmp_path / "outputs.jsonl"),
+        metrics=metrics,
+    )
+
+    summary = metrics.summary()
+    assert {"render", "generate", "parse", "retry", "write", "batch"} <= seen_stages
+    assert summary["stages"]["batch"]["count"] == 3
+    assert summary["counters"]["inputs"] == 10
+    assert summary["counters"]["records_written"] == 10
+    assert summary["counters"]["bad_responses"] > 0
+    assert summary["throughput"]["inputs_per_second"] > 0
+
+    metrics.write_json(str(tmp_path / "metrics.json"))
+    assert json.loads((tmp_path / "metrics.json").read_text())["counters"]
+
+
+def test_metrics_endpoint(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(4)]
+
+    async def mock_async_generator(texts: list[str]) -> list[str]:
+        return mock_good_generator(texts)
+
+    metrics = RunMetrics()
+    asyncio.run(
+        agenerate_and_save(
+            inputs=passages,
+            output_model=LegalQueries,
+            generator=mock_async_generator,
+            output_file=str(tmp_path / "outputs.jsonl"),
+            metrics=metrics,
+        )
+    )
+
+    server = metrics.serve(port=0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert 'json_generator_stage_seconds_count{stage="generate"} 1' in text
+    assert "json_generator_records_written_total 4" in text
@@ -0,0 +1,43 @@
+import json
+
+from json_generator.mock import LoadProfile, SyntheticBackend
+
+from test_generate import LegalQueries
+
+
+def test_synthetic_backend_follows_profile():
+    backend = SyntheticBackend(
+        LegalQueries,
+        LoadProfile(
+            latency=0.5,
+            latency_sigma=1.0,
+            failure_rate=0.1,
+            malformed_rate=0.2,
+            string_length=100,
+            list_length=3,
+        ),
+        seed=0,
+    )
+    latency, responses = backend.answer(["prompt"] * 1000)
+
+    assert latency > 0
+    assert backend.failures + backend.malformed == 1000 - responses.count(
+        backend.response
+    )
+    assert 50 < backend.failures < 150
+    assert 150 < backend.malformed < 250
+    output = json.loads(backend.response)
+    assert len(output["aspects"]) == 3
+    assert all(len(aspect) == 100 for aspect in output["aspects"])
+
+
+def test_synthetic_backend_throttling_bursts():
+    backend = SyntheticBackend(
+        LegalQueries, LoadProfile(burst_every=60, burst_length=30, throttle_latency=2)
+    )
+    assert backend(["prompt"]) == [""]
+    assert backend.answer(["prompt"]) == (2, [""])
+    assert backend.throttled_calls == 2
+
+    backend._start -= 30
+    assert backend(["prompt"]) == [backend.response]
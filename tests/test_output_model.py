@@ -1,4 +1,7 @@
+from pydantic import ConfigDict
+
 from json_generator.data_module import OutputModel
+from json_generator.generate import empty_output, parse_responses
 
 
 def test_output_model():
@@ -21,3 +24,27 @@ def test_output_model():
 
     assert empty_legal_query.aspects == []
     assert empty_legal_query.questions == []
+
+
+def test_empty_output_shared_for_frozen_models():
+    class FrozenQueries(OutputModel):
+        model_config = ConfigDict(frozen=True)
+        questions: tuple[str, ...]
+
+        @classmethod
+        def empty(cls) -> "FrozenQueries":
+            return cls(questions=())
+
+    class Queries(OutputModel):
+        questions: list[str]
+
+        @classmethod
+        def empty(cls) -> "Queries":
+            return cls(questions=[])
+
+    assert empty_output(FrozenQueries) is empty_output(FrozenQueries)
+    assert empty_output(Queries) is not empty_output(Queries)
+
+    outputs, bad = parse_responses(["Bad", "Bad"], FrozenQueries)
+    assert bad == [0, 1]
+    assert outputs[0] is outputs[1]
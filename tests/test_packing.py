@@ -0,0 +1,80 @@
+import json
+
+from json_generator import generate_and_save
+from json_generator.packing import pack_batches
+from json_generator.utils import ReorderBuffer
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+
+def count_characters(prompt: str) -> int:
+    return len(prompt)
+
+
+# "Domain: " plus the domain, so prompt sizes are 8 + len(domain)
+PASSAGES = [LegalDomain(domain="x" * size) for size in [2, 92, 2, 12, 2, 42]]
+
+
+def test_pack_batches_respects_budget():
+    batches = list(pack_batches(PASSAGES, max_tokens=40, count_tokens=count_characters))
+
+    assert [[position for position, _ in batch] for batch in batches] == [
+        [0],
+        [1],
+        [2, 3, 4],
+        [5],
+    ]
+
+
+def test_pack_batches_sorts_within_lookahead():
+    batches = list(
+        pack_batches(
+            PASSAGES,
+            max_tokens=40,
+            count_tokens=count_characters,
+            max_batch_size=2,
+            lookahead=3,
+        )
+    )
+
+    assert [[position for position, _ in batch] for batch in batches] == [
+        [0, 2],
+        [1],
+        [4, 3],
+        [5],
+    ]
+
+
+def test_reorder_buffer():
+    reorder: ReorderBuffer[str] = ReorderBuffer()
+
+    assert reorder.push(1, "b") == []
+    assert reorder.push(0, "a") == ["a", "b"]
+    assert reorder.push(2, "c") == ["c"]
+    assert len(reorder) == 0
+
+
+def test_generate_and_save_packed(tmp_path):
+    output_file = tmp_path / "outputs.jsonl"
+    batch_sizes: list[int] = []
+
+    def mock_recording_generator(texts: list[str]) -> list[str]:
+        batch_sizes.append(len(texts))
+        return mock_good_generator(texts)
+
+    generate_and_save(
+        inputs=PASSAGES,
+        output_model=LegalQueries,
+        generator=mock_recording_generator,
+        output_file=str(output_file),
+        max_batch_tokens=40,
+        count_tokens=count_characters,
+        lookahead=6,
+        dedupe=False,
+    )
+
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert [record["input"] for record in records] == [
+        passage.model_dump(exclude={"input_prompt"}) for passage in PASSAGES
+    ]
+    assert batch_sizes == [3, 1, 1, 1]
@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from json_generator import OutputReader, generate_and_save
+from json_generator.sinks import record_line
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+
+def write_outputs(path, count: int, start: int = 0):
+    generate_and_save(
+        inputs=[LegalDomain(domain=f"domain {i}") for i in range(start, count)],
+        output_model=LegalQueries,
+        generator=mock_good_generator,
+        output_file=str(path),
+        resume=start > 0,
+    )
+
+
+def test_reader_random_access(tmp_path):
+    path = tmp_path / "outputs.jsonl"
+    write_outputs(path, 20)
+
+    with OutputReader(str(path), LegalQueries, LegalDomain) as reader:
+        assert len(reader) == 20
+        assert reader[3].input.domain == "domain 3"
+        assert reader[-1].input.domain == "domain 19"
+        assert isinstance(reader[0].output, LegalQueries)
+        assert [r.input.domain for r in reader[5:8]] == [
+            "domain 5",
+            "domain 6",
+            "domain 7",
+        ]
+        assert json.loads(reader.raw(2))["input"]["domain"] == "domain 2"
+
+        sample = reader.sample(5, seed=0)
+        assert len({r.input.domain for r in sample}) == 5
+        assert [r.input.domain for r in reader.sample(5, seed=0)] == [
+            r.input.domain for r in sample
+        ]
+
+        [found] = reader.find(LegalDomain(domain="domain 11"))
+        assert found.input.domain == "domain 11"
+        assert reader.find({"domain": "missing"}) == []
+
+        with pytest.raises(IndexError):
+            reader[20]
+
+
+def test_reader_reuses_and_extends_its_index(tmp_path):
+    path = tmp_path / "outputs.jsonl"
+    write_outputs(path, 10)
+
+    with OutputReader(str(path), LegalQueries) as reader:
+        reader.find({"domain": "domain 0"})
+    assert (tmp_path / "outputs.jsonl.idx").exists()
+
+    with OutputReader(str(path), LegalQueries) as reader:
+        assert len(reader) == 10
+        # A record being written is left out until its line is complete
+        line = record_line(LegalDomain(domain="domain 10"), reader[0].output)
+        with open(path, "a") as f:
+            f.write(line[:20])
+            f.flush()
+            assert reader.refresh() == 0
+            f.write(line[20:])
+        assert reader.refresh() == 1
+        assert reader[10].input["domain"] == "domain 10"
+        assert len(reader.find({"domain": "domain 10"})) == 1
+
+    # Appended records are picked up from the cached index on reopening
+    write_outputs(path, 15, start=11)
+    with OutputReader(str(path), LegalQueries) as reader:
+        assert len(reader) == 15
+        assert [r.input["domain"] for r in reader.follow(13, idle_timeout=0)] == [
+            "domain 13",
+            "domain 14",
+        ]
+
+    # A rewritten file invalidates the index
+    write_outputs(path, 3)
+    with OutputReader(str(path), LegalQueries) as reader:
+        assert len(reader) == 3
+        assert reader.find({"domain": "domain 12"}) == []
+
+
+def test_reader_saves_index_on_close(tmp_path):
+    path = tmp_path / "outputs.jsonl"
+    index_path = tmp_path / "outputs.jsonl.idx"
+    write_outputs(path, 5)
+
+    reader = OutputReader(str(path), LegalQueries, save_every=10)
+    output = reader[0].output
+    with open(path, "a") as f:
+        for i in range(5, 9):
+            f.write(record_line(LegalDomain(domain=f"domain {i}"), output))
+            f.flush()
+            assert reader.refresh() == 1
+    # Following a live file does not rewrite the index on every poll
+    assert not index_path.exists()
+
+    with open(path, "a") as f:
+        f.write(record_line(LegalDomain(domain="domain 9"), output))
+    assert reader.refresh() == 1
+    assert index_path.exists()
+
+    with open(path, "a") as f:
+        f.write(record_line(LegalDomain(domain="domain 10"), output))
+    reader.refresh()
+    reader.close()
+
+    with OutputReader(str(path), LegalQueries) as reader:
+        assert reader._unsaved == 0
+        assert len(reader) == 11
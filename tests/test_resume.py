@@ -0,0 +1,60 @@
+import json
+
+from json_generator import generate_and_save
+from json_generator.resume import input_key, load_completed
+
+from test_generate import (
+    LegalDomain,
+    LegalPassage,
+    LegalQueries,
+    mock_good_generator,
+)
+
+
+def test_resume(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(6)]
+    output_file = tmp_path / "outputs.jsonl"
+
+    generate_and_save(
+        inputs=passages[:3],
+        output_model=LegalQueries,
+        generator=mock_good_generator,
+        output_file=str(output_file),
+    )
+    # Simulate a crash in the middle of writing the fourth record
+    with open(output_file, "a") as f:
+        f.write('{"input": {"domain": "DOMAIN 3", "sou')
+
+    prompts: list[str] = []
+
+    def mock_recording_generator(texts: list[str]) -> list[str]:
+        prompts.extend(texts)
+        return mock_good_generator(texts)
+
+    generate_and_save(
+        inputs=passages,
+        output_model=LegalQueries,
+        generator=mock_recording_generator,
+        output_file=str(output_file),
+        resume=True,
+    )
+
+    assert len(prompts) == 3
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert [record["input"]["domain"] for record in records] == [
+        f"DOMAIN {i}" for i in range(6)
+    ]
+
+
+def test_load_completed_counts_duplicates(tmp_path):
+    passage = LegalPassage(domain="CIVIL", source="", grounded_content="")
+    output_file = tmp_path / "outputs.jsonl"
+
+    generate_and_save(
+        inputs=[passage, passage],
+        output_model=LegalQueries,
+        generator=mock_good_generator,
+        output_file=str(output_file),
+    )
+
+    assert load_completed(str(output_file)) == {input_key(passage): 2}
@@ -0,0 +1,123 @@
+import asyncio
+
+from pydantic import BaseModel
+
+from json_generator import (
+    GenerationStats,
+    OutputModel,
+    agenerate_and_save,
+    generate_and_save,
+    generate_batch,
+    response_format,
+    schema_guided,
+)
+from json_generator.mock import AsyncMockBackend, MockBackend
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+
+class LegalPassage(BaseModel):
+    domain: str = ""
+    source: str = ""
+    content: str = ""
+
+
+class LegalPassagePair(OutputModel):
+    positive: LegalPassage
+    hard_negative: LegalPassage
+
+    @classmethod
+    def empty(cls) -> "LegalPassagePair":
+        return cls(positive=LegalPassage(), hard_negative=LegalPassage())
+
+
+def test_schema_guided_generator_gets_response_format():
+    formats = []
+
+    @schema_guided
+    def mock_guided_generator(texts: list[str], response_format: dict) -> list[str]:
+        formats.append(response_format)
+        return mock_good_generator(texts)
+
+    generate_batch([LegalDomain(domain="CIVIL")], LegalQueries, mock_guided_generator)
+
+    assert formats == [response_format(LegalQueries)]
+    assert formats[0]["json_schema"]["schema"]["required"] == ["aspects", "questions"]
+    assert response_format(LegalQueries) is formats[0]
+
+
+def assert_strict(schema):
+    """Checks the rules of strict mode on every object of a schema."""
+    if isinstance(schema, list):
+        for item in schema:
+            assert_strict(item)
+        return
+    if not isinstance(schema, dict):
+        return
+
+    assert "default" not in schema
+    if "properties" in schema:
+        assert schema["additionalProperties"] is False
+        assert sorted(schema["required"]) == sorted(schema["properties"])
+    for key, value in schema.items():
+        if key in ("properties", "$defs"):
+            for sub in value.values():
+                assert_strict(sub)
+        else:
+            assert_strict(value)
+
+
+def test_response_format_is_strict():
+    schema = response_format(LegalPassagePair)["json_schema"]["schema"]
+
+    assert_strict(schema)
+    assert schema["$defs"]["LegalPassage"]["required"] == [
+        "domain",
+        "source",
+        "content",
+    ]
+    # Every field being required still validates what the model writes
+    LegalPassagePair.model_validate_json(LegalPassagePair.empty().model_dump_json())
+
+
+def test_mock_backend_schema_guided_cuts_retries(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(100)]
+
+    unguided_stats = GenerationStats()
+    generate_and_save(
+        inputs=passages,
+        output_model=LegalPassagePair,
+        generator=MockBackend(LegalPassagePair, malformed_rate=0.3, seed=0),
+        output_file=str(tmp_path / "unguided.jsonl"),
+        stats=unguided_stats,
+    )
+
+    guided_stats = GenerationStats()
+    generate_and_save(
+        inputs=passages,
+        output_model=LegalPassagePair,
+        generator=MockBackend(LegalPassagePair, malformed_rate=0.3, schema_guided=True),
+        output_file=str(tmp_path / "guided.jsonl"),
+        stats=guided_stats,
+    )
+
+    assert unguided_stats.bad_responses > 0
+    assert unguided_stats.retry_rounds > 0
+    assert guided_stats.bad_responses == 0
+    assert guided_stats.retry_rounds == 0
+
+
+def test_async_mock_backend(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(8)]
+    backend = AsyncMockBackend(LegalPassagePair, schema_guided=True)
+
+    asyncio.run(
+        agenerate_and_save(
+            inputs=passages,
+            output_model=LegalPassagePair,
+            generator=backend,
+            output_file=str(tmp_path / "outputs.jsonl"),
+        )
+    )
+
+    assert backend.prompts == 8
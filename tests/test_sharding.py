@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from json_generator import generate_shard, merge_shards, run_sharded
+from json_generator.sharding import shard_of
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+PASSAGES = [LegalDomain(domain=f"DOMAIN {i}") for i in range(20)]
+
+
+def test_shard_of_is_stable():
+    assert [shard_of(passage, 3) for passage in PASSAGES] == [
+        shard_of(LegalDomain(domain=f"DOMAIN {i}"), 3) for i in range(20)
+    ]
+    assert set(shard_of(passage, 3) for passage in PASSAGES) == {0, 1, 2}
+
+
+def test_run_sharded(tmp_path):
+    output_file = tmp_path / "outputs.jsonl"
+
+    summary = run_sharded(
+        inputs=PASSAGES,
+        output_model=LegalQueries,
+        generator=mock_good_generator,
+        shard_count=3,
+        processes=2,
+        output_dir=str(tmp_path / "parts"),
+        output_file=str(output_file),
+        batch_size=2,
+    )
+
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert [record["input"]["domain"] for record in records] == [
+        f"DOMAIN {i}" for i in range(20)
+    ]
+    assert summary["records"] == 20
+    assert sum(summary["shards"]) == 20
+    assert summary["stats"]["inputs"] == 20
+    assert (tmp_path / "parts" / "summary.json").exists()
+
+
+def test_merge_shards_detects_missing_records(tmp_path):
+    for shard_index in range(2):
+        generate_shard(
+            inputs=PASSAGES[:10],
+            output_model=LegalQueries,
+            generator=mock_good_generator,
+            shard_index=shard_index,
+            shard_count=2,
+            output_dir=str(tmp_path),
+        )
+
+    with pytest.raises(ValueError, match="missing records"):
+        merge_shards(
+            inputs=PASSAGES,
+            shard_count=2,
+            output_dir=str(tmp_path),
+            output_file=str(tmp_path / "outputs.jsonl"),
+        )
@@ -0,0 +1,120 @@
+import gzip
+import json
+
+import pytest
+
+from json_generator import JsonlSink, ShardedJsonlSink, generate_and_save
+
+from test_generate import LegalDomain, LegalQueries, mock_good_generator
+
+
+def read_records(lines: list[str]) -> list[dict]:
+    return [json.loads(line) for line in lines]
+
+
+def test_generate_and_save_gzip(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(5)]
+    output_file = tmp_path / "outputs.jsonl.gz"
+
+    generate_and_save(
+        inputs=passages,
+        output_model=LegalQueries,
+        generator=mock_good_generator,
+        output_file=str(output_file),
+    )
+
+    with gzip.open(output_file, "rt") as f:
+        records = read_records(f.read().splitlines())
+    assert [record["input"] for record in records] == [
+        {"domain": f"DOMAIN {i}"} for i in range(5)
+    ]
+    assert records[0]["output"]["aspects"][0].startswith("Khen thưởng")
+
+
+def test_jsonl_sink_buffers_without_durability(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(2)]
+    outputs = [LegalQueries.empty()] * 2
+    output_file = tmp_path / "outputs.jsonl"
+
+    with JsonlSink(str(output_file), durability="none") as sink:
+        sink.write(passages, outputs)
+        assert output_file.read_text() == ""
+
+    assert len(output_file.read_text().splitlines()) == 2
+
+
+def test_sharded_sink_rotates(tmp_path):
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(6)]
+    pattern = str(tmp_path / "outputs-{shard:03d}.jsonl")
+
+    with ShardedJsonlSink(pattern, max_bytes=1) as sink:
+        generate_and_save(
+            inputs=passages,
+            output_model=LegalQueries,
+            generator=mock_good_generator,
+            batch_size=2,
+            output_file=sink,
+        )
+
+    assert [path.rsplit("/", 1)[1] for path in sink.paths] == [
+        "outputs-000.jsonl",
+        "outputs-001.jsonl",
+        "outputs-002.jsonl",
+    ]
+    records = read_records(
+        [line for path in sink.paths for line in open(path).read().splitlines()]
+    )
+    assert [record["input"]["domain"] for record in records] == [
+        f"DOMAIN {i}" for i in range(6)
+    ]
+
+
+def test_zstd_sink(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(3)]
+    output_file = tmp_path / "outputs.jsonl.zst"
+
+    with JsonlSink(str(output_file)) as sink:
+        sink.write(passages, [LegalQueries.empty()] * 3)
+
+    with zstandard.open(output_file, "rt") as f:
+        assert len(read_records(f.read().splitlines())) == 3
+
+
+def test_zstd_sink_fsyncs(tmp_path, monkeypatch):
+    zstandard = pytest.importorskip("zstandard")
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(3)]
+    output_file = tmp_path / "outputs.jsonl.zst"
+    synced_sizes = []
+    monkeypatch.setattr(
+        "json_generator.sinks.os.fsync",
+        lambda fd: synced_sizes.append(output_file.stat().st_size),
+    )
+
+    with JsonlSink(str(output_file), durability="fsync") as sink:
+        sink.write(passages, [LegalQueries.empty()] * 3)
+        assert len(synced_sizes) == 1
+        # Everything written so far had reached the file when it was synced
+        with open(output_file, "rb") as f:
+            data = zstandard.ZstdDecompressor().decompressobj().decompress(f.read())
+        assert len(read_records(data.decode().splitlines())) == 3
+        assert synced_sizes[0] > 0
+
+
+def test_parquet_sink(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    passages = [LegalDomain(domain=f"DOMAIN {i}") for i in range(5)]
+    output_file = tmp_path / "outputs.parquet"
+
+    generate_and_save(
+        inputs=passages,
+        output_model=LegalQueries,
+        generator=mock_good_generator,
+        output_file=str(output_file),
+    )
+
+    table = pq.read_table(output_file)
+    assert table.column_names == ["input", "output"]
+    assert [row["domain"] for row in table.column("input").to_pylist()] == [
+        f"DOMAIN {i}" for i in range(5)
+    ]
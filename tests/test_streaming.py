@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+import pytest
+
+from json_generator import (
+    GenerationStats,
+    agenerate_and_save,
+    generate_and_save,
+    generate_batch,
+    streaming,
+)
+from json_generator.mock import AsyncMockBackend
+from json_generator.streaming import IncrementalValidator
+
+from test_generate import LegalDomain, LegalQueries
+
+
+def validator() -> IncrementalValidator:
+    return IncrementalValidator(LegalQueries.model_json_schema(), max_preamble=40)
+
+
+def feed_chars(text: str) -> bool:
+    v = validator()
+    return all(v.feed(char) for char in text)
+
+
+def test_validator_accepts_valid_and_repairable_responses():
+    valid = json.dumps({"aspects": ["a", "b"], "questions": ["q?"]})
+    assert feed_chars(valid)
+    assert feed_chars("Here you go:\n```json\n" + valid + "\n```")
+    # An unescaped quote is for `repair_json` to fix, not a reason to abort
+    assert feed_chars('{"aspects": ["say "hi" now"], "questions": []}')
+
+
+def test_validator_aborts_clearly_invalid_responses():
+    assert not feed_chars("Sorry, here is a summary of the passage instead. " * 3)
+    assert not feed_chars('{"aspects": "not a list", "questions": []}')
+    assert not feed_chars('{"aspects": [1, 2], "questions": []}')
+
+    v = validator()
+    assert v.feed('{"aspects": [')
+    assert not v.feed('{"nested": true}')
+
+
+def test_streamed_generation_aborts_and_retries_early(tmp_path):
+    prose = "Sorry, I cannot answer in JSON. " * 40
+    valid = json.dumps({"aspects": ["a"], "questions": ["q?"]})
+    answered: set[str] = set()
+    chunks = []
+
+    @streaming
+    async def stream(prompt: str):
+        # Every prompt is answered with prose first, then with valid JSON
+        answer = valid if prompt in answered else prose
+        answered.add(prompt)
+        for start in range(0, len(answer), 4):
+            chunks.append(start)
+            yield answer[start : start + 4]
+
+    stats = GenerationStats()
+    output_file = tmp_path / "outputs.jsonl"
+    asyncio.run(
+        agenerate_and_save(
+            inputs=[LegalDomain(domain=f"domain {i}") for i in range(6)],
+            output_model=LegalQueries,
+            generator=stream,
+            batch_size=2,
+            output_file=str(output_file),
+            stats=stats,
+        )
+    )
+
+    with open(output_file) as f:
+        records = [json.loads(line) for line in f]
+    assert all(record["output"]["aspects"] == ["a"] for record in records)
+    assert stats.aborted_responses == 6
+    assert stats.bad_responses == 6
+    # Each prose answer was cut off after the preamble, not streamed in full
+    assert len(chunks) < 6 * (len(prose) // 4)
+
+
+def test_sync_generation_rejects_streaming_generators(tmp_path):
+    @streaming
+    async def stream(prompt: str):
+        yield json.dumps({"aspects": ["a"], "questions": ["q?"]})
+
+    inputs = [LegalDomain(domain="domain")]
+    with pytest.raises(TypeError, match="agenerate_and_save"):
+        generate_batch(inputs, LegalQueries, stream)
+    with pytest.raises(TypeError, match="agenerate_and_save"):
+        generate_and_save(
+            inputs=inputs,
+            output_model=LegalQueries,
+            generator=stream,
+            output_file=str(tmp_path / "outputs.jsonl"),
+        )
+    assert not (tmp_path / "outputs.jsonl").exists()
+
+
+def test_mock_backend_streams_chunks():
+    backend = AsyncMockBackend(LegalQueries, malformed_rate=0.0, chunk_size=5)
+    stream = backend.as_stream()
+
+    async def collect() -> str:
+        return "".join([chunk async for chunk in stream("prompt")])
+
+    assert json.loads(asyncio.run(collect())) == {
+        "aspects": ["text"],
+        "questions": ["text"],
+    }
+    assert backend.chunks > 1
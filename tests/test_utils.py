@@ -0,0 +1,43 @@
+import json
+
+from json_generator.utils import batched, escape_json_string, repair_json
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+
+def test_batched_is_lazy():
+    consumed: list[int] = []
+
+    def numbers():
+        for i in range(10):
+            consumed.append(i)
+            yield i
+
+    batches = batched(numbers(), 3)
+
+    assert next(batches) == [0, 1, 2]
+    assert consumed == [0, 1, 2]
+
+
+def test_escape_json_string():
+    assert (
+        escape_json_string('{"a": "He said "hi"", "b": ["x"]}')
+        == '{"a": "He said \\"hi\\"","b":["x"]}'
+    )
+
+
+def test_repair_json():
+    response = (
+        "Here is the JSON you asked for:\n```json\n"
+        '{"aspects": ["Điều 3 "Giải thích từ ngữ"", "line\nbreak",],\n'
+        ' "questions": [],}\n```'
+    )
+
+    assert json.loads(repair_json(response)) == {
+        "aspects": ['Điều 3 "Giải thích từ ngữ"', "line\nbreak"],
+        "questions": [],
+    }
+    assert repair_json("No JSON here") is None